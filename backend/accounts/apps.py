@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    # подключаем обработчики сигналов для сброса кэша ролей
+    def ready(self):
+        import accounts.signals
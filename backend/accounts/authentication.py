@@ -0,0 +1,99 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+
+# ограниченный по размеру LRU-кэш с временем жизни записей
+class LRUCache:
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# кэш ключ -> снимок токена с пользователем: в общем кэше Django (TOKEN_CACHE_BACKEND),
+# чтобы удаление токена или деактивация пользователя в одном процессе сразу действовали во всех;
+# без общего кэша - LRU в процессе (сброс виден только этому процессу, остальным - через TTL)
+class TokenCache:
+    key_prefix = 'auth-token:'
+
+    def __init__(self):
+        self.ttl = getattr(settings, 'TOKEN_CACHE_TTL', 60)
+        self.local = LRUCache(getattr(settings, 'TOKEN_CACHE_SIZE', 10000), self.ttl)
+        self.shared_alias = getattr(settings, 'TOKEN_CACHE_BACKEND', None)
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, key):
+        if self.shared is not None:
+            return self.shared.get(self.key_prefix + key)
+        return self.local.get(key)
+
+    def set(self, key, token):
+        if self.shared is not None:
+            self.shared.set(self.key_prefix + key, token, self.ttl)
+        else:
+            self.local.set(key, token)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None and keys:
+            self.shared.delete_many([self.key_prefix + key for key in keys])
+
+    def clear(self):
+        self.local.clear()
+
+
+token_cache = TokenCache()
+
+
+# TokenAuthentication без запроса к бд на каждый вызов API:
+# токен с пользователем берётся из кэша, в запрос отдаются их копии -
+# request.auth всегда объект Token, как у TokenAuthentication
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
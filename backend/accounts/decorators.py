@@ -1,6 +1,8 @@
 from django.http import JsonResponse
 from functools import wraps
 
+from .roles import has_role
+
 # проверка что пользователь состоит в группе с именем role_name
 def role_required(role_name):
     def decorator(view_func):
@@ -12,8 +14,8 @@ def role_required(role_name):
             if not user.is_authenticated:
                 return JsonResponse({'detail': 'Требуется аутентификация.'}, status=401)
             
-            # проверяем состоит ли пользователь в группе с нужной ролью
-            if not user.groups.filter(name=role_name).exists():
+            # проверяем состоит ли пользователь в группе с нужной ролью (роли кэшируются)
+            if not has_role(user, role_name):
                 return JsonResponse({'detail': f'Запрещено: требуется {role_name} роль.'}, status=403)
             return view_func(request, *args, **kwargs)
         return _wrapped
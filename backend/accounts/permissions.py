@@ -0,0 +1,14 @@
+from rest_framework.permissions import BasePermission
+
+from .roles import has_role
+
+
+# DRF-аналог role_required: роль берётся из атрибута view.required_role
+class HasRole(BasePermission):
+    message = 'Недостаточно прав для этой роли.'
+
+    def has_permission(self, request, view):
+        role_name = getattr(view, 'required_role', None)
+        if role_name is None:
+            return False
+        return bool(request.user and has_role(request.user, role_name))
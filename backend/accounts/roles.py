@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import caches
+
+# ключ версии ролей - увеличивается при переименовании или удалении группы
+ROLES_VERSION_KEY = 'roles:version'
+
+
+# роли и их версия - в общем кэше (CACHES['shared']): сброс в одном процессе
+# действует во всех, отозванная роль не продолжает работать до истечения записи
+def roles_cache():
+    return caches['shared']
+
+
+def _roles_version():
+    cache = roles_cache()
+    version = cache.get(ROLES_VERSION_KEY)
+    if version is None:
+        cache.add(ROLES_VERSION_KEY, 1, timeout=None)
+        version = cache.get(ROLES_VERSION_KEY, 1)
+    return version
+
+
+def _roles_key(user_pk):
+    return f'roles:{_roles_version()}:{user_pk}'
+
+
+# имена групп пользователя: один раз за запрос (на объекте пользователя)
+# и между запросами через кэш до изменения его групп
+def get_user_roles(user):
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_roles_cache', None)
+    if roles is not None:
+        return roles
+    cache = roles_cache()
+    key = _roles_key(user.pk)
+    roles = cache.get(key)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        cache.set(key, roles, getattr(settings, 'ROLE_CACHE_TIMEOUT', 300))
+    user._roles_cache = roles
+    return roles
+
+
+# есть ли у пользователя роль role_name
+def has_role(user, role_name):
+    return role_name in get_user_roles(user)
+
+
+# сброс кэша ролей для пользователей
+def invalidate_user_roles(user_pks):
+    roles_cache().delete_many([_roles_key(pk) for pk in user_pks])
+
+
+# сброс кэша ролей всех пользователей
+def invalidate_all_roles():
+    cache = roles_cache()
+    try:
+        cache.incr(ROLES_VERSION_KEY)
+    except ValueError:
+        cache.add(ROLES_VERSION_KEY, 2, timeout=None)
@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .roles import invalidate_all_roles, invalidate_user_roles
+
+# модель пользователя
+User = get_user_model()
+
+
+# изменение состава групп пользователя - с любой стороны связи
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        # user.groups.add/remove/clear
+        invalidate_user_roles([instance.pk])
+    elif action == 'pre_clear':
+        # group.user_set.clear - до очистки запоминаем участников группы
+        invalidate_user_roles(list(instance.user_set.values_list('pk', flat=True)))
+    elif pk_set:
+        # group.user_set.add/remove
+        invalidate_user_roles(pk_set)
+
+
+# переименование или удаление группы меняет роли всех её участников
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_all_roles()
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    invalidate_all_roles()
+
+
+# удаление токена - убираем его из кэша аутентификации
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+# изменение пользователя (в т.ч. деактивация) - снимки по его токенам устарели
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if not created:
+        token_cache.delete(*Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
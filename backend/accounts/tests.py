@@ -3,11 +3,23 @@ from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache, caches
 
 from rest_framework.test import APITestCase
 from rest_framework import status
 
 import os
+import shutil
+import tempfile
+
+from rest_framework.authtoken.models import Token
+
+from unittest import mock
+
+from accounts.authentication import CachedTokenAuthentication, LRUCache, token_cache
+from accounts.permissions import HasRole
+from accounts.roles import has_role
 
 # модель пользователя
 User = get_user_model()
@@ -112,3 +124,135 @@ class RequestCleaningTests(APITestCase):
         big = SimpleUploadedFile('big.bin', b'x' * (2*1024*1024 + 1), content_type='application/octet-stream')
         resp = self.client.post(url, {'file': big}, format='multipart')
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+# тесты кэширования ролей
+class RoleCacheTests(APITestCase):
+
+    def setUp(self):
+        # общий кэш - файловый во временном каталоге, как у нескольких процессов сервера
+        shared_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared_dir, ignore_errors=True)
+        override = self.settings(CACHES={
+            **settings.CACHES,
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': shared_dir},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.editors = Group.objects.create(name='editor')
+        self.user = User.objects.create_user(username='ed', password='pass123')
+        # декоратор роли смотрит на сессию, DRF - на свою аутентификацию
+        self.client.login(username='ed', password='pass123')
+        self.client.force_authenticate(self.user)
+
+    # роли читаются из бд один раз, дальше - из кэша
+    def test_roles_cached(self):
+        self.user.groups.add(self.editors)
+        self.assertTrue(has_role(User.objects.get(pk=self.user.pk), 'editor'))
+        fresh = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(has_role(fresh, 'editor'))
+            self.assertFalse(has_role(fresh, 'admin'))
+
+    # изменение групп с любой стороны связи сбрасывает кэш
+    def test_invalidation(self):
+        url = reverse('editor-only')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.editors.user_set.add(self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        self.user.groups.remove(self.editors)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.groups.add(self.editors)
+        self.editors.name = 'writer'
+        self.editors.save()
+        self.assertFalse(has_role(User.objects.get(pk=self.user.pk), 'editor'))
+
+    # сброс ролей виден другим процессам - роли хранятся в общем кэше
+    def test_invalidation_shared_between_processes(self):
+        self.user.groups.add(self.editors)
+        self.assertTrue(has_role(User.objects.get(pk=self.user.pk), 'editor'))
+        other_process = caches.create_connection('shared')
+        self.assertIsNotNone(other_process.get(f'roles:1:{self.user.pk}'))
+        self.user.groups.remove(self.editors)
+        self.assertIsNone(other_process.get(f'roles:1:{self.user.pk}'))
+
+    # DRF-разрешение по атрибуту required_role
+    def test_permission_class(self):
+        view = type('View', (), {'required_role': 'editor'})()
+        request = type('Request', (), {'user': User.objects.get(pk=self.user.pk)})()
+        self.assertFalse(HasRole().has_permission(request, view))
+        self.user.groups.add(self.editors)
+        request.user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(HasRole().has_permission(request, view))
+
+
+# тесты кэширования токенов
+class CachedTokenAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        # общий кэш - файловый во временном каталоге, как у нескольких процессов сервера
+        shared_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared_dir, ignore_errors=True)
+        override = self.settings(CACHES={
+            **settings.CACHES,
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': shared_dir},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        token_cache.clear()
+        self.user = User.objects.create_user(username='tok', password='pass123', email='tok@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('user-profile')
+
+    # после первого запроса токен и пользователь берутся из кэша без обращения к бд
+    def test_token_cached(self):
+        self.assertEqual(self.client.get(self.url).data['username'], 'tok')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], 'tok@example.com')
+
+    # request.auth - объект Token и при промахе, и при попадании в кэш
+    def test_auth_is_token_when_cached(self):
+        for _ in range(2):
+            user, auth = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+            self.assertIsInstance(auth, Token)
+            self.assertEqual(auth.key, self.token.key)
+            self.assertEqual(auth.created, self.token.created)
+            self.assertEqual(auth.user.pk, self.user.pk)
+            self.assertIs(auth.user, user)
+        # копии не разделяют состояние с кэшем
+        user.first_name = 'changed'
+        self.assertEqual(token_cache.get(self.token.key).user.first_name, '')
+
+    # удалённый токен сразу перестаёт работать
+    def test_token_delete_invalidates(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # деактивированный пользователь не проходит аутентификацию
+    def test_deactivation_invalidates(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # сброс в другом процессе (у него свой LRU, общий кэш тот же) действует и в этом
+    def test_invalidation_shared_between_processes(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with mock.patch.object(token_cache, 'local', LRUCache(10, 60)):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with mock.patch.object(token_cache, 'local', LRUCache(10, 60)):
+            self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
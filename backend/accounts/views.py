@@ -1,6 +1,6 @@
 from django.contrib.auth import get_user_model, authenticate, login, logout
 from django.contrib.auth.mixins import UserPassesTestMixin
-from rest_framework.renderers import JSONRenderer
+from core.renderers import FastJSONRenderer
 from rest_framework import generics, permissions, status
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
@@ -68,7 +68,7 @@ class LogoutView(APIView):
 
 # получение профиля текущего пользователя
 class ProfileView(APIView):
-    renderer_classes = [JSONRenderer]
+    renderer_classes = [FastJSONRenderer]
     permission_classes = [permissions.IsAuthenticated]
 
     @swagger_auto_schema(
@@ -0,0 +1,119 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.apps import apps
+from django.db import connections, router, transaction
+from django.db.models import BigIntegerField, Count, F, Sum
+from django.db.models.functions import Cast, Coalesce, Round
+
+# поля товара, от которых зависят агрегаты по категориям
+STAT_FIELDS = ('category', 'quantity', 'price')
+
+
+# цена в копейках
+def price_cents(price):
+    if price is None:
+        return 0
+    return int((Decimal(str(price)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+# приращения агрегатов по категориям, накопленные за операцию;
+# apply() записывает их одним upsert в той же транзакции, что и товары
+class CategoryDeltas:
+
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, category, quantity, price, sign=1):
+        self.rows.setdefault(category or '', [0, 0, 0])[0] += sign
+        self.add_quantity(category, sign * (quantity or 0), price)
+
+    # изменение только остатка товара (резервы, списания)
+    def add_quantity(self, category, quantity, price):
+        row = self.rows.setdefault(category or '', [0, 0, 0])
+        row[1] += quantity
+        row[2] += quantity * price_cents(price)
+
+    def add_product(self, product, sign=1):
+        self.add(product.category, product.quantity, product.price, sign)
+
+    # изменение сохранённого товара: прежний вклад (before - Product.loaded_values())
+    # вычитается, новый добавляется; update_fields - поля, реально записанные в бд
+    def change(self, before, product, update_fields=None):
+        if before is None or any(name not in before for name in STAT_FIELDS):
+            return
+        after = {
+            name: getattr(product, name) if update_fields is None or name in update_fields else before[name]
+            for name in STAT_FIELDS
+        }
+        if (before['category'] == after['category'] and before['quantity'] == after['quantity']
+                and price_cents(before['price']) == price_cents(after['price'])):
+            return
+        self.add(before['category'], before['quantity'], before['price'], -1)
+        self.add(after['category'], after['quantity'], after['price'])
+
+    def apply(self):
+        rows = sorted(
+            (category, *values) for category, values in self.rows.items() if any(values)
+        )
+        self.rows = {}
+        if not rows:
+            return 0
+        model = apps.get_model('core', 'CategoryStats')
+        connection = connections[router.db_for_write(model)]
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ('product_count', 'total_quantity', 'inventory_value_cents')
+        updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in columns)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (category, {", ".join(columns)}) VALUES (%s, %s, %s, %s) '
+                f'ON CONFLICT (category) DO UPDATE SET {updates}',
+                rows,
+            )
+        return len(rows)
+
+
+# фактические агрегаты по товарам: {category: (product_count, total_quantity, inventory_value_cents)}
+def compute_category_stats():
+    product = apps.get_model('core', 'Product')
+    value_cents = Cast(Round(F('price') * 100), BigIntegerField()) * F('quantity')
+    rows = (
+        product.objects.order_by().values('category')
+        .annotate(
+            product_count=Count('pk'),
+            total_quantity=Coalesce(Sum('quantity'), 0),
+            inventory_value_cents=Coalesce(Sum(value_cents, output_field=BigIntegerField()), 0),
+        )
+    )
+    return {
+        row['category']: (row['product_count'], row['total_quantity'], row['inventory_value_cents'])
+        for row in rows
+    }
+
+
+# сверка таблицы агрегатов с товарами и её перестроение;
+# возвращает расхождения [(category, сохранено, фактически)]
+def rebuild_category_stats(dry_run=False):
+    model = apps.get_model('core', 'CategoryStats')
+    empty = (0, 0, 0)
+    with transaction.atomic(using=router.db_for_write(model)):
+        actual = compute_category_stats()
+        stored = {
+            row[0]: tuple(row[1:])
+            for row in model.objects.values_list(
+                'category', 'product_count', 'total_quantity', 'inventory_value_cents'
+            )
+        }
+        drift = [
+            (category, stored.get(category, empty), actual.get(category, empty))
+            for category in sorted(set(actual) | set(stored))
+            if stored.get(category, empty) != actual.get(category, empty)
+        ]
+        if not dry_run:
+            model.objects.exclude(category__in=list(actual)).delete()
+            for category, _, values in drift:
+                if category not in actual:
+                    continue
+                model.objects.update_or_create(category=category, defaults=dict(
+                    zip(('product_count', 'total_quantity', 'inventory_value_cents'), values)
+                ))
+    return drift
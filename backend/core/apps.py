@@ -7,4 +7,7 @@ class CoreConfig(AppConfig):
     
      # метод вызывается при инициализации приложения
     def ready(self):
-        import core.signals
\ No newline at end of file
+        import core.signals
+        from django.db.models.signals import post_migrate
+        from core.search import ensure_search_indexes
+        post_migrate.connect(ensure_search_indexes, sender=self)
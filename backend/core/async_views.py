@@ -0,0 +1,122 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import Item, Product
+from .renderers import FastJSONRenderer
+from .serializers import ItemSerializer, ProductSerializer, requested_fields
+from .views import ItemListCreateAPIView, ProductViewSet, item_rows, product_rows
+
+# async-варианты самых нагруженных read-эндпоинтов на асинхронном ORM:
+# пока бд или медленный клиент отвечают, запрос не занимает поток
+
+renderer = FastJSONRenderer()
+
+
+# ответ в том же JSON, что отдаёт DRF
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), content_type='application/json', status=status)
+
+
+def not_found(model):
+    return json_response({"detail": f"No {model._meta.object_name} matches the given query."}, status=404)
+
+
+# фильтры, поиск и сортировка теми же бэкендами, что у sync-версии
+# (они только строят запрос и к бд не обращаются)
+def filter_queryset(drf_request, queryset, view_class):
+    view = view_class()
+    view.request = drf_request
+    for backend in view.filter_backends:
+        queryset = backend().filter_queryset(drf_request, queryset, view)
+    return queryset
+
+
+# ?fields= / ?exclude= как у sync-версии: из бд читаются только колонки полей ответа,
+# а сериализатор получает запрос в контексте и оставляет только выбранные поля
+def sparse_queryset(drf_request, queryset, encoder):
+    return encoder.only(queryset, requested_fields(drf_request.query_params, encoder.names))
+
+
+# постраничная выдача в формате PageNumberPagination через acount()/aiterator()
+async def paginated_response(request, queryset, serializer_class, context):
+    page_size = api_settings.PAGE_SIZE
+    try:
+        page = int(request.GET.get('page', 1))
+        if page < 1:
+            raise ValueError
+    except ValueError:
+        return json_response({"detail": "Invalid page."}, status=404)
+
+    count = await queryset.acount()
+    offset = (page - 1) * page_size
+    if page > 1 and offset >= count:
+        return json_response({"detail": "Invalid page."}, status=404)
+
+    rows = [obj async for obj in queryset[offset:offset + page_size].aiterator()]
+
+    url = request.build_absolute_uri()
+    next_link = replace_query_param(url, 'page', page + 1) if offset + page_size < count else None
+    previous_link = None
+    if page == 2:
+        previous_link = remove_query_param(url, 'page')
+    elif page > 2:
+        previous_link = replace_query_param(url, 'page', page - 1)
+
+    return json_response({
+        'count': count,
+        'next': next_link,
+        'previous': previous_link,
+        'results': serializer_class(rows, many=True, context=context).data,
+    })
+
+
+async def list_response(request, queryset, view_class, serializer_class, encoder):
+    drf_request = Request(request)
+    try:
+        queryset = sparse_queryset(drf_request, filter_queryset(drf_request, queryset, view_class), encoder)
+    except APIException as exc:
+        return json_response(exc.detail, status=exc.status_code)
+    return await paginated_response(request, queryset, serializer_class, {'request': drf_request})
+
+
+async def detail_response(request, model, serializer_class, encoder, pk):
+    drf_request = Request(request)
+    try:
+        queryset = sparse_queryset(drf_request, model.objects.all(), encoder)
+    except APIException as exc:
+        return json_response(exc.detail, status=exc.status_code)
+    try:
+        obj = await queryset.aget(pk=pk)
+    except model.DoesNotExist:
+        return not_found(model)
+    return json_response(serializer_class(obj, context={'request': drf_request}).data)
+
+
+@require_GET
+async def ping(request):
+    return json_response({"status": "ok", "message": "pong"})
+
+
+@require_GET
+async def item_list(request):
+    queryset = Item.objects.all().order_by('-created_at')
+    return await list_response(request, queryset, ItemListCreateAPIView, ItemSerializer, item_rows)
+
+
+@require_GET
+async def item_detail(request, pk):
+    return await detail_response(request, Item, ItemSerializer, item_rows, pk)
+
+
+@require_GET
+async def product_list(request):
+    return await list_response(request, Product.objects.all(), ProductViewSet, ProductSerializer, product_rows)
+
+
+@require_GET
+async def product_detail(request, pk):
+    return await detail_response(request, Product, ProductSerializer, product_rows, pk)
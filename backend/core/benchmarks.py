@@ -0,0 +1,30 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+# временная тестовая бд для бенчмарков - рабочая бд не трогается
+@contextmanager
+def benchmark_database(aliases=None):
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases(aliases=aliases)
+    # логи запросов искажают замеры
+    logging.disable(logging.INFO)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+# время выполнения в миллисекундах
+@contextmanager
+def timer(result, key):
+    start = time.perf_counter()
+    yield
+    result[key] = (time.perf_counter() - start) * 1000
@@ -0,0 +1,172 @@
+import threading
+import time
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# имя группы WebSocket, в которую рассылается количество товаров
+PRODUCTS_GROUP = "products"
+
+
+# рассыльщик количества товаров: склеивает частые изменения в одну отправку за окно времени.
+# Изменения этого процесса (+1/-1) сразу применяются к известному количеству - снимку
+# для новых подключений без запроса к бд. Рассылается же количество, перечитанное из бд
+# одним COUNT(*) на окно: группа общая для всех процессов (канальный слой на sqlite),
+# и счётчик одного процесса не учитывал бы изменения других
+class ProductCountBroadcaster:
+
+    def __init__(self, window=None):
+        self._window = window
+        self._lock = threading.Lock()
+        self._count = None
+        self._loaded_at = 0.0
+        self._last_sent = 0.0
+        self._timer = None
+        # метрики
+        self.sent = 0
+        self.suppressed = 0
+
+    # окно склейки в секундах (берётся из настроек, если не задано явно)
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, 'PRODUCT_COUNT_BROADCAST_WINDOW', 1.0)
+
+    # последнее прочитанное количество товаров (None - ещё не загружено из бд)
+    @property
+    def count(self):
+        return self._count
+
+    # время жизни снимка количества для новых подключений (сек): без изменений
+    # в этом процессе снимок всё равно периодически перечитывается из бд
+    @property
+    def snapshot_ttl(self):
+        return getattr(settings, 'WS_COUNT_SNAPSHOT_TTL', 5.0)
+
+    # известное и не устаревшее количество (None - нужен snapshot)
+    def cached_count(self):
+        if self._count is None or time.monotonic() - self._loaded_at > self.snapshot_ttl:
+            return None
+        return self._count
+
+    # количество для новых подключений: под блокировкой, так что одновременные
+    # вызовы делают один запрос к бд, остальные получают готовое значение
+    def snapshot(self):
+        with self._lock:
+            if self._count is None or time.monotonic() - self._loaded_at > self.snapshot_ttl:
+                self._load()
+            return self._count
+
+    def _load(self):
+        from .models import Product
+        self._count = Product.objects.count()
+        self._loaded_at = time.monotonic()
+
+    # изменение количества на delta после коммита транзакции
+    def change(self, delta):
+        transaction.on_commit(lambda: self.apply_delta(delta))
+
+    # товар создан - +1
+    def product_created(self):
+        self.change(1)
+
+    # товар удалён - -1
+    def product_deleted(self):
+        self.change(-1)
+
+    # изменение закоммичено - снимок сдвигается на delta до следующего чтения из бд,
+    # отправка сразу или в конце окна
+    def apply_delta(self, delta):
+        with self._lock:
+            if self._count is not None:
+                self._count += delta
+            send_now = self._schedule()
+        if send_now:
+            self._send_current()
+
+    # решаем, отправлять ли сразу или отложить до конца окна
+    def _schedule(self):
+        if self._timer is not None:
+            # отправка уже запланирована - изменение попадёт в неё
+            self.suppressed += 1
+            return False
+        elapsed = time.monotonic() - self._last_sent
+        window = self.window
+        if elapsed >= window:
+            self._last_sent = time.monotonic()
+            return True
+        self._timer = threading.Timer(window - elapsed, self._flush)
+        self._timer.daemon = True
+        self._timer.start()
+        return False
+
+    # срабатывание таймера - отправляем количество на этот момент;
+    # соединение с бд потока таймера закрывается
+    def _flush(self):
+        with self._lock:
+            self._timer = None
+            self._last_sent = time.monotonic()
+        try:
+            self._send_current()
+        finally:
+            connection.close()
+
+    # количество из бд (одно на окно склейки) - оно же снимок для новых подключений;
+    # если бд недоступна, отправка пропускается - следующее изменение отправит актуальное
+    def _send_current(self):
+        with self._lock:
+            try:
+                self._load()
+            except DatabaseError as exc:
+                logger.warning("Не удалось прочитать количество товаров: %s", exc)
+                return
+            count = self._count
+        self._send(count)
+
+    # отправка значения в группу через канальный слой
+    def _send(self, count):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(channel_layer.group_send)(
+                PRODUCTS_GROUP,
+                {
+                    "type": "product_count_update",
+                    "count": count,
+                }
+            )
+        except Exception:
+            logger.exception("Не удалось разослать количество товаров")
+            return
+        self.sent += 1
+
+    # метрики рассыльщика
+    def stats(self):
+        return {
+            "count": self._count,
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+        }
+
+    # сброс состояния (используется в тестах)
+    def reset(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            self._count = None
+            self._loaded_at = 0.0
+            self._last_sent = 0.0
+            self.sent = 0
+            self.suppressed = 0
+
+
+# общий экземпляр на процесс
+broadcaster = ProductCountBroadcaster()
@@ -0,0 +1,126 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+
+from .routers import primary_pinned
+
+# ключ в кэше, где хранится версия каталога
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+# версия хранится в общем кэше (CACHES['shared']): запись в одном процессе
+# сразу делает неактуальными ответы, закэшированные во всех остальных
+def version_cache():
+    return caches['shared']
+
+
+# текущая версия каталога - часть ключа всех закэшированных ответов
+def get_catalog_version():
+    shared = version_cache()
+    version = shared.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # начальное значение от времени, чтобы после вытеснения ключа не совпасть со старыми записями
+        shared.add(CATALOG_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = shared.get(CATALOG_VERSION_KEY)
+    return version
+
+
+# увеличение версии каталога - все закэшированные ответы становятся неактуальными
+def bump_catalog_version():
+    shared = version_cache()
+    try:
+        return shared.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+        return shared.incr(CATALOG_VERSION_KEY)
+
+
+# инвалидация при изменении каталога: сразу и ещё раз после коммита,
+# чтобы не закэшировать данные, прочитанные до завершения транзакции
+def invalidate_catalog():
+    bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
+
+
+# нормализованная строка запроса - порядок параметров не влияет на ключ
+def normalize_query(query_params):
+    items = []
+    for key in sorted(query_params.keys()):
+        for value in sorted(query_params.getlist(key)):
+            items.append((key, value))
+    return urlencode(items)
+
+
+# кэширование готовых JSON-ответов списка и детального просмотра каталога
+# с поддержкой ETag / If-None-Match
+class CatalogCacheMixin:
+    cache_timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    # можно ли кэшировать ответ на этот запрос
+    def is_cacheable(self, request):
+        renderer = getattr(request, 'accepted_renderer', None)
+        return request.method == 'GET' and renderer is not None and renderer.format == 'json'
+
+    # ключ кэша и ETag для запроса
+    def catalog_cache_key(self, request):
+        version = get_catalog_version()
+        raw = '|'.join([
+            self.action or '',
+            str(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, '')),
+            normalize_query(request.query_params),
+            request.accepted_media_type or '',
+        ])
+        digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return f'catalog:{version}:{digest}', f'"{version}-{digest[:16]}"'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+
+        key, etag = self.catalog_cache_key(request)
+
+        # клиент уже имеет актуальную версию - отдаём 304 без обращения к кэшу и бд
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')]:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=request.accepted_media_type)
+            response['ETag'] = etag
+            response['X-Cache'] = 'HIT'
+            return response
+
+        # ответ, который попадёт в кэш, строится по основной бд: реплика может отставать
+        # от версии каталога, и устаревшие данные сохранились бы под новым ключом и ETag
+        token = primary_pinned.set(True)
+        try:
+            response = handler(request, *args, **kwargs)
+        finally:
+            primary_pinned.reset(token)
+        response['ETag'] = etag
+        response['X-Cache'] = 'MISS'
+        self._catalog_cache_key = key
+        return response
+
+    # после рендеринга сохраняем готовые байты ответа в кэш
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_catalog_cache_key', None)
+        if key is not None and response.status_code == 200:
+            response.render()
+            cache.set(key, response.content, self.cache_timeout)
+        return response
@@ -0,0 +1,379 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+# сообщения и участники групп в общем файле sqlite - видны всем процессам на хосте
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_message (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target TEXT NOT NULL,
+    channel TEXT,
+    grp TEXT,
+    body TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_message_target ON channel_message (target, id);
+CREATE INDEX IF NOT EXISTS channel_message_expires ON channel_message (expires);
+CREATE TABLE IF NOT EXISTS channel_group (
+    grp TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    target TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (grp, channel)
+);
+CREATE INDEX IF NOT EXISTS channel_group_target ON channel_group (target, grp);
+CREATE TABLE IF NOT EXISTS channel_process (
+    target TEXT PRIMARY KEY,
+    seen REAL NOT NULL
+);
+"""
+
+# как часто удалять просроченные сообщения и участников групп (в опросах)
+PURGE_EVERY = 200
+
+
+# сообщения - словари из json-типов; bytes (bytes_data у WebSocket) кодируются в base64
+def _default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'{type(value).__name__} нельзя передать через канальный слой')
+
+
+def _object_hook(value):
+    if len(value) == 1 and '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def encode_message(message):
+    return json.dumps(message, default=_default, separators=(',', ':'))
+
+
+def decode_message(body):
+    return json.loads(body, object_hook=_object_hook)
+
+
+# канальный слой без внешних сервисов: общий файл sqlite в режиме WAL
+#
+# - сообщение адресуется "цели": для каналов процесса (specific.<процесс>!...) это
+#   префикс процесса, для обычных каналов - сам канал;
+# - group_send пишет одну строку на процесс-получатель, а не на каждый канал -
+#   процесс сам раздаёт её своим участникам группы;
+# - каждый процесс одним запросом забирает все свои сообщения за такт опроса;
+# - записи от одновременных вызовов склеиваются в одну транзакцию;
+# - процесс отмечается в channel_process, пока опрашивает файл; участники групп
+#   из процессов без отметки дольше heartbeat_timeout удаляются при очистке,
+#   не дожидаясь group_expiry.
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=None, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 poll_interval=0.005, max_poll_interval=0.05, busy_timeout=5000, heartbeat_timeout=60):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        if path is None:
+            from django.conf import settings
+            path = os.path.join(settings.BASE_DIR, 'channels.sqlite3')
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.busy_timeout = busy_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.client_prefix = uuid.uuid4().hex[:12]
+
+        # все обращения к файлу - из одного потока со своим соединением
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-channel-layer')
+        self._connection = None
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._polls = 0
+        self._heartbeat = 0
+
+        # очереди каналов этого процесса и задача опроса (привязаны к event loop)
+        self._loop = None
+        self._queues = {}
+        self._poller = None
+
+        # метрики
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.batches = 0
+
+    # соединение создаётся в потоке исполнителя
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # Запись
+
+    # операция ставится в общую очередь; первая же запись в потоке исполнителя
+    # выполняет все накопленные операции одной транзакцией
+    async def _write(self, op, *args):
+        item = [op, args, None]
+        with self._pending_lock:
+            self._pending.append(item)
+        await self._run(self._write_pending)
+        if item[2] is not None:
+            raise item[2]
+
+    def _write_pending(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        connection = self._connect()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            members = {}
+            for item in batch:
+                op, args = item[0], item[1]
+                try:
+                    getattr(self, '_op_' + op)(connection, now, members, *args)
+                except ChannelFull as e:
+                    item[2] = e
+            connection.execute('COMMIT')
+        except BaseException as e:
+            connection.execute('ROLLBACK')
+            for item in batch:
+                item[2] = e
+            return
+        self.batches += 1
+
+    def _op_send(self, connection, now, members, channel, body):
+        target = self.non_local_name(channel)
+        queued = connection.execute(
+            'SELECT COUNT(*) FROM channel_message WHERE target = ? AND channel = ? AND expires > ?',
+            (target, channel, now)
+        ).fetchone()[0]
+        if queued >= self.get_capacity(channel):
+            raise ChannelFull(channel)
+        connection.execute(
+            'INSERT INTO channel_message (target, channel, grp, body, expires) VALUES (?, ?, NULL, ?, ?)',
+            (target, channel, body, now + self.expiry)
+        )
+        self.sent += 1
+
+    # участники группы читаются один раз на пачку
+    def _op_group_send(self, connection, now, members, group, body):
+        if group not in members:
+            members[group] = connection.execute(
+                'SELECT target, channel FROM channel_group WHERE grp = ? AND expires > ?', (group, now)
+            ).fetchall()
+        rows = set()
+        for target, channel in members[group]:
+            # каналы процесса получают одну строку на процесс, обычные - по строке на канал
+            rows.add((target, None, group) if target.endswith('!') else (target, channel, None))
+        connection.executemany(
+            'INSERT INTO channel_message (target, channel, grp, body, expires) VALUES (?, ?, ?, ?, ?)',
+            [(target, channel, grp, body, now + self.expiry) for target, channel, grp in rows]
+        )
+        self.sent += len(rows)
+
+    def _op_group_add(self, connection, now, members, group, channel):
+        target = self.non_local_name(channel)
+        connection.execute(
+            'INSERT OR REPLACE INTO channel_group (grp, channel, target, expires) VALUES (?, ?, ?, ?)',
+            (group, channel, target, now + self.group_expiry)
+        )
+        # канал этого процесса - отметка в той же транзакции, иначе очистка в другом
+        # процессе может удалить участника до первого опроса
+        if target.endswith(self.client_prefix + '!'):
+            connection.execute('INSERT OR REPLACE INTO channel_process (target, seen) VALUES (?, ?)',
+                               (target, now))
+        members.pop(group, None)
+
+    def _op_group_discard(self, connection, now, members, group, channel):
+        connection.execute('DELETE FROM channel_group WHERE grp = ? AND channel = ?', (group, channel))
+        members.pop(group, None)
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        await self._write('send', channel, encode_message(message))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_group_name(group)
+        await self._write('group_send', group, encode_message(message))
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._write('group_add', group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._write('group_discard', group, channel)
+
+    # Чтение
+
+    async def new_channel(self, prefix='specific'):
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f'{prefix}.{self.client_prefix}!{suffix}'
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        self._bind_loop()
+        queue = self._queue(channel)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+        try:
+            return await queue.get()
+        except asyncio.CancelledError:
+            # клиент отключился - очередь больше не нужна
+            if self._queues.get(channel) is queue:
+                del self._queues[channel]
+            raise
+
+    # очереди asyncio привязаны к event loop - при смене loop начинаем заново
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queues = {}
+            self._poller = None
+
+    def _queue(self, channel):
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue(self.get_capacity(channel))
+        return queue
+
+    # опрос: пока есть ожидающие каналы, забираем их сообщения; без сообщений
+    # интервал растёт до max_poll_interval, с сообщениями - сбрасывается
+    async def _poll(self):
+        interval = self.poll_interval
+        while self._queues:
+            targets = sorted({self.non_local_name(channel) for channel in self._queues})
+            messages = await self._run(self._fetch, targets)
+            for channel, body, from_group in messages:
+                self._deliver(channel, body, from_group)
+            if messages:
+                interval = self.poll_interval
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, self.max_poll_interval)
+
+    # сообщения доходят только до каналов, которые сейчас слушают в этом процессе:
+    # очередь для канала без receive() никто бы не разобрал
+    def _deliver(self, channel, body, from_group):
+        if channel not in self._queues:
+            if not from_group:
+                self.dropped += 1
+            return
+        try:
+            self._queue(channel).put_nowait(decode_message(body))
+        except asyncio.QueueFull:
+            self.dropped += 1
+        else:
+            self.delivered += 1
+
+    # все сообщения для целей этого процесса одной транзакцией; строки групп
+    # раскрываются в каналы процесса, состоящие в группе
+    def _fetch(self, targets):
+        connection = self._connect()
+        now = time.time()
+        self._polls += 1
+        if self._polls % PURGE_EVERY == 0:
+            self._purge(connection, now)
+        if now - self._heartbeat >= self.heartbeat_timeout / 4:
+            connection.executemany('INSERT OR REPLACE INTO channel_process (target, seen) VALUES (?, ?)',
+                                   [(target, now) for target in targets if target.endswith('!')])
+            self._heartbeat = now
+
+        marks = ', '.join('?' * len(targets))
+        # быстрая проверка без блокировки записи (в WAL чтение не мешает писателям)
+        if connection.execute(f'SELECT 1 FROM channel_message WHERE target IN ({marks}) LIMIT 1',
+                              targets).fetchone() is None:
+            return []
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            rows = connection.execute(
+                f'DELETE FROM channel_message WHERE target IN ({marks}) '
+                f'RETURNING id, target, channel, grp, body, expires',
+                targets
+            ).fetchall()
+            members = {}
+            for _, target, _, group, _, _ in rows:
+                if group is not None and (group, target) not in members:
+                    members[group, target] = [channel for (channel,) in connection.execute(
+                        'SELECT channel FROM channel_group WHERE grp = ? AND target = ? AND expires > ?',
+                        (group, target, now)
+                    )]
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        messages = []
+        for _, target, channel, group, body, expires in sorted(rows):
+            if expires < now:
+                continue
+            if group is None:
+                messages.append((channel, body, False))
+            else:
+                messages.extend((member, body, True) for member in members[group, target])
+        return messages
+
+    # просроченное и участники групп из процессов, которые давно не опрашивали файл
+    def _purge(self, connection, now):
+        alive = now - self.heartbeat_timeout
+        connection.execute('DELETE FROM channel_message WHERE expires < ?', (now,))
+        connection.execute('DELETE FROM channel_group WHERE expires < ?', (now,))
+        connection.execute(
+            "DELETE FROM channel_group WHERE target LIKE '%!' "
+            "AND target NOT IN (SELECT target FROM channel_process WHERE seen >= ?)",
+            (alive,)
+        )
+        connection.execute('DELETE FROM channel_process WHERE seen < ?', (alive,))
+
+    # Служебное
+
+    async def flush(self):
+        await self._run(self._flush)
+        self._queues = {}
+
+    def _flush(self):
+        connection = self._connect()
+        connection.execute('DELETE FROM channel_message')
+        connection.execute('DELETE FROM channel_group')
+        connection.execute('DELETE FROM channel_process')
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    # метрики слоя
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'batches': self.batches,
+        }
@@ -1,30 +1,40 @@
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
-from .models import Product
+from collections import deque
+from urllib.parse import parse_qs
+
+from django.conf import settings
 from asgiref.sync import sync_to_async
+from .broadcast import PRODUCTS_GROUP, broadcaster
+from .feed import FEED_GROUP, feed
+from .websocket import ManagedWebsocketConsumer
 
 # WebSocket consumer - класс для отправки количества товаров в реальном времени
-class ProductCountConsumer(AsyncWebsocketConsumer):
+# кадры с количеством заменяют друг друга в очереди: медленный клиент получит последнее значение
+class ProductCountConsumer(ManagedWebsocketConsumer):
 
     # метод вызывается при новом подключении по WebSocket
     async def connect(self):
-        await self.channel_layer.group_add("Продукты", self.channel_name)
+        await self.channel_layer.group_add(PRODUCTS_GROUP, self.channel_name)
         await self.accept()
         await self.send_count()
 
     # метод вызывается при отключении клиента
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard("Продукты", self.channel_name)
+        await self.channel_layer.group_discard(PRODUCTS_GROUP, self.channel_name)
 
     # метод для отправки клиенту актуального количества товаров
     async def send_count(self):
         count = await self.get_count()
-        await self.send(text_data=json.dumps({"Количество": count}))
+        self.queue_frame(json.dumps({"Количество": count}), key='count')
 
-    # асинхронный статический метод для получения количества товаров в базе
+    # количество из общего снимка процесса: при волне переподключений
+    # в бд уходит один COUNT, а не по запросу на соединение
     @staticmethod
     async def get_count():
-        return await sync_to_async(Product.objects.count)()
+        count = broadcaster.cached_count()
+        if count is None:
+            count = await sync_to_async(broadcaster.snapshot)()
+        return count
 
     # метод вызывается, когда клиент присылает данные по WebSocket
     async def receive(self, text_data):
@@ -33,4 +43,98 @@ class ProductCountConsumer(AsyncWebsocketConsumer):
     # метод вызывается при получении сообщения типа "product_count_update" из группы
     async def product_count_update(self, event):
         count = event['count']
-        await self.send(text_data=json.dumps({"Количество": count}))
+        self.queue_frame(json.dumps({"Количество": count}), key='count')
+
+
+# WebSocket consumer ленты изменений товаров: клиент подписывается на категории
+# и/или id товаров и получает только подходящие события, по одному кадру на такт
+#
+# подписка - в строке запроса (?categories=a,b&ids=1,2 или ?all=1) или сообщением
+# {"action": "subscribe" | "unsubscribe", "categories": [...], "ids": [...], "all": true}
+#
+# очередь на отправку ограничена: если клиент не успевает читать, старые события
+# вытесняются, а счётчик dropped в кадре показывает, сколько их потеряно
+class ProductFeedConsumer(ManagedWebsocketConsumer):
+
+    async def connect(self):
+        self.categories, self.ids, self.everything = set(), set(), False
+        self.buffer_size = getattr(settings, 'PRODUCT_FEED_CLIENT_BUFFER', 500)
+        self.outbox = deque()
+        self.dropped = 0
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            self.subscribe({
+                'categories': ','.join(query.get('categories', [])).split(','),
+                'ids': ','.join(query.get('ids', [])).split(','),
+                'all': query.get('all', [''])[0] in ('1', 'true'),
+            })
+        except ValueError:
+            await self.close(code=4400)
+            return
+
+        await self.channel_layer.group_add(FEED_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(FEED_GROUP, self.channel_name)
+
+    # изменение подписки
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '')
+            action = message.get('action')
+            if action == 'subscribe':
+                self.subscribe(message)
+            elif action == 'unsubscribe':
+                self.unsubscribe(message)
+            else:
+                raise ValueError(f'Неизвестное действие: {action}')
+        except (ValueError, AttributeError, TypeError) as e:
+            self.queue_frame(json.dumps({'error': str(e)}, ensure_ascii=False))
+            return
+        self.queue_frame(json.dumps({'subscribed': {
+            'categories': sorted(self.categories),
+            'ids': sorted(self.ids),
+            'all': self.everything,
+        }}, ensure_ascii=False))
+
+    def subscribe(self, message):
+        self.categories.update(category for category in message.get('categories') or [] if category)
+        self.ids.update(int(pk) for pk in message.get('ids') or [] if pk != '')
+        self.everything = self.everything or bool(message.get('all'))
+
+    def unsubscribe(self, message):
+        self.categories.difference_update(message.get('categories') or [])
+        self.ids.difference_update(int(pk) for pk in message.get('ids') or [])
+        if message.get('all'):
+            self.everything = False
+
+    def wants(self, event):
+        if self.everything or event['id'] in self.ids:
+            return True
+        return event.get('category') in self.categories or event.get('previous_category') in self.categories
+
+    # сообщение типа "product.feed" из группы - подходящие события в очередь клиента
+    async def product_feed(self, event):
+        for item in event['events']:
+            if not self.wants(item):
+                continue
+            if len(self.outbox) >= self.buffer_size:
+                self.outbox.popleft()
+                self.dropped += 1
+                feed.client_dropped += 1
+            self.outbox.append(item)
+        if self.outbox:
+            self.wakeup.set()
+
+    # отправка: всё накопленное - одним кадром; пока клиент медленно читает,
+    # новые события копятся в ограниченной очереди
+    async def drain(self):
+        await super().drain()
+        if self.outbox:
+            events = list(self.outbox)
+            self.outbox.clear()
+            await self.send(text_data=json.dumps(
+                {'events': events, 'dropped': self.dropped}, ensure_ascii=False
+            ))
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+import zlib
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+# поля товара в выгрузке (в порядке колонок CSV)
+EXPORT_FIELDS = ['id', 'sku', 'name', 'description', 'price', 'category', 'quantity']
+
+# размер порции строк из бд и примерный размер отдаваемого куска в байтах
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+EXPORT_BUFFER_BYTES = 64 * 1024
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+# строки выгрузки из бд без создания объектов модели
+def export_rows(queryset, fields=EXPORT_FIELDS):
+    return queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+# decimal как строка - так же, как в ответах DRF
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'Тип {type(value).__name__} не сериализуется в JSON')
+
+
+def ndjson_lines(rows, fields=EXPORT_FIELDS):
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_json_default).encode
+    for row in rows:
+        yield dumps(dict(zip(fields, row))) + '\n'
+
+
+# буфер для csv.writer, который просто возвращает записанную строку
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields=EXPORT_FIELDS):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+# склейка мелких строк в куски примерно по EXPORT_BUFFER_BYTES
+def buffered(lines, size=EXPORT_BUFFER_BYTES):
+    buffer = io.StringIO()
+    for line in lines:
+        buffer.write(line)
+        if buffer.tell() >= size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer = io.StringIO()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# сжатие потока gzip на лету
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# принимает ли клиент gzip: разбор Accept-Encoding с q-значениями (gzip;q=0 - отказ)
+def accepts_gzip(header):
+    weights = {}
+    for part in header.split(','):
+        coding, *params = part.split(';')
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding.strip():
+            weights[coding.strip().lower()] = weight
+    return weights.get('gzip', weights.get('*', 0.0)) > 0
+
+
+# синхронный поток кусков как асинхронный итератор: под ASGI Django читает синхронный итератор
+# StreamingHttpResponse целиком в список до отправки первого байта, а так куски уходят по одному;
+# чтение из бд идёт в потоке для синхронного кода (thread_sensitive) - там же, где соединение
+async def async_chunks(chunks):
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+# потоковый ответ с выгрузкой: память не растёт с размером каталога
+# (asynchronous - запрос пришёл через ASGI, поток отдаётся асинхронным итератором)
+def export_response(queryset, export_format, use_gzip=False, filename='products', asynchronous=False):
+    lines = ndjson_lines if export_format == 'ndjson' else csv_lines
+    stream = buffered(lines(export_rows(queryset)))
+    if use_gzip:
+        stream = gzipped(stream)
+    if asynchronous:
+        stream = async_chunks(stream)
+
+    response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    return response
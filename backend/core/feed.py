@@ -0,0 +1,164 @@
+import threading
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# группа WebSocket ленты изменений товаров
+FEED_GROUP = "product-feed"
+
+# сериализатор товара для значений полей в событиях (создаётся при первом обращении)
+_serializer = None
+
+
+def _product_serializer():
+    global _serializer
+    if _serializer is None:
+        from .serializers import ProductSerializer
+        _serializer = ProductSerializer()
+    return _serializer
+
+
+def _represent(name, value):
+    field = _product_serializer().fields.get(name)
+    if field is None or value is None:
+        return value
+    return field.to_representation(value)
+
+
+# События: created - все поля, updated - только изменённые, deleted - только id.
+# category есть всегда (по ней фильтруют клиенты), при смене категории - и прежняя
+
+def created_event(product):
+    product.remember_loaded_values()
+    return {
+        "op": "created",
+        "id": product.pk,
+        "category": product.category,
+        "fields": _product_serializer().to_representation(product),
+    }
+
+
+# None - если поля не изменились; update_fields - поля, записанные save(update_fields=...)
+def updated_event(product, update_fields=None):
+    before = product.loaded_values()
+    fields = {}
+    for field in product._meta.concrete_fields:
+        name = field.attname
+        if field.primary_key or (before is not None and name not in before):
+            continue
+        if update_fields is not None and field.name not in update_fields:
+            continue
+        value = getattr(product, name)
+        if before is None or before[name] != value:
+            fields[field.name] = _represent(field.name, value)
+    if not fields:
+        return None
+    event = {"op": "updated", "id": product.pk, "category": product.category, "fields": fields}
+    if before is not None and 'category' in fields and before.get('category') != product.category:
+        event["previous_category"] = before.get('category')
+    product.remember_loaded_values(update_fields)
+    return event
+
+
+# изменение остатка без загрузки товара (резервы): новое значение quantity
+def stock_event(pk, category, quantity):
+    return {"op": "updated", "id": pk, "category": category, "fields": {"quantity": quantity}}
+
+
+def deleted_event(pk, category):
+    return {"op": "deleted", "id": pk, "category": category}
+
+
+# склейка событий одного товара внутри такта: поля обновлений объединяются,
+# удаление заменяет всё предыдущее
+def merge_event(previous, event):
+    if event["op"] == "deleted" or previous["op"] == "deleted":
+        return event
+    merged = dict(previous, category=event["category"], fields={**previous["fields"], **event["fields"]})
+    if "previous_category" in event and "previous_category" not in previous:
+        merged["previous_category"] = event["previous_category"]
+    return merged
+
+
+# публикатор ленты: события после коммита копятся и раз в такт
+# уходят одним сообщением в группу
+class ProductFeed:
+
+    def __init__(self, tick=None):
+        self._tick = tick
+        self._lock = threading.Lock()
+        self._events = {}
+        self._timer = None
+        # метрики
+        self.published = 0
+        self.messages = 0
+        self.client_dropped = 0
+
+    @property
+    def tick(self):
+        if self._tick is not None:
+            return self._tick
+        return getattr(settings, 'PRODUCT_FEED_TICK', 0.25)
+
+    def publish(self, events):
+        events = [event for event in events if event is not None]
+        if events:
+            transaction.on_commit(lambda: self.enqueue(events))
+
+    def enqueue(self, events):
+        with self._lock:
+            for event in events:
+                previous = self._events.pop(event["id"], None)
+                self._events[event["id"]] = event if previous is None else merge_event(previous, event)
+            if self._timer is None:
+                self._timer = threading.Timer(self.tick, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._timer = None
+            events, self._events = list(self._events.values()), {}
+        if not events:
+            return
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(channel_layer.group_send)(FEED_GROUP, {"type": "product.feed", "events": events})
+        except Exception:
+            logger.exception("Не удалось разослать изменения товаров")
+            return
+        self.published += len(events)
+        self.messages += 1
+
+    # события, ждущие отправки (используется в тестах)
+    def pending(self):
+        with self._lock:
+            return list(self._events.values())
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "messages": self.messages,
+            "dropped": self.client_dropped,
+        }
+
+    def reset(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            self._events = {}
+            self.published = 0
+            self.messages = 0
+            self.client_dropped = 0
+
+
+# общий экземпляр на процесс
+feed = ProductFeed()
@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import logging
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Product
+from .serializers import ProductImportRowSerializer
+from .signals import bulk_product_changes, products_changed
+from .feed import created_event, updated_event
+from .aggregates import CategoryDeltas
+
+logger = logging.getLogger(__name__)
+
+# сколько строк проверять и записывать за одну транзакцию
+IMPORT_BATCH_SIZE = getattr(settings, 'IMPORT_BATCH_SIZE', 1000)
+# сколько ошибок по строкам сохранять в отчёте
+IMPORT_MAX_ERRORS = getattr(settings, 'IMPORT_MAX_ERRORS', 1000)
+
+IMPORT_FORMATS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+
+# формат файла по расширению имени
+def detect_format(filename):
+    return IMPORT_FORMATS.get(os.path.splitext(filename or '')[1].lower())
+
+
+# построчное чтение загруженного файла как текста (файл не читается в память целиком)
+def _text_stream(fileobj):
+    if hasattr(fileobj, 'open'):
+        fileobj.open('rb')
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+# строки CSV: пустые ячейки считаются отсутствующими
+def iter_csv_rows(fileobj):
+    for row in csv.DictReader(_text_stream(fileobj)):
+        yield {key: value for key, value in row.items() if key and value != ''}
+
+
+# строки NDJSON: один JSON-объект на строку, пустые строки пропускаются
+def iter_ndjson_rows(fileobj):
+    for line in _text_stream(fileobj):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            yield ValueError(f'Некорректный JSON: {exc}')
+
+
+READERS = {
+    'csv': iter_csv_rows,
+    'ndjson': iter_ndjson_rows,
+}
+
+
+# отчёт об импорте
+class ImportReport:
+
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+# импорт товаров партиями: проверка строк сериализатором и upsert по sku
+class ProductImporter:
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.child = ProductImportRowSerializer(many=True).child
+
+    def run(self, rows):
+        report = ImportReport()
+        batch = {}
+        for number, row in enumerate(rows, start=1):
+            report.processed += 1
+            if isinstance(row, Exception):
+                report.add_error(number, {'non_field_errors': [str(row)]})
+            else:
+                try:
+                    data = self.child.run_validation(row)
+                except ValidationError as exc:
+                    report.add_error(number, exc.detail)
+                else:
+                    # повтор артикула в одной партии - побеждает последняя строка
+                    # (поля, которых в ней нет, остаются из предыдущих)
+                    batch[data['sku']] = {**batch.get(data['sku'], {}), **data}
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, report)
+                batch = {}
+        if batch:
+            self.write_batch(batch, report)
+        return report
+
+    # одна партия - одна транзакция, один upsert на каждый набор присланных колонок и одно уведомление;
+    # у существующих товаров обновляются только колонки, которые есть в строке файла,
+    # остальные (например, количество при импорте только цен) не сбрасываются к значениям по умолчанию
+    def write_batch(self, batch, report):
+        with transaction.atomic(), bulk_product_changes():
+            # прежние категория, количество и цена обновляемых строк - для агрегатов по категориям
+            existing_rows = {
+                sku: (category, quantity, price)
+                for sku, category, quantity, price in Product.objects.filter(sku__in=list(batch))
+                .values_list('sku', 'category', 'quantity', 'price')
+            }
+            groups = defaultdict(list)
+            for data in batch.values():
+                groups[tuple(sorted(set(data) - {'sku'}))].append(Product(**data))
+            for update_fields, rows in groups.items():
+                Product.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=['sku'],
+                    update_fields=list(update_fields) or ['sku'],
+                )
+            # итоговые строки - из бд: у обновлённых товаров часть полей не приходила в файле
+            by_sku = Product.objects.in_bulk(list(batch), field_name='sku')
+            products = [by_sku[sku] for sku in batch]
+            existing = len(existing_rows)
+            created = len(batch) - existing
+            stats = CategoryDeltas()
+            for product in products:
+                if product.sku in existing_rows:
+                    stats.add(*existing_rows[product.sku], sign=-1)
+                stats.add_product(product)
+            # прежние значения обновлённых строк неизвестны - в ленту уходят все поля
+            products_changed(created, [
+                updated_event(product) if product.sku in existing_rows else created_event(product)
+                for product in products
+            ], stats)
+        report.created += created
+        report.updated += existing
+        logger.info(
+            "[IMPORT] обработано %s строк: создано %s, обновлено %s, ошибок %s",
+            report.processed, report.created, report.updated, report.failed
+        )
+        if self.progress is not None:
+            self.progress(report)
+
+
+# импорт из файла в указанном формате
+def import_products(fileobj, import_format, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    rows = READERS[import_format](fileobj)
+    return ProductImporter(batch_size=batch_size, progress=progress).run(rows)
@@ -0,0 +1,160 @@
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .serializers import requested_fields
+
+# to_representation, которые возвращают значение из бд без изменений
+# (str для строк, int для целых, bool для логических, pk для связей) - их можно не вызывать
+PASSTHROUGH = {
+    serializers.CharField.to_representation,
+    serializers.IntegerField.to_representation,
+    serializers.BooleanField.to_representation,
+    serializers.PrimaryKeyRelatedField.to_representation,
+}
+
+
+def lean_lists_enabled():
+    return getattr(settings, 'LEAN_LIST_RESPONSES', True)
+
+
+# вывод DateTimeField в ISO 8601 без лишних проверок DRF для каждого значения:
+# часовой пояс определяется один раз на вызов encode(); наивные даты
+# и переполнение при переводе в пояс - через сам to_representation
+class DateTimeConverter:
+
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self):
+        field = self.field
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if field_timezone is None:
+            return field.to_representation
+
+        def convert(value):
+            if not isinstance(value, datetime) or not timezone.is_aware(value):
+                return field.to_representation(value)
+            try:
+                value = value.astimezone(field_timezone).isoformat()
+            except OverflowError:
+                return field.to_representation(value)
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+        return convert
+
+
+# быстрая отдача списков только для чтения: строки берутся из бд через .values()
+# без создания объектов модели, а каждое поле выводится заранее выбранной функцией -
+# тем же to_representation поля сериализатора (Decimal, даты) или значением как есть;
+# результат совпадает с serializer_class(objects, many=True).data
+class RowEncoder:
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._plan = None
+        self._lock = threading.Lock()
+
+    # план строится при первом обращении - поля сериализатора нельзя создавать при импорте
+    @property
+    def plan(self):
+        if self._plan is None:
+            with self._lock:
+                if self._plan is None:
+                    self._plan = self.compile()
+        return self._plan
+
+    # (имя в ответе, колонка values(), функция вывода или None)
+    def compile(self):
+        serializer = self.serializer_class()
+        model = serializer.Meta.model
+        plan = []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if len(field.source_attrs) != 1:
+                raise ValueError(f'{self.serializer_class.__name__}.{field.field_name}: поле не из колонки модели')
+            model_field = model._meta.get_field(field.source_attrs[0])
+            if not model_field.concrete or model_field.many_to_many:
+                raise ValueError(f'{self.serializer_class.__name__}.{field.field_name}: поле не из колонки модели')
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is not None:
+                raise ValueError(f'{self.serializer_class.__name__}.{field.field_name}: pk_field не поддерживается')
+            convert = field.to_representation
+            if type(field).to_representation in PASSTHROUGH:
+                convert = None
+            elif type(field).to_representation is serializers.BigIntegerField.to_representation:
+                coerce = getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING)
+                convert = str if coerce else None
+            elif type(field).to_representation is serializers.DateTimeField.to_representation:
+                output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+                if output_format is not None and output_format.lower() == ISO_8601:
+                    convert = DateTimeConverter(field)
+            plan.append((field.field_name, model_field.attname, convert))
+        return plan
+
+    # имена полей ответа
+    @property
+    def names(self):
+        return [name for name, _, _ in self.plan]
+
+    # колонки бд для полей ответа (fields - только эти поля, см. requested_fields)
+    def columns(self, fields=None):
+        return [column for name, column, _ in self.plan if fields is None or name in fields]
+
+    # запрос, отдающий словари только с нужными колонками
+    # (и аннотациями - по ним может идти сортировка, например search_rank)
+    def values(self, queryset, fields=None):
+        return queryset.values(*self.columns(fields), *queryset.query.annotations)
+
+    # запрос объектов модели, из бд читаются только колонки полей ответа
+    def only(self, queryset, fields=None):
+        if fields is None:
+            return queryset
+        return queryset.only(*self.columns(fields))
+
+    def encode(self, rows, fields=None):
+        plan = [
+            (name, column, convert.bind() if isinstance(convert, DateTimeConverter) else convert)
+            for name, column, convert in self.plan
+            if fields is None or name in fields
+        ]
+        result = []
+        for row in rows:
+            item = {}
+            for name, column, convert in plan:
+                value = row[column]
+                item[name] = value if convert is None or value is None else convert(value)
+            result.append(item)
+        return result
+
+
+# list() у ViewSet через RowEncoder: фильтры и пагинация те же, меняется только выборка строк;
+# ?fields= / ?exclude= сужают и ответ, и колонки запроса (в том числе для retrieve)
+class LeanListMixin:
+    lean_encoder = None
+
+    def sparse_fields(self):
+        if self.lean_encoder is None:
+            return None
+        return requested_fields(self.request.query_params, self.lean_encoder.names)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.lean_encoder is not None and self.request.method == 'GET' and self.action in ('list', 'retrieve'):
+            queryset = self.lean_encoder.only(queryset, self.sparse_fields())
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        if self.lean_encoder is None or not lean_lists_enabled():
+            return super().list(request, *args, **kwargs)
+        fields = self.sparse_fields()
+        queryset = self.lean_encoder.values(self.filter_queryset(self.get_queryset()), fields)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.lean_encoder.encode(page, fields))
+        return Response(self.lean_encoder.encode(queryset, fields))
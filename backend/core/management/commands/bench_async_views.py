@@ -0,0 +1,64 @@
+import asyncio
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+
+from core.benchmarks import benchmark_database, timer
+from core.cache import CatalogCacheMixin
+from core.models import Item, Product
+
+
+# сравнение sync- и async-версий read-эндпоинтов под конкурентной нагрузкой
+class Command(BaseCommand):
+    help = 'Нагрузочное сравнение sync и async read-эндпоинтов (на временной бд)'
+
+    PAIRS = [
+        ('ping', '/api/ping/', '/api/async/ping/'),
+        ('items', '/api/items/', '/api/async/items/'),
+        ('products', '/api/products/', '/api/async/products/'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200, help='Сколько строк создать в каждой таблице')
+        parser.add_argument('--requests', type=int, default=200, help='Сколько запросов на эндпоинт')
+        parser.add_argument('--concurrency', type=int, default=50, help='Одновременных клиентов')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            Item.objects.bulk_create([Item(title=f'Item {i}') for i in range(options['rows'])])
+            Product.objects.bulk_create([
+                Product(name=f'Product {i}', price=i % 100 + 0.99, category=f'c{i % 10}')
+                for i in range(options['rows'])
+            ])
+            # кэш ответов каталога есть только у sync-версии - для честного сравнения выключаем
+            with mock.patch.object(CatalogCacheMixin, 'is_cacheable', return_value=False):
+                results = asyncio.run(self.run_all(options['requests'], options['concurrency']))
+
+        self.stdout.write(f"{'endpoint':<10} {'mode':<6} {'total ms':>10} {'req/s':>10}")
+        for name, mode, elapsed in results:
+            rps = options['requests'] / (elapsed / 1000)
+            self.stdout.write(f"{name:<10} {mode:<6} {elapsed:>10.1f} {rps:>10.1f}")
+
+    async def run_all(self, total, concurrency):
+        results = []
+        for name, sync_url, async_url in self.PAIRS:
+            for mode, url in (('sync', sync_url), ('async', async_url)):
+                elapsed = await self.load(url, total, concurrency)
+                results.append((name, mode, elapsed))
+        return results
+
+    # total запросов, не больше concurrency одновременно
+    async def load(self, url, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                response = await client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+
+        result = {}
+        with timer(result, 'elapsed'):
+            await asyncio.gather(*(one() for _ in range(total)))
+        return result['elapsed']
@@ -0,0 +1,118 @@
+import statistics
+import time
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+
+from core.benchmarks import benchmark_database
+from core.cache import CatalogCacheMixin
+from core.models import Item, Product
+from core.pagination import KeysetPagination, PageOrKeysetPagination
+
+CATEGORIES = 50
+
+
+# задержка типичных запросов списка (фильтр + сортировка + страница) по мере роста таблиц;
+# с индексами keyset-страницы не зависят от объёма, страницы с номером платят за COUNT
+class Command(BaseCommand):
+    help = 'Задержка фильтрации, сортировки и пагинации каталога на 10k..1M строк (на временной бд)'
+
+    SCENARIOS = [
+        ('product category+price', '/api/products/?category=c7&ordering=price&cursor='),
+        ('product category+price next', '/api/products/?category=c7&ordering=price&cursor=', 'next'),
+        ('product category+price page', '/api/products/?category=c7&ordering=price'),
+        ('product price=', '/api/products/?price=42.99&cursor='),
+        ('product -quantity', '/api/products/?ordering=-quantity&cursor='),
+        ('product name', '/api/products/?ordering=name&cursor='),
+        ('item -created_at', '/api/items/?cursor='),
+        ('item -created_at next', '/api/items/?cursor=', 'next'),
+        ('item title', '/api/items/?ordering=title&cursor='),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Размеры таблиц через запятую (по возрастанию)')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого запроса')
+        parser.add_argument('--page-size', type=int, default=50, help='Строк на странице')
+        parser.add_argument('--without-indexes', action='store_true',
+                            help='Удалить индексы каталога перед замером (для сравнения)')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        results = {}
+        with benchmark_database():
+            if options['without_indexes']:
+                self.drop_indexes()
+            # кэш ответов каталога искажает замеры, а страница в PAGE_SIZE строк
+            # меряет сериализацию, а не бд - берём страницу витрины
+            with mock.patch.object(CatalogCacheMixin, 'is_cacheable', return_value=False), \
+                    mock.patch.object(KeysetPagination, 'page_size', options['page_size']), \
+                    mock.patch.object(PageOrKeysetPagination, 'page_size', options['page_size']):
+                client = Client()
+                rows = 0
+                for size in sizes:
+                    self.stdout.write(f'заполнение до {size} строк...')
+                    self.fill(rows, size)
+                    rows = size
+                    for scenario in self.SCENARIOS:
+                        results[scenario[0], size] = self.measure(client, *scenario[1:], repeat=options['repeat'])
+
+        header = f"{'scenario':<30}" + ''.join(f'{size:>12}' for size in sizes)
+        self.stdout.write('p50 ms')
+        self.stdout.write(header)
+        for scenario in self.SCENARIOS:
+            name = scenario[0]
+            self.stdout.write(f'{name:<30}' + ''.join(
+                f'{results[name, size]:>12.2f}' if results[name, size] is not None else f'{"-":>12}'
+                for size in sizes
+            ))
+
+    def drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in (Product, Item):
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    # дозаполнение обеих таблиц со start до end строк
+    def fill(self, start, end, batch_size=10000):
+        now = timezone.now()
+        for offset in range(start, end, batch_size):
+            stop = min(offset + batch_size, end)
+            with transaction.atomic():
+                Product.objects.bulk_create([
+                    Product(
+                        name=f'Product {i:07d}', price=f'{i % 100}.99', category=f'c{i % CATEGORIES}',
+                        quantity=(i * 7919) % 1000,
+                    )
+                    for i in range(offset, stop)
+                ])
+                items = Item.objects.bulk_create([Item(title=f'Item {i:07d}') for i in range(offset, stop)])
+                # created_at с auto_now_add одинаковый внутри партии - разносим по времени
+                for i, item in zip(range(offset, stop), items):
+                    item.created_at = now - timedelta(seconds=end - i)
+                Item.objects.bulk_update(items, ['created_at'])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    # медиана времени запроса; для 'next' - вторая keyset-страница
+    # (None - второй страницы нет: выборка уместилась на первой)
+    def measure(self, client, url, page=None, repeat=20):
+        if page == 'next':
+            next_url = client.get(url).json()['next']
+            if next_url is None:
+                return None
+            parts = urlsplit(next_url)
+            url = f'{parts.path}?{parts.query}'
+        client.get(url)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, (url, response.status_code)
+        return statistics.median(timings)
@@ -0,0 +1,99 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import timer
+from core.channel_layers import SQLiteChannelLayer
+
+GROUP = 'bench'
+
+
+# рассылка в группу: concurrency одновременных group_send, в сообщении - время отправки
+async def send_all(layer, messages, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(n):
+        async with semaphore:
+            await layer.group_send(GROUP, {'type': 'bench', 'n': n, 'sent': time.time()})
+
+    await asyncio.gather(*(one(n) for n in range(messages)))
+
+
+# отправитель в отдельном процессе - со своим экземпляром слоя на том же файле
+def send_from_process(path, messages, concurrency):
+    asyncio.run(send_all(SQLiteChannelLayer(path=path, capacity=messages + 1), messages, concurrency))
+
+
+# сравнение канальных слоёв: пропускная способность group_send и задержка доставки
+class Command(BaseCommand):
+    help = 'Нагрузочное сравнение канального слоя в памяти и слоя на sqlite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help='Сколько сообщений разослать')
+        parser.add_argument('--receivers', type=int, default=50, help='Сколько каналов в группе')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных group_send')
+
+    def handle(self, *args, **options):
+        messages, receivers, concurrency = options['messages'], options['receivers'], options['concurrency']
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'channels.sqlite3')
+            runs = [
+                ('in-memory', 'local', InMemoryChannelLayer(capacity=messages + 1), None),
+                ('sqlite', 'local', SQLiteChannelLayer(path=path, capacity=messages + 1), None),
+                ('sqlite', 'process', SQLiteChannelLayer(path=path, capacity=messages + 1), path),
+            ]
+            results = []
+            for name, mode, layer, sender_path in runs:
+                results.append((name, mode) + asyncio.run(
+                    self.measure(layer, sender_path, messages, receivers, concurrency)
+                ))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.stdout.write(f"{'layer':<10} {'sender':<8} {'total ms':>10} {'deliveries/s':>13} "
+                          f"{'p50 ms':>8} {'p95 ms':>8}")
+        for name, mode, elapsed, latencies in results:
+            rate = messages * receivers / (elapsed / 1000)
+            p50 = statistics.median(latencies) * 1000
+            p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+            self.stdout.write(f"{name:<10} {mode:<8} {elapsed:>10.1f} {rate:>13.0f} {p50:>8.2f} {p95:>8.2f}")
+
+    # receivers каналов в группе слушают; отправитель - в этом же loop или в другом процессе
+    async def measure(self, layer, sender_path, messages, receivers, concurrency):
+        channels = [await layer.new_channel() for _ in range(receivers)]
+
+        async def listen(channel):
+            latencies = []
+            for _ in range(messages):
+                message = await layer.receive(channel)
+                latencies.append(time.time() - message['sent'])
+            return latencies
+
+        listeners = [asyncio.ensure_future(listen(channel)) for channel in channels]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        await asyncio.sleep(0.05)
+
+        result = {}
+        with timer(result, 'elapsed'):
+            if sender_path is None:
+                await send_all(layer, messages, concurrency)
+            else:
+                process = multiprocessing.Process(
+                    target=send_from_process, args=(sender_path, messages, concurrency)
+                )
+                process.start()
+                await asyncio.get_running_loop().run_in_executor(None, process.join)
+            latencies = await asyncio.wait_for(asyncio.gather(*listeners), 120)
+
+        await layer.flush()
+        await layer.close()
+        return result['elapsed'], [value for values in latencies for value in values]
@@ -0,0 +1,75 @@
+import io
+import statistics
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core import renderers
+from core.models import Product
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+from core.serializers import ProductSerializer
+
+
+# рендеринг и разбор страниц списка товаров: JSONRenderer/JSONParser DRF
+# против FastJSONRenderer/FastJSONParser с orjson и без него (бд не нужна)
+class Command(BaseCommand):
+    help = 'Микробенчмарк JSON-рендерера и парсера на страницах списка товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', default='10,100,1000', help='Размеры страниц через запятую')
+        parser.add_argument('--repeat', type=int, default=50, help='Повторов каждого замера')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'page':>6} {'drf ms':>8} {'orjson':>8} {'stdlib':>8} {'x':>5} "
+            f"{'parse ms':>9} {'orjson':>8} {'x':>5} {'identical':>10}"
+        )
+        for size in [int(size) for size in options['page_sizes'].split(',')]:
+            data = self.page(size)
+            repeat = options['repeat']
+            expected = JSONRenderer().render(data)
+            fast = FastJSONRenderer()
+            drf_ms = self.measure(lambda: JSONRenderer().render(data), repeat)
+            orjson_ms = self.measure(lambda: fast.render(data), repeat)
+            identical = [fast.render(data) == expected]
+            with mock.patch.object(renderers, 'orjson', None):
+                stdlib_ms = self.measure(lambda: fast.render(data), repeat)
+                identical.append(fast.render(data) == expected)
+
+            parse_ms = self.measure(lambda: JSONParser().parse(io.BytesIO(expected)), repeat)
+            fast_parse_ms = self.measure(lambda: FastJSONParser().parse(io.BytesIO(expected)), repeat)
+            identical.append(
+                FastJSONParser().parse(io.BytesIO(expected)) == JSONParser().parse(io.BytesIO(expected))
+            )
+            identical = all(identical)
+            self.stdout.write(
+                f'{size:>6} {drf_ms:>8.2f} {orjson_ms:>8.2f} {stdlib_ms:>8.2f} {drf_ms / orjson_ms:>5.1f} '
+                f'{parse_ms:>9.2f} {fast_parse_ms:>8.2f} {parse_ms / fast_parse_ms:>5.1f} {str(identical):>10}'
+            )
+
+    # страница в том виде, в каком её отдаёт /api/products/
+    def page(self, size):
+        products = [
+            Product(id=i, sku=f'SKU{i}' if i % 2 else None, name=f'Товар {i}', description='Описание товара ' * 10,
+                    price=f'{i % 1000}.{i % 100:02d}', category=f'c{i % 10}', quantity=i % 50)
+            for i in range(1, size + 1)
+        ]
+        return {
+            'count': size,
+            'next': None,
+            'previous': None,
+            'results': ProductSerializer(products, many=True).data,
+        }
+
+    # медиана в миллисекундах
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
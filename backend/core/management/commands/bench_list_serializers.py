@@ -0,0 +1,87 @@
+import statistics
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core.benchmarks import benchmark_database
+from core.cache import CatalogCacheMixin
+from core.models import Item, Product
+from core.pagination import PageOrKeysetPagination
+from core.serializers import ItemSerializer, ProductSerializer
+from core.views import item_rows, product_rows
+
+
+# ModelSerializer против RowEncoder на страницах списка: время только вывода строк
+# и время всего запроса; ответы обоих вариантов сравниваются побайтно
+class Command(BaseCommand):
+    help = 'Сравнение ModelSerializer и RowEncoder для списков товаров и item (на временной бд)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Строк в каждой таблице')
+        parser.add_argument('--page-sizes', default='100,1000', help='Размеры страниц через запятую')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого замера')
+
+    def handle(self, *args, **options):
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        results = []
+        with benchmark_database(), \
+                mock.patch.object(CatalogCacheMixin, 'is_cacheable', return_value=False):
+            self.fill(options['rows'])
+            client = Client()
+            for size in page_sizes:
+                with mock.patch.object(PageOrKeysetPagination, 'page_size', size):
+                    for name, url, model, serializer_class, encoder in (
+                        ('products', '/api/products/', Product, ProductSerializer, product_rows),
+                        ('items', '/api/items/', Item, ItemSerializer, item_rows),
+                    ):
+                        objects = list(model.objects.order_by('pk')[:size])
+                        rows = list(encoder.values(model.objects.order_by('pk'))[:size])
+                        serializer_ms = self.measure(lambda: serializer_class(objects, many=True).data,
+                                                     options['repeat'])
+                        encoder_ms = self.measure(lambda: encoder.encode(rows), options['repeat'])
+
+                        responses, request_ms = {}, {}
+                        for lean in (False, True):
+                            with override_settings(LEAN_LIST_RESPONSES=lean):
+                                responses[lean] = client.get(url).content
+                                request_ms[lean] = self.measure(lambda: client.get(url), options['repeat'])
+                        identical = responses[False] == responses[True]
+                        results.append((name, size, serializer_ms, encoder_ms,
+                                        request_ms[False], request_ms[True], identical))
+
+        self.stdout.write(
+            f"{'list':<9} {'page':>6} {'ser ms':>8} {'enc ms':>8} {'x':>5} "
+            f"{'req ms':>8} {'lean ms':>8} {'x':>5} {'identical':>10}"
+        )
+        for name, size, serializer_ms, encoder_ms, full_ms, lean_ms, identical in results:
+            self.stdout.write(
+                f'{name:<9} {size:>6} {serializer_ms:>8.2f} {encoder_ms:>8.2f} {serializer_ms / encoder_ms:>5.1f} '
+                f'{full_ms:>8.2f} {lean_ms:>8.2f} {full_ms / lean_ms:>5.1f} {str(identical):>10}'
+            )
+
+    def fill(self, rows):
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=f'{i % 1000}.{i % 100:02d}', category=f'c{i % 10}',
+                    quantity=i % 50, sku=f'SKU{i}' if i % 2 else None, description='Описание товара ' * 10)
+            for i in range(rows)
+        ], batch_size=1000)
+        items = Item.objects.bulk_create([
+            Item(title=f'Item {i}', description='Описание ' * 10) for i in range(rows)
+        ], batch_size=1000)
+        # разные created_at, в том числе с микросекундами
+        now = timezone.now()
+        for i, item in enumerate(items):
+            item.created_at = now - timezone.timedelta(seconds=i, microseconds=i * 7)
+        Item.objects.bulk_update(items, ['created_at'], batch_size=1000)
+
+    # медиана в миллисекундах
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
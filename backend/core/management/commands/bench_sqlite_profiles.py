@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from core.models import Product
+
+
+# конкурентная нагрузка на файловую бд в каждом профиле из DB_PROFILES:
+# потоки-читатели и потоки-писатели работают одновременно заданное время
+class Command(BaseCommand):
+    help = 'Пропускная способность чтения и записи sqlite в профилях default и tuned'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help='Длительность замера на профиль')
+        parser.add_argument('--readers', type=int, default=8, help='Потоков чтения')
+        parser.add_argument('--writers', type=int, default=4, help='Потоков записи')
+        parser.add_argument('--rows', type=int, default=5000, help='Строк перед началом замера')
+
+    def handle(self, *args, **options):
+        tmp = tempfile.mkdtemp()
+        results = []
+        try:
+            for profile in settings.DB_PROFILES:
+                alias = f'bench_{profile}'
+                self.add_database(alias, os.path.join(tmp, f'{profile}.sqlite3'), profile)
+                try:
+                    self.prepare(alias, options['rows'])
+                    results.append((profile,) + self.run(alias, options))
+                finally:
+                    connections[alias].close()
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.stdout.write(f"{'profile':<10} {'reads/s':>10} {'writes/s':>10} {'locked':>8}")
+        for profile, reads, writes, locked in results:
+            self.stdout.write(
+                f"{profile:<10} {reads / options['seconds']:>10.0f} "
+                f"{writes / options['seconds']:>10.0f} {locked:>8}"
+            )
+
+    # отдельный алиас с файлом во временном каталоге - рабочая бд не трогается
+    def add_database(self, alias, path, profile):
+        database = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, **settings.DB_PROFILES[profile]}
+        configured = connections.configure_settings({'default': dict(settings.DATABASES['default']), alias: database})
+        connections.settings[alias] = configured[alias]
+
+    def prepare(self, alias, rows):
+        with connections[alias].schema_editor() as editor:
+            editor.create_model(Product)
+        Product.objects.using(alias).bulk_create([
+            Product(name=f'Product {i}', price=i % 100 + 0.99, category=f'c{i % 10}', quantity=i % 50)
+            for i in range(rows)
+        ], batch_size=1000)
+
+    def run(self, alias, options):
+        deadline = time.monotonic() + options['seconds']
+        counts = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+
+        def read(n):
+            return len(Product.objects.using(alias).filter(category=f'c{n % 10}', quantity__gte=n % 50)[:50])
+
+        def write(n):
+            Product.objects.using(alias).filter(pk=n % options['rows'] + 1).update(quantity=n % 50)
+
+        def worker(operation, counter):
+            n = 0
+            while time.monotonic() < deadline:
+                try:
+                    operation(n)
+                except OperationalError:
+                    with lock:
+                        counts['locked'] += 1
+                else:
+                    with lock:
+                        counts[counter] += 1
+                # конец "запроса": соединение закрывается, если CONN_MAX_AGE этого не разрешает
+                connections[alias].close_if_unusable_or_obsolete()
+                n += 1
+            connections[alias].close()
+
+        threads = [threading.Thread(target=worker, args=(read, 'reads')) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=(write, 'writes')) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts['reads'], counts['writes'], counts['locked']
@@ -0,0 +1,117 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+
+from core.aggregates import rebuild_category_stats
+from core.benchmarks import benchmark_database
+from core.cache import CatalogCacheMixin
+from core.models import Product
+from rest_framework.authtoken.models import Token
+
+
+# конкурентные покупки одних и тех же товаров на файловой бд в WAL:
+# naive - GET товара и PATCH quantity (чтение-изменение-запись, как раньше),
+# reserve - POST /api/reservations/ партиями и подтверждение резервов
+class Command(BaseCommand):
+    help = 'Пропускная способность и перепродажи при конкурентном списании остатков (sqlite WAL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Одновременных покупателей')
+        parser.add_argument('--orders', type=int, default=2000, help='Заказов на режим')
+        parser.add_argument('--products', type=int, default=20, help='Товаров (чем меньше, тем выше конкуренция)')
+        parser.add_argument('--stock', type=int, default=100, help='Начальный остаток каждого товара')
+        parser.add_argument('--items', type=int, default=2, help='Позиций в заказе')
+        parser.add_argument('--batch', type=int, default=10, help='Резервов в одном запросе (режим reserve)')
+
+    def handle(self, *args, **options):
+        tmp = tempfile.mkdtemp()
+        # тестовая бд в файле, а не в памяти - потоки работают с одной бд через свои соединения
+        test_settings = connections['default'].settings_dict.setdefault('TEST', {})
+        test_settings['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        results = []
+        try:
+            with benchmark_database(aliases={'default'}), \
+                    mock.patch.object(CatalogCacheMixin, 'is_cacheable', return_value=False):
+                products = Product.objects.bulk_create([
+                    Product(name=f'Product {i}', price='9.99', category=f'c{i % 5}', quantity=options['stock'])
+                    for i in range(options['products'])
+                ])
+                ids = [product.pk for product in products]
+                # резервы доступны только аутентифицированным пользователям
+                user = User.objects.create_user(username='bench')
+                self.auth = f'Token {Token.objects.create(user=user).key}'
+                rng = random.Random(42)
+                orders = [
+                    [{'product': rng.choice(ids), 'quantity': rng.randint(1, 3)} for _ in range(options['items'])]
+                    for _ in range(options['orders'])
+                ]
+                for mode in ('naive', 'reserve'):
+                    Product.objects.update(quantity=options['stock'])
+                    rebuild_category_stats()
+                    sold, elapsed = self.run(mode, orders, options)
+                    left = sum(Product.objects.values_list('quantity', flat=True))
+                    taken = options['stock'] * len(ids) - left
+                    results.append((mode, len(orders) / elapsed, sold, taken, sold - taken))
+        finally:
+            test_settings.pop('NAME', None)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.stdout.write(f"{'mode':<8} {'orders/s':>10} {'sold':>8} {'taken':>8} {'oversold':>9}")
+        for mode, rate, sold, taken, oversold in results:
+            self.stdout.write(f'{mode:<8} {rate:>10.0f} {sold:>8} {taken:>8} {oversold:>9}')
+
+    # заказы делятся между потоками; возвращает (продано по ответам сервера, секунды)
+    def run(self, mode, orders, options):
+        worker = self.naive if mode == 'naive' else self.reserve
+        chunks = [orders[i::options['threads']] for i in range(options['threads'])]
+        sold = [0] * len(chunks)
+
+        def target(index):
+            try:
+                sold[index] = worker(Client(HTTP_AUTHORIZATION=self.auth), chunks[index], options)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=target, args=(index,)) for index in range(len(chunks))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(sold), time.perf_counter() - start
+
+    # чтение остатка и запись нового значения - между ними другой поток успевает продать то же
+    def naive(self, client, orders, options):
+        sold = 0
+        for order in orders:
+            for item in order:
+                url = f"/api/products/{item['product']}/"
+                quantity = client.get(url).json()['quantity']
+                if quantity >= item['quantity']:
+                    response = client.patch(url, {'quantity': quantity - item['quantity']},
+                                            content_type='application/json')
+                    if response.status_code == 200:
+                        sold += item['quantity']
+        return sold
+
+    def reserve(self, client, orders, options):
+        sold = 0
+        for start in range(0, len(orders), options['batch']):
+            batch = orders[start:start + options['batch']]
+            response = client.post('/api/reservations/', [{'items': order} for order in batch],
+                                   content_type='application/json')
+            reserved = response.json()['reserved']
+            if reserved:
+                client.post('/api/reservations/commit/', {'ids': [row['id'] for row in reserved]},
+                            content_type='application/json')
+            sold += sum(item['quantity'] for row in reserved for item in row['items'])
+        return sold
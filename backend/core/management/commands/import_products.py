@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importers import IMPORT_BATCH_SIZE, detect_format, import_products
+
+
+# команда для загрузки каталога из файла с выводом прогресса
+class Command(BaseCommand):
+    help = 'Импортирует товары из CSV/NDJSON файла (upsert по sku)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv, .ndjson или .jsonl')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        import_format = detect_format(options['path'])
+        if import_format is None:
+            raise CommandError('Поддерживаются файлы .csv, .ndjson и .jsonl')
+
+        def progress(report):
+            self.stdout.write(
+                f"обработано {report.processed}: создано {report.created}, "
+                f"обновлено {report.updated}, ошибок {report.failed}"
+            )
+
+        with open(options['path'], 'rb') as f:
+            report = import_products(f, import_format, batch_size=options['batch_size'], progress=progress)
+
+        for error in report.errors:
+            self.stderr.write(f"строка {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: создано {report.created}, обновлено {report.updated}, ошибок {report.failed}"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.search import install_search_indexes
+
+
+# команда для пересоздания полнотекстовых индексов товаров и item
+class Command(BaseCommand):
+    help = 'Создаёт (если нужно) и перестраивает FTS5-индексы для поиска'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Полнотекстовый индекс FTS5 поддерживается только для SQLite')
+        for table in install_search_indexes(rebuild=True):
+            self.stdout.write(self.style.SUCCESS(f'Индекс {table} перестроен'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.aggregates import rebuild_category_stats
+
+
+# сверка агрегатов по категориям с товарами: расхождения появляются от записей
+# в обход сигналов (queryset.update(), правка бд вручную) и исправляются перестроением
+class Command(BaseCommand):
+    help = 'Сверяет таблицу агрегатов по категориям с товарами и перестраивает её'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        drift = rebuild_category_stats(dry_run=options['dry_run'])
+        for category, stored, actual in drift:
+            self.stdout.write(
+                f'{category or "-"}: count {stored[0]} -> {actual[0]}, quantity {stored[1]} -> {actual[1]}, '
+                f'value_cents {stored[2]} -> {actual[2]}'
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Расхождений: {len(drift)} (таблица не изменена)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено категорий: {len(drift)}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.reservations import release_expired
+
+
+# отмена неподтверждённых резервов с истёкшим сроком - остаток возвращается на склад;
+# запускается периодически (cron)
+class Command(BaseCommand):
+    help = 'Отменяет истёкшие резервы товаров и возвращает остатки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Резервов за одну транзакцию')
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Отменено резервов: {released}'))
@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# копирование основной бд в файлы реплик через backup API sqlite:
+# копия согласованная, а читатели реплики не блокируются надолго
+class Command(BaseCommand):
+    help = 'Обновляет реплики для чтения (DB_READ_REPLICAS) копией основной бд'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024, help='Страниц за один шаг копирования')
+
+    def handle(self, *args, **options):
+        aliases = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not aliases:
+            raise CommandError('Реплики не настроены (DB_READ_REPLICAS)')
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        source = sqlite3.connect(primary)
+        try:
+            for alias in aliases:
+                target_path = connections[alias].settings_dict['NAME']
+                target = sqlite3.connect(target_path)
+                try:
+                    source.backup(target, pages=options['pages'])
+                finally:
+                    target.close()
+                self.stdout.write(f'{alias}: {target_path}')
+        finally:
+            source.close()
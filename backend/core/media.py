@@ -0,0 +1,167 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .models import UploadSession
+from .uploads import CAS_DIR, UPLOAD_TMP_DIR
+
+# файлы из хранилища по хэшу никогда не меняются - кэшируются навсегда
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+# часть файла как file-like объект: чтение ограничено диапазоном,
+# а fileno() позволяет WSGI-серверу отправить диапазон через os.sendfile
+class FileRange:
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.file = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+# sha256 из имени файла в хранилище по хэшу (None для остальных файлов)
+def cas_digest(relative_path):
+    name = os.path.splitext(os.path.basename(relative_path))[0]
+    if relative_path.startswith(CAS_DIR + '/') and SHA256_RE.match(name):
+        return name
+    return None
+
+
+# ETag: для cas/ - хэш содержимого из имени файла, для остальных - размер и время
+# модификации (без чтения файла, в том числе в режиме выгрузки на веб-сервер)
+def content_etag(relative_path, stat):
+    digest = cas_digest(relative_path)
+    if digest is not None:
+        return f'"{digest}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+# тип содержимого: для cas/ - из метаданных загрузки (в имени файла нет расширения),
+# для остальных и старых файлов с расширением - по имени файла
+def media_content_type(relative_path, full_path):
+    digest = cas_digest(relative_path)
+    if digest is not None:
+        content_type = UploadSession.objects.filter(sha256=digest).exclude(content_type='') \
+            .values_list('content_type', flat=True).first()
+        if content_type:
+            return content_type, None
+    content_type, encoding = mimetypes.guess_type(full_path)
+    return content_type or 'application/octet-stream', encoding
+
+
+# разбор заголовка Range (поддерживается один диапазон): (start, end) или None;
+# ValueError - диапазон невыполним
+def parse_range(header, size):
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def offload_response(relative_path, full_path):
+    mode = settings.MEDIA_OFFLOAD
+    response = HttpResponse()
+    if mode == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_OFFLOAD_PREFIX + relative_path
+    else:
+        response['X-Sendfile'] = full_path
+    # тип содержимого определит веб-сервер по расширению; у файлов cas/ его нет - берём из метаданных
+    if cas_digest(relative_path):
+        response['Content-Type'] = media_content_type(relative_path, full_path)[0]
+    else:
+        del response['Content-Type']
+    return response
+
+
+# отдача медиафайлов: Range, ETag, долгий кэш и выгрузка отправки на веб-сервер
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    relative_path = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    # незавершённые загрузки не отдаются
+    if relative_path.startswith(UPLOAD_TMP_DIR + '/'):
+        raise Http404
+
+    stat = os.stat(full_path)
+    etag = content_etag(relative_path, stat)
+    cache_control = (f'public, max-age={IMMUTABLE_MAX_AGE}, immutable' if cas_digest(relative_path)
+                     else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+
+    def with_headers(response):
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        return with_headers(HttpResponseNotModified())
+
+    # Range в режиме выгрузки обрабатывает сам веб-сервер
+    if settings.MEDIA_OFFLOAD:
+        return with_headers(offload_response(relative_path, full_path))
+
+    content_type, encoding = media_content_type(relative_path, full_path)
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return with_headers(response)
+
+    f = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(FileRange(f, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return with_headers(response)
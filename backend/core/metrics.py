@@ -0,0 +1,176 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from django.db.backends.signals import connection_created
+
+from .querycount import current_recorders, record_query
+
+# границы корзин гистограммы длительности запросов (сек)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# гистограмма в формате Prometheus: счётчики по корзинам, сумма и количество
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# метрики запросов процесса; метки - имя маршрута (не сырой путь), метод и статус
+class RequestMetrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latency = {}
+        self.requests = {}
+        self.response_bytes = {}
+        self.db_queries = {}
+        self.db_seconds = {}
+
+    def observe(self, route, method, status, seconds, size, queries, db_seconds):
+        key = (route, method)
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+            status_key = (route, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            self.response_bytes[key] = self.response_bytes.get(key, 0) + size
+            self.db_queries[key] = self.db_queries.get(key, 0) + queries
+            self.db_seconds[key] = self.db_seconds.get(key, 0.0) + db_seconds
+
+    # текстовый формат Prometheus
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP http_request_duration_seconds Request latency by route.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (route, method), histogram in sorted(self.latency.items()):
+                labels = f'route="{_escape(route)}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            lines += [
+                '# HELP http_requests_total Requests by route and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (route, method, status), value in sorted(self.requests.items()):
+                lines.append(
+                    f'http_requests_total{{route="{_escape(route)}",method="{method}",status="{status}"}} {value}'
+                )
+
+            for name, help_text, values, fmt in (
+                ('http_response_size_bytes_total', 'Response body bytes by route.', self.response_bytes, '{}'),
+                ('db_queries_total', 'Database queries by route.', self.db_queries, '{}'),
+                ('db_query_duration_seconds_total', 'Database time by route.', self.db_seconds, '{:.6f}'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (route, method), value in sorted(values.items()):
+                    lines.append(f'{name}{{route="{_escape(route)}",method="{method}"}} {fmt.format(value)}')
+        return lines
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+# общий реестр на процесс
+request_metrics = RequestMetrics()
+
+
+# счётчик запросов к бд текущего HTTP-запроса; contextvar переходит и в потоки
+# sync_to_async, поэтому учитываются и запросы async-ORM
+class QueryStats:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+current_query_stats = contextvars.ContextVar('current_query_stats', default=None)
+
+
+# одна обёртка на все запросы: счётчик текущего HTTP-запроса и записи
+# бюджета запросов и N+1 (querycount.recording)
+def _count_queries(execute, sql, params, many, context):
+    stats = current_query_stats.get()
+    recorders = current_recorders.get()
+    if stats is None and not recorders:
+        return execute(sql, params, many, context)
+    start = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = (time.perf_counter_ns() - start) / 1e9
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += seconds
+        if recorders:
+            record_query(recorders, sql, seconds)
+
+
+# обёртка выполнения запросов ставится на каждое новое соединение с бд
+def install_query_counter(sender, connection, **kwargs):
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+connection_created.connect(install_query_counter)
+
+
+# для соединений, открытых до подключения обработчика сигнала
+def install_on_open_connections():
+    from django.db import connections
+    for connection in connections.all(initialized_only=True):
+        install_query_counter(None, connection)
+
+
+# текст для эндпоинта /metrics: метрики запросов и рассылки количества товаров
+def render_metrics():
+    from .broadcast import broadcaster
+    from .feed import feed
+    from .websocket import websocket_stats
+
+    lines = request_metrics.render()
+    lines += websocket_stats.render()
+    stats = broadcaster.stats()
+    lines += [
+        '# HELP product_count_broadcasts_sent_total Product count pushes sent to WebSocket clients.',
+        '# TYPE product_count_broadcasts_sent_total counter',
+        f'product_count_broadcasts_sent_total {stats["sent"]}',
+        '# HELP product_count_broadcasts_suppressed_total Product count changes folded into another push.',
+        '# TYPE product_count_broadcasts_suppressed_total counter',
+        f'product_count_broadcasts_suppressed_total {stats["suppressed"]}',
+    ]
+    stats = feed.stats()
+    lines += [
+        '# HELP product_feed_events_published_total Product change events sent to the feed group.',
+        '# TYPE product_feed_events_published_total counter',
+        f'product_feed_events_published_total {stats["published"]}',
+        '# HELP product_feed_events_dropped_total Feed events dropped for slow WebSocket clients.',
+        '# TYPE product_feed_events_dropped_total counter',
+        f'product_feed_events_dropped_total {stats["dropped"]}',
+    ]
+    return '\n'.join(lines) + '\n'
@@ -1,24 +1,201 @@
 import time
+import random
 import logging
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import QueryStats, current_query_stats, install_on_open_connections, request_metrics
+from . import querycount, routers
+
 # создаём логгер для текущего модуля
 logger = logging.getLogger(__name__)
 
-# Middleware-класс для логирования каждого HTTP-запроса и времени его обработки
+
+# имя маршрута для меток метрик: имя url (или шаблон), но не сырой путь
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route or 'unresolved'
+
+
+# размер тела ответа: для потоковых ответов - по Content-Length, если он известен
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+# Middleware-класс для метрик и логирования каждого HTTP-запроса
+# работает и в синхронном, и в асинхронном режиме, чтобы async-views не уходили в поток
 class LoggingMiddleware:
+    sync_capable = True
+    async_capable = True
 
     # конструктор класса - получает функцию get_response, которая обрабатывает запрос
     def __init__(self, get_response):
         self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_LOG_SAMPLE_RATE', 1.0)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_on_open_connections()
 
-    #  основной метод  - логирует данные о входящем запросе, замеряет время обработки, логирует ответ
+    # основной метод - замеряет время обработки и запросы к бд, пишет метрики и (выборочно) лог
     def __call__(self, request):
-        start = time.time()
-        user = request.user.username if hasattr(request, 'user') and request.user.is_authenticated else 'Anonymous'
-        logger.info(f"[REQUEST] {request.method} {request.get_full_path()} by {user}")
-        
-        response = self.get_response(request)
-        
-        duration = (time.time() - start) * 1000
-        logger.info(f"[RESPONSE] {request.method} {request.get_full_path()} -> {response.status_code} in {duration:.1f}ms")
+        if self.is_async:
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        start = time.perf_counter_ns()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_query_stats.reset(token)
+        duration = (time.perf_counter_ns() - start) / 1e9
+
+        self.record(request, response, duration, stats)
+        if self.sampled():
+            user = getattr(request, 'user', None)
+            self.log(request, response, duration, stats, user)
+        return response
+
+    # асинхронный вариант - пользователь для лога загружается через auser()
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        start = time.perf_counter_ns()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_query_stats.reset(token)
+        duration = (time.perf_counter_ns() - start) / 1e9
+
+        self.record(request, response, duration, stats)
+        if self.sampled():
+            user = await request.auser() if hasattr(request, 'auser') else None
+            self.log(request, response, duration, stats, user)
         return response
+
+    def record(self, request, response, duration, stats):
+        request_metrics.observe(
+            route_name(request), request.method, response.status_code,
+            duration, response_size(response), stats.count, stats.seconds
+        )
+
+    # в лог попадает только доля запросов REQUEST_LOG_SAMPLE_RATE
+    def sampled(self):
+        if not logger.isEnabledFor(logging.INFO):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def log(self, request, response, duration, stats, user):
+        username = user.username if user is not None and user.is_authenticated else 'Anonymous'
+        logger.info(
+            "[REQUEST] %s %s by %s -> %s in %.1fms, %s queries (%.1fms)",
+            request.method, request.get_full_path(), username, response.status_code,
+            duration * 1000, stats.count, stats.seconds * 1000
+        )
+
+
+# Middleware для контроля количества запросов к бд: бюджет по маршруту и поиск N+1
+# выборка QUERY_REPORT_SAMPLE_RATE запросов записывается со стеками и попадает в лог
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_REPORT_SAMPLE_RATE', 0.0)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_on_open_connections()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = self.make_recorder()
+        if recorder is None:
+            return self.get_response(request)
+        with querycount.recording(recorder):
+            response = self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = self.make_recorder()
+        if recorder is None:
+            return await self.get_response(request)
+        with querycount.recording(recorder):
+            response = await self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    # запись ведётся только для попавших в выборку запросов
+    def make_recorder(self):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return querycount.QueryRecorder(capture_stacks=True)
+
+    def report(self, request, recorder):
+        route = route_name(request)
+        problems = recorder.problems(querycount.get_query_budget(route))
+        if problems:
+            logger.warning(
+                "[QUERIES] %s %s (%s): %s",
+                request.method, request.get_full_path(), route, '\n'.join(problems)
+            )
+
+
+# Middleware закрепления за основной бд при чтении с реплик (read-your-writes):
+# изменяющие запросы и клиенты с cookie читают с основной бд, а после записи
+# клиент получает cookie на REPLICA_PIN_SECONDS - пока реплика не догонит
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_pin'
+
+    def __init__(self, get_response):
+        if not routers.replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            response = self.get_response(request)
+            self.remember(response)
+        finally:
+            self.finish(tokens)
+        return response
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            response = await self.get_response(request)
+            self.remember(response)
+        finally:
+            self.finish(tokens)
+        return response
+
+    def start(self, request):
+        pinned = request.method not in SAFE_METHODS or self.cookie_name in request.COOKIES
+        return routers.primary_pinned.set(pinned), routers.wrote_to_primary.set(False)
+
+    def remember(self, response):
+        if routers.wrote_to_primary.get():
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+
+    def finish(self, tokens):
+        routers.primary_pinned.reset(tokens[0])
+        routers.wrote_to_primary.reset(tokens[1])
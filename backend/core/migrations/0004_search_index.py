@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from core.search import install_search_indexes, uninstall_search_indexes
+
+
+# создаёт FTS5-индексы с триггерами и заполняет их существующими данными
+def create_indexes(apps, schema_editor):
+    install_search_indexes(schema_editor.connection, rebuild=True, get_model=apps.get_model)
+
+
+def drop_indexes(apps, schema_editor):
+    uninstall_search_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_remove_product_image_product_quantity_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:38
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, Count, F, Sum
+from django.db.models.functions import Cast, Coalesce, Round
+
+
+# заполняет агрегаты по уже существующим товарам (таблица только что создана и пуста)
+def fill_category_stats(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    CategoryStats = apps.get_model('core', 'CategoryStats')
+    db = schema_editor.connection.alias
+    value_cents = Cast(Round(F('price') * 100), BigIntegerField()) * F('quantity')
+    rows = (
+        Product.objects.using(db).order_by().values('category')
+        .annotate(
+            count=Count('pk'),
+            total=Coalesce(Sum('quantity'), 0),
+            value=Coalesce(Sum(value_cents, output_field=BigIntegerField()), 0),
+        )
+    )
+    CategoryStats.objects.using(db).bulk_create([
+        CategoryStats(category=row['category'], product_count=row['count'],
+                      total_quantity=row['total'], inventory_value_cents=row['value'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=100, unique=True)),
+                ('product_count', models.IntegerField(default=0)),
+                ('total_quantity', models.BigIntegerField(default=0)),
+                ('inventory_value_cents', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_category_stats, migrations.RunPython.noop),
+    ]
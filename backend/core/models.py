@@ -1,4 +1,7 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import models, router, transaction
 
 # модель item - для хранения простых заметок/элементов
 class Item(models.Model):
@@ -6,18 +9,145 @@ class Item(models.Model):
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # индексы под сортировки списка: по умолчанию -created_at (id - для keyset-пагинации), title
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='item_created_id_idx'),
+            models.Index(fields=['title'], name='item_title_idx'),
+        ]
+
     # cтроковое представление - удобно для отображения в админке и shell
     def __str__(self):
         return self.title
 
 # модель Product - для хранения информации о товаре
 class Product(models.Model):
+    # артикул - естественный ключ для импорта (может отсутствовать)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.CharField(max_length=100, blank=True)
     quantity = models.PositiveIntegerField(default=0)
 
+    # индексы под фильтры и сортировки ProductViewSet: category (+ сортировка по цене),
+    # price, quantity, name; id в конце каждого индекса sqlite добавляет сам
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['quantity'], name='product_quantity_idx'),
+            models.Index(fields=['name'], name='product_name_idx'),
+        ]
+
+    # сохранение в транзакции: сигналы агрегатов читают прежнюю строку под блокировкой,
+    # и приращение считается от неё, а не от значений, прочитанных до параллельной записи
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+    # значения полей при загрузке из бд - по ним лента изменений находит изменённые поля,
+    # а агрегаты по категориям - прежний вклад товара
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = (field_names, values)
+        return instance
+
+    # прежние значения полей по attname (None - объект создан не из бд)
+    def loaded_values(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        field_names, values = loaded
+        return dict(zip(field_names, values))
+
+    # текущие значения становятся "прежними" для следующего изменения;
+    # fields - только эти поля (save(update_fields=...) записал не всё)
+    def remember_loaded_values(self, fields=None):
+        values = {} if fields is None else self.loaded_values() or {}
+        for field in self._meta.concrete_fields:
+            if fields is None or field.name in fields:
+                values[field.attname] = getattr(self, field.attname)
+        self._loaded_values = (list(values), list(values.values()))
+
     # строковое представление - выводит название товара
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+# модель UploadSession - состояние загрузки большого файла по частям
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # пользователь, начавший загрузку: только он видит и продолжает сессию
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True,
+                              related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    # ожидаемый sha256 от клиента (необязательно) и итоговый sha256 файла
+    checksum = models.CharField(max_length=64, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    # тип содержимого по имени файла - имя в хранилище по хэшу без расширения
+    content_type = models.CharField(max_length=100, blank=True)
+    # время захвата сессии записью части (None - свободна)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    # строковое представление - имя файла и прогресс
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+# агрегаты каталога по категориям - обновляются приращениями вместе с записью товаров
+class CategoryStats(models.Model):
+    category = models.CharField(max_length=100, unique=True)
+    product_count = models.IntegerField(default=0)
+    total_quantity = models.BigIntegerField(default=0)
+    # стоимость запасов (цена * количество) в копейках - целые суммы без ошибок округления
+    inventory_value_cents = models.BigIntegerField(default=0)
+
+    # строковое представление - категория и количество товаров
+    def __str__(self):
+        return f'{self.category or "-"}: {self.product_count}'
+
+# резерв товаров под заказ: количество списывается с Product.quantity при резервировании,
+# при отмене или истечении срока возвращается, при подтверждении остаётся списанным
+class StockReservation(models.Model):
+    RESERVED = 'reserved'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (RESERVED, 'Зарезервирован'),
+        (COMMITTED, 'Подтверждён'),
+        (RELEASED, 'Отменён'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # пользователь, создавший резерв - только он видит, подтверждает и отменяет его;
+    # при удалении пользователя резерв остаётся и отменяется по истечении срока
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='stock_reservations',
+                              on_delete=models.SET_NULL, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RESERVED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    # индекс для поиска истёкших резервов
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    # строковое представление - id и статус
+    def __str__(self):
+        return f'{self.pk} ({self.status})'
+
+# позиция резерва: товар и зарезервированное количество
+class StockReservationItem(models.Model):
+    reservation = models.ForeignKey(StockReservation, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='reservation_items', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+
+    # строковое представление - товар и количество
+    def __str__(self):
+        return f'{self.product_id} x {self.quantity}'
@@ -0,0 +1,149 @@
+import base64
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+# keyset-пагинация: следующая страница выбирается условием по последней строке
+# (поле сортировки, id) вместо OFFSET и без запроса COUNT(*)
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        # строки-словари (.values()): поля сортировки нужны для курсора, даже если их нет в ответе
+        if queryset._fields:
+            missing = [name.lstrip('-') for name in self.ordering if name.lstrip('-') not in queryset._fields]
+            if missing:
+                queryset = queryset.values(*queryset._fields, *missing)
+        # объекты с .only(): поле сортировки догружается сразу, а не запросом на последней строке
+        else:
+            loaded, deferred = queryset.query.deferred_loading
+            if loaded and not deferred:
+                missing = [name.lstrip('-') for name in self.ordering
+                           if name.lstrip('-') not in loaded and self.is_model_field(queryset.model, name.lstrip('-'))]
+                if missing:
+                    queryset = queryset.only(*loaded, *missing)
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+
+        # берём на одну строку больше, чтобы понять, есть ли следующая страница
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_position = None
+        if self.has_next:
+            last = page[-1]
+            if isinstance(last, dict):
+                self.next_position = [last[name.lstrip('-')] for name in self.ordering]
+            else:
+                self.next_position = [getattr(last, name.lstrip('-')) for name in self.ordering]
+        return page
+
+    # сортировка запроса + уникальный id в конце, чтобы порядок был однозначным;
+    # id в том же направлении, что и первое поле - индекс (поле, id) читается
+    # в одну сторону без досортировки (TEMP B-TREE)
+    def get_ordering(self, queryset):
+        ordering = [name for name in queryset.query.order_by if isinstance(name, str)]
+        if not ordering:
+            ordering = list(queryset.model._meta.ordering or [])
+        ordering = [name.replace('pk', self.tiebreaker) if name.lstrip('-') == 'pk' else name
+                    for name in ordering]
+        if self.tiebreaker not in [name.lstrip('-') for name in ordering]:
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append(f'-{self.tiebreaker}' if descending else self.tiebreaker)
+        return ordering
+
+    # условие "строго после позиции" для составного ключа сортировки;
+    # нестрогое условие по первому полю отдельно - чтобы бд искала по индексу диапазоном
+    def keyset_filter(self, position):
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{lookup}': position[0]}) & condition
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if hasattr(value, 'isoformat')
+                  else str(value) if isinstance(value, Decimal) else value
+                  for value in position]
+        data = json.dumps({'o': self.ordering, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    # курсор привязан к сортировке: с другой сортировкой он недействителен
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if data['o'] != self.ordering or len(data['v']) != len(self.ordering):
+                raise ValueError
+            return [self.to_python(model, name.lstrip('-'), value)
+                    for name, value in zip(self.ordering, data['v'])]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def is_model_field(model, name):
+        try:
+            model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return True
+
+    # значение из курсора приводится к типу поля (аннотации остаются как есть)
+    def to_python(self, model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+# обычная постраничная пагинация, а при наличии параметра ?cursor= - keyset-режим
+class PageOrKeysetPagination(PageNumberPagination):
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view=view)
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
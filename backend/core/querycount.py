@@ -0,0 +1,112 @@
+import contextvars
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# одинаковые по форме запросы: списки IN (%s, %s, ...) любой длины считаются одним шаблоном
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def query_shape(sql):
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+# настройки бюджета: лимит по умолчанию, лимиты по имени маршрута и порог N+1
+def get_query_budget(view_name=None):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', 50))
+
+
+def get_n_plus_one_threshold():
+    return getattr(settings, 'N_PLUS_ONE_THRESHOLD', 10)
+
+
+# файлы, через которые проходит учёт запросов - их кадры в стек не попадают
+RECORDING_FILES = {__file__, os.path.join(os.path.dirname(__file__), 'metrics.py')}
+
+
+# место вызова запроса в коде проекта (без кадров django и сторонних пакетов)
+def project_stack(limit=6):
+    base = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base) and frame.filename not in RECORDING_FILES
+        and 'site-packages' not in frame.filename
+    ]
+    return ''.join(traceback.format_list(frames[-limit:]))
+
+
+# запись запросов к бд: количество, время, повторы одинаковых шаблонов
+# и (по желанию) стек первого вызова каждого шаблона
+class QueryRecorder:
+
+    def __init__(self, capture_stacks=False):
+        self.capture_stacks = capture_stacks
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.stacks = {}
+
+    def add(self, shape, seconds, stack):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[shape] += 1
+        if stack is not None and shape not in self.stacks:
+            self.stacks[shape] = stack
+
+    # шаблоны, повторённые не меньше порога раз - признак N+1
+    def repeated(self, threshold=None):
+        threshold = threshold or get_n_plus_one_threshold()
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    # описание нарушений: превышение бюджета и N+1
+    def problems(self, budget, threshold=None):
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f'{self.count} запросов к бд при бюджете {budget}')
+        for shape, count in self.repeated(threshold):
+            problem = f'N+1: {count} одинаковых запросов: {shape}'
+            if shape in self.stacks:
+                problem += '\n' + self.stacks[shape]
+            problems.append(problem)
+        return problems
+
+
+# активные записи (вложенные: middleware внутри теста); contextvar переходит в sync_to_async
+current_recorders = contextvars.ContextVar('current_recorders', default=())
+
+
+@contextmanager
+def recording(recorder):
+    token = current_recorders.set(current_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        current_recorders.reset(token)
+
+
+# запрос в активные записи; вызывается из обёртки выполнения запросов в metrics
+def record_query(recorders, sql, seconds):
+    stack = project_stack() if any(recorder.capture_stacks for recorder in recorders) else None
+    shape = query_shape(sql)
+    for recorder in recorders:
+        recorder.add(shape, seconds, stack)
+
+
+# утилита для тестов: блок должен уложиться в бюджет запросов и не содержать N+1
+# бюджет задаётся числом или берётся из QUERY_BUDGETS по имени маршрута
+@contextmanager
+def query_budget(max_queries=None, view_name=None, n_plus_one_threshold=None):
+    from .metrics import install_on_open_connections
+    install_on_open_connections()
+    budget = max_queries if max_queries is not None else get_query_budget(view_name)
+    recorder = QueryRecorder(capture_stacks=True)
+    with recording(recorder):
+        yield recorder
+    problems = recorder.problems(budget, n_plus_one_threshold)
+    if problems:
+        raise AssertionError('\n\n'.join(problems))
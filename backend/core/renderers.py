@@ -0,0 +1,56 @@
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+# orjson - необязательная зависимость: без неё JSON собирается стандартным json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# значения, которые orjson не кодирует сам (Decimal, ленивые строки, даты с усечением
+# до миллисекунд, QuerySet и т.п.) - через тот же JSONEncoder.default, что у DRF
+_default = encoders.JSONEncoder().default
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+# запасной вариант без orjson: кодировщик создаётся один раз, а не на каждый ответ
+_stdlib_encoders = {}
+
+
+def stdlib_encode(data, strict):
+    encode = _stdlib_encoders.get(strict)
+    if encode is None:
+        encode = _stdlib_encoders[strict] = encoders.JSONEncoder(
+            ensure_ascii=False, allow_nan=not strict, separators=(',', ':')
+        ).encode
+    return encode(data)
+
+
+# JSONRenderer на orjson с выводом как у DRF (компактный UTF-8, экранирование U+2028/U+2029,
+# те же Decimal, даты, UUID). Отличия: NaN и бесконечность orjson выводит как null,
+# а float с экспонентой - в короткой записи (1e16 и 1e-7 вместо 1e+16 и 1e-07).
+# Целые больше 64 бит orjson не кодирует - такие данные собираются стандартным json.
+# Отступы (application/json; indent=4, browsable API) и нестандартные настройки
+# UNICODE_JSON / COMPACT_JSON - через JSONRenderer DRF
+class FastJSONRenderer(renderers.JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact \
+                or self.encoder_class is not encoders.JSONEncoder:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if orjson is None:
+            return self.render_stdlib(data)
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except TypeError:
+            return self.render_stdlib(data)
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+    def render_stdlib(self, data):
+        ret = stdlib_encode(data, self.strict)
+        return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
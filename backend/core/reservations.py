@@ -0,0 +1,179 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Product, StockReservation, StockReservationItem
+from .signals import bulk_product_changes, products_changed
+from .aggregates import CategoryDeltas
+from .feed import stock_event
+
+logger = logging.getLogger(__name__)
+
+
+# время жизни резерва (сек), после которого он отменяется release_expired_reservations
+def reservation_ttl():
+    return getattr(settings, 'RESERVATION_TTL', 900)
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+# позиции резерва: одинаковые товары складываются, порядок - по id товара,
+# чтобы параллельные резервы блокировали строки в одном порядке
+def merge_items(items):
+    merged = {}
+    for item in items:
+        merged[item['product']] = merged.get(item['product'], 0) + item['quantity']
+    return sorted(merged.items())
+
+
+# списание или возврат остатка одним условным UPDATE: списание проходит,
+# только если на складе хватает - без чтения и гонки "прочитал 5, записал 4"
+def change_stock(product_id, delta):
+    queryset = Product.objects.filter(pk=product_id)
+    if delta < 0:
+        queryset = queryset.filter(quantity__gte=-delta)
+    return queryset.update(quantity=F('quantity') + delta) == 1
+
+
+# один раз за операцию: новые остатки читаются одним запросом и уходят
+# в агрегаты по категориям, ленту изменений и инвалидацию кэша каталога
+def stock_changed(deltas):
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    stats, events = CategoryDeltas(), []
+    for pk, category, price, quantity in Product.objects.filter(pk__in=list(deltas)).values_list(
+        'pk', 'category', 'price', 'quantity'
+    ):
+        stats.add_quantity(category, deltas[pk], price)
+        events.append(stock_event(pk, category, quantity))
+    products_changed(events=events, stats=stats)
+
+
+# резервирование партии заказов: каждый резерв - все позиции или ничего (savepoint),
+# вся партия - одна транзакция; requests - пары (index, позиции {'product', 'quantity'}),
+# owner - пользователь, за которым закрепляются резервы
+# возвращает (созданные резервы [(index, reservation)], отказы [(index, позиции без остатка)])
+def reserve(requests, ttl=None, owner=None):
+    expires_at = timezone.now() + timedelta(seconds=reservation_ttl() if ttl is None else ttl)
+    reserved, failed, deltas = [], [], {}
+    with transaction.atomic(), bulk_product_changes():
+        for index, items in requests:
+            items = merge_items(items)
+            try:
+                with transaction.atomic():
+                    for product_id, quantity in items:
+                        if not change_stock(product_id, -quantity):
+                            raise InsufficientStock
+            except InsufficientStock:
+                failed.append((index, describe_shortage(items)))
+                continue
+            for product_id, quantity in items:
+                deltas[product_id] = deltas.get(product_id, 0) - quantity
+            reserved.append((index, StockReservation(id=uuid.uuid4(), owner=owner, expires_at=expires_at), items))
+
+        if reserved:
+            StockReservation.objects.bulk_create([reservation for _, reservation, _ in reserved])
+            StockReservationItem.objects.bulk_create([
+                StockReservationItem(reservation=reservation, product_id=product_id, quantity=quantity)
+                for _, reservation, items in reserved
+                for product_id, quantity in items
+            ])
+        stock_changed(deltas)
+
+    logger.info("[STOCK] зарезервировано %s, отказано %s", len(reserved), len(failed))
+    return [(index, reservation) for index, reservation, _ in reserved], failed
+
+
+# позиции отказанного резерва, на которые не хватило остатка (available None - товара нет);
+# читается в момент отказа - запрос только на этом пути
+def describe_shortage(items):
+    available = dict(Product.objects.filter(pk__in=[pk for pk, _ in items]).values_list('pk', 'quantity'))
+    return [
+        {"product": product_id, "requested": quantity, "available": available.get(product_id)}
+        for product_id, quantity in items
+        if available.get(product_id, 0) < quantity
+    ]
+
+
+# перевод резервов из reserved в committed или released; при отмене остаток возвращается;
+# повторный вызов для того же резерва ничего не меняет; owner - только резервы этого пользователя
+# возвращает (обработанные id, ошибки [(id, причина)])
+def finish(ids, status, expired_only=False, owner=None):
+    now = timezone.now()
+    done, errors = [], []
+    with transaction.atomic(), bulk_product_changes():
+        queryset = StockReservation.objects.select_for_update().filter(pk__in=ids)
+        if owner is not None:
+            queryset = queryset.filter(owner=owner)
+        reservations = {reservation.pk: reservation for reservation in queryset}
+        for pk in ids:
+            reservation = reservations.get(pk)
+            if reservation is None:
+                errors.append((pk, "Резерв не найден"))
+            elif reservation.status == status:
+                done.append(pk)
+            elif reservation.status != StockReservation.RESERVED:
+                errors.append((pk, f"Резерв уже {reservation.get_status_display().lower()}"))
+            elif status == StockReservation.COMMITTED and reservation.expires_at <= now:
+                errors.append((pk, "Срок резерва истёк"))
+            elif expired_only and reservation.expires_at > now:
+                errors.append((pk, "Срок резерва не истёк"))
+            else:
+                done.append(pk)
+
+        # условие по статусу - резерв не переводится дважды, даже если select_for_update не блокирует (sqlite);
+        # остаток возвращается только по резервам, статус которых сменил этот вызов
+        pending = [pk for pk in done if reservations[pk].status == StockReservation.RESERVED]
+        changed = [
+            pk for pk in pending
+            if StockReservation.objects.filter(pk=pk, status=StockReservation.RESERVED).update(status=status)
+        ]
+        lost = set(pending).difference(changed)
+        if lost:
+            done = [pk for pk in done if pk not in lost]
+            errors += [(pk, "Резерв изменён параллельным запросом") for pk in pending if pk in lost]
+        if status == StockReservation.RELEASED and changed:
+            returned = (
+                StockReservationItem.objects.filter(reservation__in=changed)
+                .values_list('product').annotate(total=Sum('quantity')).order_by('product')
+            )
+            deltas = {}
+            for product_id, quantity in returned:
+                change_stock(product_id, quantity)
+                deltas[product_id] = quantity
+            stock_changed(deltas)
+
+    logger.info("[STOCK] %s: %s резервов, ошибок %s", status, len(done), len(errors))
+    return done, errors
+
+
+def release(ids, owner=None):
+    return finish(ids, StockReservation.RELEASED, owner=owner)
+
+
+def commit(ids, owner=None):
+    return finish(ids, StockReservation.COMMITTED, owner=owner)
+
+
+# отмена истёкших резервов партиями; возвращает, сколько отменено
+def release_expired(batch_size=500):
+    released = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(status=StockReservation.RESERVED, expires_at__lte=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return released
+        done, _ = finish(ids, StockReservation.RELEASED, expired_only=True)
+        released += len(done)
+        if len(ids) < batch_size:
+            return released
@@ -0,0 +1,108 @@
+import contextvars
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# чтение с основной бд: запрос уже писал (read-your-writes) или клиент недавно писал
+primary_pinned = contextvars.ContextVar('primary_pinned', default=False)
+# в текущем запросе была запись - клиенту ставится cookie закрепления
+wrote_to_primary = contextvars.ContextVar('wrote_to_primary', default=False)
+
+# как часто перепроверять отставание реплики (сек)
+LAG_CHECK_INTERVAL = 1.0
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+# время последнего изменения файла sqlite с учётом журнала WAL
+def sqlite_mtime(path):
+    mtimes = []
+    for name in (path, f'{path}-wal'):
+        try:
+            mtimes.append(os.stat(name).st_mtime)
+        except OSError:
+            pass
+    return max(mtimes) if mtimes else None
+
+
+# отставание реплики в секундах (None - неизвестно, реплику не используем):
+# реплика - копия файла основной бд, обновляемая командой sync_read_replicas;
+# если основная бд менялась после копирования, отставание - время с момента копирования
+def measure_lag(alias):
+    primary = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    replica = connections[alias].settings_dict['NAME']
+    if str(primary) == str(replica):
+        return 0.0
+    return files_lag(primary, replica)
+
+
+def files_lag(primary, replica):
+    primary_mtime, replica_mtime = sqlite_mtime(primary), sqlite_mtime(replica)
+    if primary_mtime is None or replica_mtime is None:
+        return None
+    if primary_mtime <= replica_mtime:
+        return 0.0
+    return max(time.time() - replica_mtime, 0.0)
+
+
+_lag_cache = {}
+_lag_lock = threading.Lock()
+
+
+def replica_lag(alias):
+    now = time.monotonic()
+    cached = _lag_cache.get(alias)
+    if cached is not None and now - cached[0] < LAG_CHECK_INTERVAL:
+        return cached[1]
+    lag = measure_lag(alias)
+    with _lag_lock:
+        _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def fresh_replicas():
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG', 5.0)
+    fresh = []
+    for alias in replica_aliases():
+        lag = replica_lag(alias)
+        if lag is not None and lag <= max_lag:
+            fresh.append(alias)
+    return fresh
+
+
+# роутер: чтение моделей каталога (REPLICA_MODELS) - со случайной свежей реплики,
+# всё остальное и любые записи - с основной бд
+class ReadReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if primary_pinned.get() or model._meta.label_lower not in getattr(settings, 'REPLICA_MODELS', ()):
+            return None
+        # внутри транзакции читаем то, что в ней же записано
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        fresh = fresh_replicas()
+        return random.choice(fresh) if fresh else None
+
+    def db_for_write(self, model, **hints):
+        primary_pinned.set(True)
+        wrote_to_primary.set(True)
+        return DEFAULT_DB_ALIAS
+
+    # реплики - копии основной бд, связи между объектами из них допустимы
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    # схема реплик приходит вместе с копией - миграции только на основной бд
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
@@ -0,0 +1,115 @@
+import re
+
+from django.apps import apps
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+# полнотекстовые индексы SQLite FTS5: модель -> (таблица индекса, индексируемые поля)
+SEARCH_INDEXES = {
+    'core.product': ('core_product_fts', ['name', 'description', 'category']),
+    'core.item': ('core_item_fts', ['title', 'description']),
+}
+
+
+# SQL для создания индекса и триггеров, которые держат его в актуальном состоянии
+# (триггеры срабатывают и для bulk_create/update, в отличие от сигналов)
+def search_index_sql(content_table, fts_table, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{cols}, content='{content_table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        # изменение цены или количества индекс не трогает
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+
+def drop_search_index_sql(fts_table):
+    return [
+        f"DROP TRIGGER IF EXISTS {fts_table}_ai",
+        f"DROP TRIGGER IF EXISTS {fts_table}_ad",
+        f"DROP TRIGGER IF EXISTS {fts_table}_au",
+        f"DROP TABLE IF EXISTS {fts_table}",
+    ]
+
+
+# создание всех индексов (только для SQLite) и, по желанию, их перестроение
+def install_search_indexes(using_connection=None, rebuild=False, get_model=apps.get_model):
+    conn = using_connection or connection
+    if conn.vendor != 'sqlite':
+        return []
+    installed = []
+    existing = set(conn.introspection.table_names())
+    with conn.cursor() as cursor:
+        for label, (fts_table, columns) in SEARCH_INDEXES.items():
+            model = get_model(label)
+            # таблицы модели ещё (или уже) нет - индексировать нечего
+            if model._meta.db_table not in existing:
+                continue
+            for sql in search_index_sql(model._meta.db_table, fts_table, columns):
+                cursor.execute(sql)
+            if rebuild:
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+            installed.append(fts_table)
+    return installed
+
+
+# после миграций заново создаём триггеры: SQLite при пересоздании таблицы
+# (например, AddField с unique) удаляет её триггеры вместе со старой таблицей
+def ensure_search_indexes(sender, using='default', **kwargs):
+    install_search_indexes(connections[using])
+
+
+def uninstall_search_indexes(using_connection=None):
+    conn = using_connection or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for fts_table, _ in SEARCH_INDEXES.values():
+            for sql in drop_search_index_sql(fts_table):
+                cursor.execute(sql)
+
+
+# строка запроса FTS5: каждое слово ищется по префиксу, все слова обязательны
+def build_match_query(terms):
+    words = []
+    for term in terms:
+        words.extend(re.findall(r'\w+', term))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# замена SearchFilter: на SQLite ищет по FTS5-индексу с ранжированием bm25,
+# на других бд ведёт себя как обычный SearchFilter
+class FullTextSearchFilter(filters.SearchFilter):
+
+    def filter_queryset(self, request, queryset, view):
+        index = SEARCH_INDEXES.get(queryset.model._meta.label_lower)
+        if index is None or connection.vendor != 'sqlite':
+            return super().filter_queryset(request, queryset, view)
+
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        match = build_match_query(terms)
+        if not match:
+            return queryset.none()
+
+        fts_table = index[0]
+        table = queryset.model._meta.db_table
+        queryset = queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", [match]
+        )).annotate(search_rank=RawSQL(
+            f"SELECT bm25({fts_table}) FROM {fts_table} "
+            f"WHERE {fts_table} MATCH %s AND rowid = {table}.id", [match]
+        ))
+        # лучшие совпадения первыми; явная ?ordering= переопределит это в OrderingFilter
+        return queryset.order_by('search_rank', 'id')
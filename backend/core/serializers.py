@@ -1,9 +1,55 @@
+from decimal import Decimal
+
+from django.conf import settings
 from rest_framework import serializers
 from .models import Item
 from .models import Product
+from .models import UploadSession
+from .models import CategoryStats
+from .models import StockReservation, StockReservationItem
+
+# разбор ?fields= / ?exclude= (имена через запятую): поля ответа из available
+# в их исходном порядке; None - ограничений нет
+def requested_fields(query_params, available):
+    def names(param):
+        value = query_params.get(param)
+        if not value:
+            return None
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    fields, exclude = names('fields'), names('exclude')
+    if fields is None and exclude is None:
+        return None
+    unknown = [name for name in (fields or []) + (exclude or []) if name not in available]
+    if unknown:
+        raise serializers.ValidationError({"fields": [f"Неизвестные поля: {', '.join(unknown)}"]})
+    selected = [
+        name for name in available
+        if (fields is None or name in fields) and name not in (exclude or ())
+    ]
+    if not selected:
+        raise serializers.ValidationError({"fields": ["Не выбрано ни одного поля"]})
+    return selected
+
+
+# сериализатор, который в ответах на GET оставляет только поля из ?fields= / ?exclude=
+# (запрос берётся из context['request'])
+class SparseFieldsMixin:
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        selected = requested_fields(request.query_params, list(self.fields))
+        if selected is not None:
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
+
 
 # cериализатор для модели Item - преобразует объекты в JSON и обратно
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Item
         fields = ['id', 'title', 'description', 'created_at']
@@ -40,7 +86,92 @@ class FileUploadSerializer(serializers.Serializer):
         return f
 
 # сериализатор для модели Product — автоматом берёт все поля
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+    # в бд пишутся только присланные поля: PATCH цены не перезаписывает остаток,
+    # списанный резервами после чтения товара
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+# сериализатор агрегатов категории: стоимость запасов - строкой с двумя знаками, как цена
+class CategoryStatsSerializer(serializers.ModelSerializer):
+    inventory_value = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CategoryStats
+        fields = ['category', 'product_count', 'total_quantity', 'inventory_value']
+
+    def get_inventory_value(self, obj):
+        return f'{Decimal(obj.inventory_value_cents) / 100:.2f}'
+
+# сериализатор строки импорта: артикул обязателен, проверка уникальности
+# не делается - существующий товар с тем же артикулом будет обновлён
+class ProductImportRowSerializer(ProductSerializer):
+    class Meta(ProductSerializer.Meta):
+        extra_kwargs = {
+            'sku': {'required': True, 'allow_null': False, 'allow_blank': False, 'validators': []},
+        }
+
+# сериализатор для загрузки файла каталога (CSV или NDJSON, без ограничения размера)
+class ProductImportSerializer(serializers.Serializer):
+    file = serializers.FileField(
+        help_text="Файл каталога: .csv или .ndjson/.jsonl, товары сопоставляются по sku"
+    )
+
+
+# сериализатор для начала загрузки большого файла по частям
+class UploadSessionSerializer(serializers.ModelSerializer):
+    checksum = serializers.RegexField(
+        r'^[0-9a-f]{64}$', required=False, allow_blank=True,
+        help_text="Ожидаемый sha256 всего файла (hex), проверяется при завершении"
+    )
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'checksum', 'sha256', 'content_type',
+                  'created_at', 'completed_at']
+        read_only_fields = ['id', 'offset', 'sha256', 'content_type', 'created_at', 'completed_at']
+
+    # ограничиваем размер всего файла
+    def validate_size(self, size):
+        if size <= 0 or size > settings.UPLOAD_MAX_BYTES:
+            raise serializers.ValidationError(f"Размер файла должен быть от 1 до {settings.UPLOAD_MAX_BYTES} байт.")
+        return size
+
+
+# позиция резерва во входных данных: id товара без проверки существования
+# (её делает условный UPDATE при списании) и количество
+class ReservationItemInputSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+# один резерв: список позиций, списываются все или ни одной
+class ReservationRequestSerializer(serializers.Serializer):
+    items = ReservationItemInputSerializer(many=True, allow_empty=False)
+
+
+# список id резервов для подтверждения или отмены
+class ReservationIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+
+
+# сериализаторы резерва и его позиций для ответов
+class StockReservationItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockReservationItem
+        fields = ['product', 'quantity']
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    items = StockReservationItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'status', 'created_at', 'expires_at', 'items']
@@ -1,28 +1,97 @@
-from django.db.models.signals import post_save, post_delete
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from .models import Product
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-
-# функция для отправки актуального количества товаров всем подключённым по WebSocket
-def broadcast_product_count():
-    channel_layer = get_channel_layer()
-    from .models import Product
-    count = Product.objects.count()
-    async_to_sync(channel_layer.group_send)(
-        "products",
-        {
-            "type": "product_count_update",
-            "count": count,
-        }
-    )
+from .aggregates import STAT_FIELDS, CategoryDeltas
+from .broadcast import broadcaster
+from .cache import invalidate_catalog
+from .feed import created_event, deleted_event, feed, updated_event
+
+# состояние потока: внутри массовой операции построчные сигналы не обрабатываются
+_state = threading.local()
+
+
+# контекст массовой операции - обработчики сигналов молчат,
+# а вызывающий код один раз сообщает об изменениях через products_changed
+@contextmanager
+def bulk_product_changes():
+    _state.muted = getattr(_state, 'muted', 0) + 1
+    try:
+        yield
+    finally:
+        _state.muted -= 1
+
+
+def _muted():
+    return getattr(_state, 'muted', 0) > 0
+
+
+# одно агрегированное уведомление об изменении каталога
+# events - события для ленты изменений товаров, stats - приращения агрегатов по категориям
+def products_changed(delta=0, events=(), stats=None):
+    if stats is not None:
+        stats.apply()
+    invalidate_catalog()
+    if delta:
+        broadcaster.change(delta)
+    feed.publish(events)
+
+# прежние значения товара для агрегатов - из строки в бд, прочитанной под блокировкой
+# в транзакции записи (Product.save / delete), а не из объекта: его значения могли устареть
+# после параллельного изменения; заодно дочитываются отложенные поля для ленты изменений;
+# False - строки в бд нет
+def _load_previous(instance, using, fields=None):
+    if instance.pk is None or (fields is not None and not set(STAT_FIELDS) & set(fields)):
+        return True
+    before = instance.loaded_values() or {}
+    columns = dict.fromkeys([
+        *STAT_FIELDS,
+        *(field.attname for field in instance._meta.concrete_fields if field.attname not in before),
+    ])
+    row = Product.objects.using(using).select_for_update().filter(pk=instance.pk).values(*columns).first()
+    if row is None:
+        return False
+    before.update(row)
+    instance._loaded_values = (list(before), list(before.values()))
+    return True
+
+
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance, using, update_fields=None, **kwargs):
+    if not _muted():
+        _load_previous(instance, using, update_fields)
 
 # cигнальный обработчик - вызывается каждый раз при создании или изменении Product
+# количество меняется только при создании, обновление ничего не рассылает
 @receiver(post_save, sender=Product)
-def product_saved(sender, instance, created, **kwargs):
-    broadcast_product_count()
+def product_saved(sender, instance, created, update_fields=None, **kwargs):
+    if _muted():
+        return
+    stats = CategoryDeltas()
+    if created:
+        stats.add_product(instance)
+    else:
+        # до updated_event - он запоминает новые значения как прежние
+        stats.change(instance.loaded_values(), instance, update_fields)
+    event = created_event(instance) if created else updated_event(instance, update_fields)
+    products_changed(1 if created else 0, [event], stats)
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, using, **kwargs):
+    if not _muted():
+        # строку уже удалил параллельный запрос - это удаление ничего не меняет
+        instance._row_missing = not _load_previous(instance, using)
 
 # cигнальный обработчик - вызывается каждый раз при удалении Product
 @receiver(post_delete, sender=Product)
 def product_deleted(sender, instance, **kwargs):
-    broadcast_product_count()
+    if _muted() or getattr(instance, '_row_missing', False):
+        return
+    # вычитается то, что было в бд, а не несохранённые изменения объекта
+    before = instance.loaded_values() or {}
+    stats = CategoryDeltas()
+    stats.add(*(before[name] if name in before else getattr(instance, name) for name in STAT_FIELDS), sign=-1)
+    products_changed(-1, [deleted_event(instance.pk, instance.category)], stats)
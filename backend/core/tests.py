@@ -1,9 +1,64 @@
+import asyncio
+import contextvars
+import csv
+import datetime
+import gzip
+import hashlib
+import importlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from decimal import Decimal
+import io
+import json
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.apps import apps as django_apps
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import HttpResponse, QueryDict
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.core.cache import cache, caches
+from django.db import connection, connections
+from django.db.backends.sqlite3 import base as sqlite_backend
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
 
-from .models import Item
+from .models import CategoryStats, Item, Product, StockReservation, UploadSession
+from . import uploads
+from . import routers
+from .metrics import _count_queries, request_metrics
+from .middleware import LoggingMiddleware, ReplicaPinningMiddleware
+from .querycount import query_budget, query_shape
+from .broadcast import broadcaster, ProductCountBroadcaster
+from .channel_layers import SQLiteChannelLayer
+from .consumers import ProductCountConsumer, ProductFeedConsumer
+from .websocket import ManagedWebsocketConsumer, websocket_stats
+from .feed import FEED_GROUP, feed
+from .cache import CATALOG_VERSION_KEY, CatalogCacheMixin
+from .pagination import KeysetPagination
+from .reservations import release
+from .serializers import ProductSerializer
+from . import renderers
+from .parsers import FastJSONParser
 
 class ItemAPITestCase(APITestCase):
     def setUp(self):
@@ -81,3 +136,1556 @@ class ItemAPITestCase(APITestCase):
         url = reverse('item-detail', kwargs={'pk': item.pk})
         response = self.auth_client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+# тесты рассылки количества товаров
+class ProductCountBroadcasterTests(TestCase):
+
+    def setUp(self):
+        broadcaster.reset()
+        self.addCleanup(broadcaster.reset)
+
+    # после создания и удаления рассылается количество из бд, обновление ничего не рассылает
+    def test_count_after_changes(self):
+        sent = []
+        with mock.patch.object(broadcaster, '_send', sent.append):
+            with self.captureOnCommitCallbacks(execute=True):
+                product = Product.objects.create(name='A', price='1.00')
+            self.assertEqual(broadcaster.count, 1)
+
+            with mock.patch.object(broadcaster, 'apply_delta') as apply_delta:
+                with self.captureOnCommitCallbacks(execute=True):
+                    product.name = 'B'
+                    product.save()
+            apply_delta.assert_not_called()
+
+            broadcaster.reset()
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.create(name='C', price='2.00')
+        self.assertEqual(sent, [1, 2])
+
+    # изменения из других процессов (мимо счётчика этого) попадают в рассылку
+    def test_count_includes_other_processes(self):
+        local = ProductCountBroadcaster(window=0)
+        self.addCleanup(local.reset)
+        sent = []
+        with mock.patch.object(local, '_send', sent.append):
+            local.apply_delta(1)
+            Product.objects.bulk_create([Product(name=f'P{i}', price='1.00') for i in range(3)])
+            local.apply_delta(-1)
+        self.assertEqual(sent, [0, 3])
+
+    # изменения этого процесса сдвигают снимок для новых подключений без запроса к бд
+    def test_delta_updates_snapshot(self):
+        local = ProductCountBroadcaster(window=60)
+        self.addCleanup(local.reset)
+        with mock.patch.object(local, '_send'):
+            Product.objects.create(name='A', price='1.00')
+            local.apply_delta(1)
+            self.assertEqual(local.cached_count(), 1)
+            Product.objects.create(name='B', price='1.00')
+            with self.assertNumQueries(0):
+                local.apply_delta(1)
+                self.assertEqual(local.cached_count(), 2)
+                local.apply_delta(-1)
+                self.assertEqual(local.cached_count(), 1)
+
+    # частые изменения склеиваются в одну отправку за окно
+    def test_burst_is_coalesced(self):
+        local = ProductCountBroadcaster(window=60)
+        self.addCleanup(local.reset)
+        Product.objects.bulk_create([Product(name=f'P{i}', price='1.00') for i in range(10)])
+        sent = []
+        with mock.patch.object(local, '_send', sent.append), self.assertNumQueries(1):
+            for _ in range(10):
+                local.apply_delta(1)
+
+        self.assertEqual(sent, [10])
+        self.assertEqual(local.stats()['suppressed'], 8)
+
+
+# тесты кэширования списка и детального просмотра каталога
+class ProductCatalogCacheTests(APITestCase):
+
+    def setUp(self):
+        # общий кэш - файловый во временном каталоге, как у нескольких процессов сервера
+        shared_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared_dir, ignore_errors=True)
+        override = self.settings(CACHES={
+            **settings.CACHES,
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': shared_dir},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.product = Product.objects.create(name='Phone', price='100.00', category='tech')
+
+    # повторный запрос отдаётся из кэша, порядок параметров не важен
+    def test_list_is_cached(self):
+        url = reverse('product-list')
+        first = self.client.get(url + '?category=tech&ordering=price')
+        self.assertEqual(first['X-Cache'], 'MISS')
+
+        second = self.client.get(url + '?ordering=price&category=tech')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    # совпадающий If-None-Match даёт 304
+    def test_etag_not_modified(self):
+        url = reverse('product-detail', kwargs={'pk': self.product.pk})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    # версия каталога общая для процессов: изменение в другом процессе инвалидирует ответы этого
+    def test_version_shared_between_processes(self):
+        url = reverse('product-list')
+        etag = self.client.get(url)['ETag']
+        caches.create_connection('shared').incr(CATALOG_VERSION_KEY)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    # изменение товара инвалидирует закэшированные ответы
+    def test_invalidated_on_change(self):
+        url = reverse('product-list')
+        etag = self.client.get(url)['ETag']
+
+        Product.objects.create(name='Laptop', price='900.00', category='tech')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['count'], 2)
+
+
+# тесты keyset-пагинации
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(KeysetPagination, 'page_size', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # обход всех страниц по ссылке next
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    # item сортируются по (-created_at, -id), одинаковые даты не теряются
+    def test_items_walk(self):
+        items = [Item.objects.create(title=f'Item {i}') for i in range(5)]
+        same = items[0].created_at
+        Item.objects.filter(pk__in=[items[1].pk, items[2].pk, items[3].pk]).update(created_at=same)
+
+        url = reverse('item-list-create') + '?cursor='
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        expected = list(Item.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk(url), expected)
+
+    # товары сортируются по выбранному полю и id, новые строки не сдвигают страницы
+    def test_products_walk_with_ordering(self):
+        for i, price in enumerate(['5.00', '1.00', '5.00', '3.00', '5.00']):
+            Product.objects.create(name=f'P{i}', price=price)
+
+        url = reverse('product-list') + '?ordering=-price&cursor='
+        first = self.client.get(url).data
+        Product.objects.create(name='Cheap', price='0.50')
+        ids = [row['id'] for row in first['results']] + self.walk(first['next'])
+
+        expected = list(Product.objects.order_by('-price', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    # испорченный курсор даёт 404
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('product-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # страница по фильтру и сортировке берётся из индекса, без сортировки в памяти
+    def test_keyset_page_uses_index(self):
+        paginator = KeysetPagination()
+        paginator.ordering = paginator.get_ordering(Product.objects.order_by('price'))
+        queryset = Product.objects.filter(category='c1').order_by(*paginator.ordering)
+        plan = queryset.filter(paginator.keyset_filter(['10.00', 5]))[:2].explain()
+        self.assertIn('product_category_price_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+        paginator.ordering = paginator.get_ordering(Item.objects.order_by('-created_at'))
+        self.assertEqual(paginator.ordering, ['-created_at', '-id'])
+        plan = Item.objects.order_by(*paginator.ordering).filter(
+            paginator.keyset_filter([timezone.now(), 5])
+        )[:2].explain()
+        self.assertIn('item_created_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+# тесты полнотекстового поиска
+class FullTextSearchTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.phone = Product.objects.create(name='Смартфон Galaxy', price='500.00', category='phones')
+        self.case = Product.objects.create(name='Чехол', description='Чехол для смартфона', price='10.00')
+        Product.objects.create(name='Ноутбук', price='900.00', category='laptops')
+
+    def search(self, term):
+        response = self.client.get(reverse('product-list'), {'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    # поиск по префиксу слова во всех полях, все слова обязательны
+    def test_prefix_search(self):
+        self.assertCountEqual(self.search('смартф'), [self.phone.pk, self.case.pk])
+        self.assertEqual(self.search('смартф galax'), [self.phone.pk])
+        self.assertEqual(self.search('lapt'), [Product.objects.get(name='Ноутбук').pk])
+
+    # индекс обновляется триггерами и при массовом update
+    def test_index_follows_updates(self):
+        Product.objects.filter(pk=self.case.pk).update(name='Бампер', description='')
+        self.assertEqual(self.search('чехол'), [])
+        self.assertEqual(self.search('бампер'), [self.case.pk])
+
+        self.phone.delete()
+        self.assertEqual(self.search('galaxy'), [])
+
+    # поиск по item работает через тот же фильтр
+    def test_item_search(self):
+        item = Item.objects.create(title='Купить молоко', description='2 литра')
+        Item.objects.create(title='Позвонить маме')
+        response = self.client.get(reverse('item-list-create'), {'search': 'молок'})
+        self.assertEqual([row['id'] for row in response.data['results']], [item.pk])
+
+    # перестроение индекса командой, результаты с курсором идут по рангу
+    def test_rebuild_command_and_cursor(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.client.get(reverse('product-list'), {'search': 'смартф', 'cursor': ''})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+
+# тесты массовых операций с товарами
+class ProductBulkTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        broadcaster.reset()
+        self.addCleanup(broadcaster.reset)
+        self.url = reverse('product-bulk')
+
+    # создание списком: валидные строки пишутся, ошибки возвращаются по номеру строки
+    def test_bulk_create_with_row_errors(self):
+        rows = [
+            {'name': 'A', 'price': '1.00', 'quantity': 3},
+            {'name': 'B', 'price': 'abc'},
+            {'name': 'C', 'price': '2.50'},
+        ]
+        with mock.patch.object(broadcaster, 'change') as change:
+            response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertEqual(Product.objects.count(), 2)
+        change.assert_called_once_with(2)
+
+    # частичное обновление списком одним запросом bulk_update
+    def test_bulk_update(self):
+        a = Product.objects.create(name='A', price='1.00', quantity=1)
+        b = Product.objects.create(name='B', price='2.00', quantity=2)
+        rows = [
+            {'id': a.pk, 'quantity': 10},
+            {'id': b.pk, 'price': '3.00'},
+            {'id': 999999, 'quantity': 1},
+        ]
+        response = self.client.patch(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], [a.pk, b.pk])
+        self.assertEqual(response.data['errors'][0]['index'], 2)
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.quantity, str(b.price)), (10, '3.00'))
+
+    # повтор sku в запросе и занятый sku - ошибки строк; проверка sku - один запрос на все строки
+    def test_bulk_create_duplicate_sku(self):
+        Product.objects.create(sku='TAKEN', name='Old', price='1.00')
+        rows = [{'sku': f'S-{i}', 'name': f'P{i}', 'price': '1.00'} for i in range(20)]
+        rows += [{'sku': 'S-0', 'name': 'Again', 'price': '1.00'}, {'sku': 'TAKEN', 'name': 'X', 'price': '1.00'}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['created']), 20)
+        self.assertEqual([error['index'] for error in response.data['errors']], [20, 21])
+        self.assertEqual(sum('"sku" IN' in query['sql'] for query in queries.captured_queries), 1)
+
+    # повтор id - ошибка строки, агрегаты меняются один раз; свой же sku можно прислать снова
+    def test_bulk_update_duplicate_id_and_own_sku(self):
+        a = Product.objects.create(sku='A', name='A', price='1.00', quantity=1, category='tech')
+        rows = [
+            {'id': a.pk, 'sku': 'A', 'quantity': 5},
+            {'id': a.pk, 'quantity': 7},
+        ]
+        response = self.client.patch(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], [a.pk])
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': {'id': ['Товар повторяется в запросе']}}])
+        self.assertEqual(Product.objects.get(pk=a.pk).quantity, 5)
+        self.assertEqual(CategoryStats.objects.get(category='tech').total_quantity, 5)
+
+        b = Product.objects.create(sku='B', name='B', price='1.00')
+        response = self.client.patch(self.url, [{'id': b.pk, 'sku': 'A'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('sku', response.data['errors'][0]['errors'])
+
+    # удаление по списку id с одним уведомлением
+    def test_bulk_delete(self):
+        ids = [Product.objects.create(name=f'P{i}', price='1.00').pk for i in range(3)]
+        with mock.patch.object(broadcaster, 'change') as change:
+            response = self.client.delete(self.url, {'ids': ids[:2]}, format='json')
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(Product.objects.count(), 1)
+        change.assert_called_once_with(-2)
+
+        response = self.client.delete(self.url, {'ids': 'all'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# тесты потоковой выгрузки каталога
+class ProductExportTests(APITestCase):
+
+    def setUp(self):
+        Product.objects.create(name='Phone', description='Умный, "новый"', price='100.50', category='tech', quantity=2)
+        Product.objects.create(name='Chair', price='20.00', category='home')
+
+    def export(self, export_format, params=None, **headers):
+        url = reverse('product-export', kwargs={'export_format': export_format})
+        response = self.client.get(url, params or {}, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    # NDJSON учитывает фильтры списка, цена - строкой как в API
+    def test_ndjson_with_filter(self):
+        response, body = self.export('ndjson', {'category': 'tech'})
+        rows = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['price'], '100.50')
+        self.assertEqual(rows[0]['description'], 'Умный, "новый"')
+
+    # CSV с заголовком и сжатием gzip
+    def test_csv_gzip(self):
+        response, body = self.export('csv', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = list(csv.reader(io.StringIO(gzip.decompress(body).decode('utf-8'))))
+        self.assertEqual(rows[0], ['id', 'sku', 'name', 'description', 'price', 'category', 'quantity'])
+        self.assertEqual([row[2] for row in rows[1:]], ['Phone', 'Chair'])
+
+        # gzip;q=0 - отказ от сжатия
+        response, body = self.export('csv', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(body.startswith(b'id,sku'))
+
+    # под ASGI поток асинхронный: куски отдаются по мере чтения, а не списком целиком
+    async def test_asgi_stream(self):
+        url = reverse('product-export', kwargs={'export_format': 'ndjson'})
+        # по куску на строку
+        with mock.patch('core.export.buffered', lambda lines: (line.encode('utf-8') for line in lines)):
+            response = await self.async_client.get(url)
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual([json.loads(chunk)['name'] for chunk in chunks], ['Phone', 'Chair'])
+
+
+# тесты импорта каталога из файла
+class ProductImportTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('product-import')
+        Product.objects.create(sku='A-1', name='Old', price='1.00', quantity=1)
+
+    def upload(self, name, content):
+        f = SimpleUploadedFile(name, content.encode('utf-8'))
+        return self.client.post(self.url, {'file': f}, format='multipart')
+
+    # CSV: существующий sku обновляется, новый создаётся, ошибки - с номером строки
+    def test_csv_upsert(self):
+        content = (
+            'sku,name,price,quantity,category\n'
+            'A-1,Updated,2.00,5,tech\n'
+            'B-2,New,3.00,,\n'
+            ',No sku,1.00,1,\n'
+            'C-3,Bad price,abc,1,\n'
+        )
+        response = self.upload('catalog.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.data
+        self.assertEqual((report['processed'], report['created'], report['updated'], report['failed']), (4, 1, 1, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4])
+
+        updated = Product.objects.get(sku='A-1')
+        self.assertEqual((updated.name, updated.quantity, updated.category), ('Updated', 5, 'tech'))
+        self.assertEqual(Product.objects.get(sku='B-2').quantity, 0)
+
+    # NDJSON: повтор sku в одной партии - берётся последняя строка
+    def test_ndjson(self):
+        content = (
+            '{"sku": "N-1", "name": "First", "price": "1.50"}\n'
+            '\n'
+            '{"sku": "N-1", "name": "Second", "price": "1.75"}\n'
+            'not json\n'
+        )
+        response = self.upload('catalog.ndjson', content)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(Product.objects.get(sku='N-1').name, 'Second')
+
+        response = self.upload('catalog.xlsx', content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # колонки, которых нет в файле, у существующих товаров не меняются
+    def test_partial_columns_keep_other_fields(self):
+        Product.objects.create(sku='K1', name='Old', price='1.00', quantity=50, description='long', category='tech')
+        response = self.upload('prices.csv', 'sku,name,price\nK1,A,2.00\n')
+        self.assertEqual(response.data['updated'], 1)
+        product = Product.objects.get(sku='K1')
+        self.assertEqual((product.name, product.price, product.quantity, product.description),
+                         ('A', Decimal('2.00'), 50, 'long'))
+        stats = CategoryStats.objects.get(category='tech')
+        self.assertEqual((stats.total_quantity, stats.inventory_value_cents), (50, 10000))
+
+
+# тесты async-версий read-эндпоинтов: ответ совпадает с sync-версией
+class AsyncReadViewsTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(3):
+            Item.objects.create(title=f'Item {i}', description='Desc')
+        self.product = Product.objects.create(name='Phone', price='10.50', category='tech')
+        Product.objects.create(name='Chair', price='3.00', category='home')
+
+    async def test_lists_match_sync(self):
+        for sync_url, async_url, params in [
+            ('/api/items/', '/api/async/items/', {}),
+            ('/api/products/', '/api/async/products/', {'category': 'tech'}),
+            ('/api/products/', '/api/async/products/', {'ordering': '-price'}),
+            ('/api/items/', '/api/async/items/', {'exclude': 'description'}),
+            ('/api/products/', '/api/async/products/', {'fields': 'name,price', 'ordering': 'price'}),
+        ]:
+            expected = await sync_to_async(self.client.get)(sync_url, params)
+            response = await self.async_client.get(async_url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json(), expected.json())
+
+    async def test_detail_and_ping(self):
+        response = await self.async_client.get(f'/api/async/products/{self.product.pk}/')
+        self.assertEqual(response.json()['price'], '10.50')
+
+        response = await self.async_client.get('/api/async/items/999999/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = await self.async_client.get(f'/api/async/products/{self.product.pk}/', {'fields': 'name'})
+        self.assertEqual(response.json(), {'name': 'Phone'})
+
+        # неизвестные поля - 400, как у sync-версии
+        for url in ['/api/async/products/', f'/api/async/products/{self.product.pk}/', '/api/async/items/']:
+            response = await self.async_client.get(url, {'fields': 'secret'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+            self.assertIn('fields', response.json())
+
+        response = await self.async_client.get(reverse('async-ping'))
+        self.assertEqual(response.json(), {'status': 'ok', 'message': 'pong'})
+
+
+# тесты загрузки больших файлов по частям
+class ChunkedUploadTests(APITestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media = media
+        self.user = User.objects.create_user(username='uploader', password='pass123')
+        self.client.force_authenticate(self.user)
+
+    def start(self, content, **extra):
+        response = self.client.post(reverse('upload-session-create'),
+                                    {'filename': 'Big File.BIN', 'size': len(content), **extra}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def put(self, session_id, offset, chunk, **headers):
+        return self.client.generic('PUT', reverse('upload-session', kwargs={'pk': session_id}), chunk,
+                                   content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset), **headers)
+
+    def complete(self, session_id):
+        return self.client.post(reverse('upload-session-complete', kwargs={'pk': session_id}))
+
+    # загрузка частями с проверкой смещения, sha256 и дедупликацией
+    def test_upload_resume_and_dedup(self):
+        content = os.urandom(300 * 1024)
+        sha256 = hashlib.sha256(content).hexdigest()
+        session_id = self.start(content, checksum=sha256)
+
+        self.assertEqual(self.put(session_id, 0, content[:100 * 1024]).data['offset'], 100 * 1024)
+        # повтор уже принятого смещения - 409 с текущим смещением
+        response = self.put(session_id, 0, content[:100 * 1024])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 100 * 1024)
+        # неверный sha256 части - часть откатывается
+        response = self.put(session_id, 100 * 1024, content[100 * 1024:], HTTP_X_CHUNK_SHA256='0' * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # продолжение после "перезапуска процесса" - хэш пересчитывается по файлу
+        uploads._hashers.clear()
+        self.assertEqual(self.client.get(reverse('upload-session', kwargs={'pk': session_id})).data['offset'], 100 * 1024)
+        self.put(session_id, 100 * 1024, content[100 * 1024:])
+
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['sha256'], sha256)
+        self.assertFalse(response.data['deduplicated'])
+        self.assertEqual(response.data['content_type'], 'application/octet-stream')
+        stored = os.path.join(self.media, 'cas', sha256[:2], sha256[2:4], sha256)
+        with open(stored, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+        # тот же файл ещё раз под другим расширением - хранится одна копия
+        second = self.start(content, filename='photo.JPEG')
+        self.put(second, 0, content)
+        response = self.complete(second)
+        self.assertTrue(response.data['deduplicated'])
+        self.assertEqual(response.data['content_type'], 'image/jpeg')
+        self.assertEqual(os.listdir(uploads.upload_tmp_dir()), [])
+
+    # незавершённую загрузку нельзя финализировать, неверный checksum отклоняется
+    def test_incomplete_and_bad_checksum(self):
+        session_id = self.start(b'abcdef', checksum='f' * 64)
+        self.assertEqual(self.complete(session_id).status_code, status.HTTP_400_BAD_REQUEST)
+        self.put(session_id, 0, b'abcdef')
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(UploadSession.objects.filter(pk=session_id).exists())
+
+    # загрузки только с аутентификацией, чужие сессии не видны, незавершённых - не больше лимита
+    def test_owner_and_session_limit(self):
+        session_id = self.start(b'abc')
+        url = reverse('upload-session', kwargs={'pk': session_id})
+        other = APIClient()
+        self.assertEqual(other.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        other.force_authenticate(User.objects.create_user(username='other', password='pass123'))
+        self.assertEqual(other.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(other.post(reverse('upload-session-complete', kwargs={'pk': session_id})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        with self.settings(UPLOAD_MAX_OPEN_SESSIONS=2, UPLOAD_CHUNK_MAX_BYTES=2):
+            self.start(b'def')
+            response = self.client.post(reverse('upload-session-create'), {'filename': 'x', 'size': 1}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            # настройки читаются при запросе
+            self.assertEqual(self.put(session_id, 0, b'abc').status_code, status.HTTP_400_BAD_REQUEST)
+
+    # сбой записи не сдвигает смещение; брошенный захват истекает; короткий файл части - 409
+    def test_claim_recovery(self):
+        content = b'0123456789'
+        session_id = self.start(content)
+        with mock.patch.object(uploads, 'write_chunk', side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.put(session_id, 0, content[:5])
+        self.assertEqual(self.put(session_id, 0, content[:5]).data['offset'], 5)
+
+        # процесс упал во время записи - сессия занята до истечения захвата
+        UploadSession.objects.filter(pk=session_id).update(claimed_at=timezone.now())
+        self.assertEqual(self.put(session_id, 5, content[5:]).status_code, status.HTTP_409_CONFLICT)
+        UploadSession.objects.filter(pk=session_id).update(
+            claimed_at=timezone.now() - datetime.timedelta(seconds=settings.UPLOAD_CLAIM_TIMEOUT + 1)
+        )
+        self.assertEqual(self.put(session_id, 5, content[5:]).data['offset'], 10)
+
+        # смещение впереди файла части (занято без записи) - продолжение с размера файла
+        session_id = self.start(content)
+        self.put(session_id, 0, content[:5])
+        UploadSession.objects.filter(pk=session_id).update(offset=8)
+        response = self.put(session_id, 8, content[8:])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 5)
+        self.put(session_id, 5, content[5:])
+        self.assertEqual(self.complete(session_id).status_code, status.HTTP_201_CREATED)
+
+
+# тесты отдачи медиафайлов
+class MediaServingTests(APITestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=media, MEDIA_OFFLOAD='')
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+        self.content = bytes(range(256)) * 40
+        os.makedirs(os.path.join(media, 'uploads'))
+        with open(os.path.join(media, 'uploads', 'data.bin'), 'wb') as f:
+            f.write(self.content)
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+        self.cas_path = f'cas/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}'
+        os.makedirs(os.path.join(media, *self.cas_path.split('/')[:-1]))
+        shutil.copy(os.path.join(media, 'uploads', 'data.bin'), os.path.join(media, *self.cas_path.split('/')))
+        UploadSession.objects.create(filename='data.png', size=len(self.content), sha256=self.sha256,
+                                     content_type='image/png', completed_at=timezone.now())
+
+    def get(self, path, **headers):
+        return self.client.get('/media/' + path, **headers)
+
+    # целый файл с ETag (хэш для cas/, размер и время изменения для остальных) и повторный запрос с 304
+    def test_full_file_and_etag(self):
+        response = self.get('uploads/data.bin')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        etag = response['ETag']
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = self.get('uploads/data.bin', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # файл не читается ради ETag
+        with mock.patch('builtins.open', side_effect=AssertionError):
+            response = self.get('uploads/data.bin', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with open(os.path.join(settings.MEDIA_ROOT, 'uploads', 'data.bin'), 'ab') as f:
+            f.write(b'!')
+        self.assertNotEqual(self.get('uploads/data.bin')['ETag'], etag)
+
+        response = self.get(self.cas_path)
+        self.assertEqual(response['ETag'], f'"{self.sha256}"')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    # запросы диапазонов
+    def test_range(self):
+        response = self.get('uploads/data.bin', HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.get('uploads/data.bin', HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.get('uploads/data.bin', HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        # устаревший If-Range - отдаётся весь файл
+        response = self.get('uploads/data.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # выгрузка отправки на веб-сервер и защита от выхода за MEDIA_ROOT
+    def test_offload_and_traversal(self):
+        with self.settings(MEDIA_OFFLOAD='x-accel-redirect', MEDIA_OFFLOAD_PREFIX='/protected/'):
+            response = self.get('uploads/data.bin')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/uploads/data.bin')
+        self.assertEqual(response.content, b'')
+        self.assertNotIn('Content-Type', response)
+        # у файлов cas/ нет расширения - тип из метаданных загрузки
+        with self.settings(MEDIA_OFFLOAD='x-accel-redirect', MEDIA_OFFLOAD_PREFIX='/protected/'):
+            self.assertEqual(self.get(self.cas_path)['Content-Type'], 'image/png')
+
+        self.assertEqual(self.get('../settings.py').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.get('uploads/missing.bin').status_code, status.HTTP_404_NOT_FOUND)
+
+    # незавершённые загрузки не отдаются
+    def test_upload_parts_hidden(self):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'uploads', 'tmp'))
+        with open(os.path.join(settings.MEDIA_ROOT, 'uploads', 'tmp', 'x.part'), 'wb') as f:
+            f.write(b'partial')
+        for path in ['uploads/tmp/x.part', 'uploads/./tmp/x.part', 'uploads//tmp/x.part']:
+            self.assertEqual(self.get(path).status_code, status.HTTP_404_NOT_FOUND, path)
+
+
+# тесты метрик запросов
+class RequestMetricsTests(APITestCase):
+
+    def setUp(self):
+        request_metrics.reset()
+        self.addCleanup(request_metrics.reset)
+
+    # метки по имени маршрута, запросы к бд и размер ответа
+    def test_metrics_by_route(self):
+        item = Item.objects.create(title='One')
+        self.client.get(reverse('item-detail', kwargs={'pk': item.pk}))
+        self.client.get(reverse('item-detail', kwargs={'pk': item.pk}))
+
+        key = ('item-detail', 'GET')
+        self.assertEqual(request_metrics.latency[key].count, 2)
+        self.assertEqual(request_metrics.requests[('item-detail', 'GET', '200')], 2)
+        self.assertEqual(request_metrics.db_queries[key], 2)
+        self.assertGreater(request_metrics.response_bytes[key], 0)
+
+    # эндпоинт /metrics в текстовом формате Prometheus
+    def test_prometheus_endpoint(self):
+        self.client.get('/api/ping/')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode('utf-8')
+        self.assertIn('http_request_duration_seconds_bucket{route="ping",method="GET",le="+Inf"} 1', body)
+        self.assertIn('product_count_broadcasts_suppressed_total', body)
+
+    # в лог попадает только выборка запросов
+    def test_log_sampling(self):
+        with self.settings(REQUEST_LOG_SAMPLE_RATE=0.0):
+            middleware = LoggingMiddleware(lambda request: HttpResponse('ok'))
+        with self.assertNoLogs('core.middleware', level='INFO'):
+            middleware(RequestFactory().get('/api/ping/'))
+        self.assertEqual(request_metrics.latency[('unresolved', 'GET')].count, 1)
+
+
+# тесты бюджета запросов и поиска N+1
+class QueryBudgetTests(APITestCase):
+
+    def setUp(self):
+        self.items = [Item.objects.create(title=f'Item {i}') for i in range(12)]
+
+    # списки укладываются в бюджеты маршрутов из настроек
+    def test_views_within_budget(self):
+        with query_budget(view_name='item-list-create'):
+            self.client.get(reverse('item-list-create'))
+        with query_budget(view_name='product-list'):
+            self.client.get(reverse('product-list'))
+
+    # повторяющийся запрос в цикле распознаётся как N+1 со стеком вызова
+    def test_n_plus_one_detected(self):
+        with self.assertRaises(AssertionError) as ctx:
+            with query_budget(max_queries=100):
+                for item in self.items:
+                    Item.objects.get(pk=item.pk)
+        self.assertIn('N+1: 12', str(ctx.exception))
+        self.assertIn('test_n_plus_one_detected', str(ctx.exception))
+        self.assertNotIn('metrics.py', str(ctx.exception))
+
+        with self.assertRaises(AssertionError):
+            with query_budget(max_queries=1):
+                list(Item.objects.all())
+                list(Product.objects.all())
+
+    # метрики и бюджет считаются одной обёрткой на соединении
+    def test_single_execute_wrapper(self):
+        with query_budget(max_queries=5) as recorder:
+            list(Item.objects.all())
+        self.assertEqual(recorder.count, 1)
+        self.assertEqual(connection.execute_wrappers, [_count_queries])
+
+    # списки IN разной длины считаются одним шаблоном
+    def test_query_shape(self):
+        self.assertEqual(query_shape('WHERE id IN (%s, %s, %s)'), query_shape('WHERE id IN (%s)'))
+
+    # выборочные запросы с нарушением бюджета попадают в лог
+    def test_middleware_logs_violation(self):
+        with self.settings(QUERY_REPORT_SAMPLE_RATE=1.0, QUERY_BUDGETS={'item-list-create': 0}):
+            with self.assertLogs('core.middleware', level='WARNING') as logs:
+                self.client.get(reverse('item-list-create'))
+        self.assertIn('item-list-create', logs.output[0])
+
+
+# тесты канального слоя на sqlite
+class SQLiteChannelLayerTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.path = os.path.join(self.tmp, 'channels.sqlite3')
+
+    # два экземпляра слоя на одном файле - как два процесса
+    async def test_group_send_across_layers(self):
+        server, worker = SQLiteChannelLayer(path=self.path), SQLiteChannelLayer(path=self.path)
+        first, second = await server.new_channel(), await server.new_channel()
+        receiving = [asyncio.ensure_future(server.receive(first)), asyncio.ensure_future(server.receive(second))]
+        await server.group_add('products', first)
+        await server.group_add('products', second)
+        await asyncio.sleep(0)
+
+        await worker.group_send('products', {'type': 'product.count', 'count': 5, 'raw': b'\x00'})
+        messages = await asyncio.wait_for(asyncio.gather(*receiving), 2)
+        self.assertEqual(messages, [{'type': 'product.count', 'count': 5, 'raw': b'\x00'}] * 2)
+        # на процесс-получатель пишется одна строка, а не по строке на канал
+        self.assertEqual(worker.stats()['sent'], 1)
+        self.assertEqual(server.stats()['delivered'], 2)
+
+        await server.group_discard('products', first)
+        await worker.group_send('products', {'type': 'product.count', 'count': 6})
+        self.assertEqual((await asyncio.wait_for(server.receive(second), 2))['count'], 6)
+        await server.close()
+
+    # одновременные записи склеиваются в общие транзакции, переполнение канала - ChannelFull
+    async def test_batched_sends_and_capacity(self):
+        layer = SQLiteChannelLayer(path=self.path, capacity=3)
+        # пока поток записи занят, операции копятся и уходят одной пачкой
+        busy = threading.Event()
+        layer._executor.submit(busy.wait)
+        sending = asyncio.gather(*(layer.send('worker', {'type': 'job', 'n': n}) for n in range(3)))
+        await asyncio.sleep(0.01)
+        busy.set()
+        await sending
+        self.assertEqual(layer.stats()['batches'], 1)
+        with self.assertRaises(ChannelFull):
+            await layer.send('worker', {'type': 'job', 'n': 3})
+
+        received = [await asyncio.wait_for(layer.receive('worker'), 2) for _ in range(3)]
+        self.assertEqual([message['n'] for message in received], [0, 1, 2])
+        await layer.flush()
+        await layer.close()
+
+    # сообщение каналу процесса, который никто не слушает, не оседает в очереди
+    async def test_send_without_receiver_dropped(self):
+        layer = SQLiteChannelLayer(path=self.path)
+        idle, listening = await layer.new_channel(), await layer.new_channel()
+        receiving = asyncio.ensure_future(layer.receive(listening))
+        await asyncio.sleep(0)
+        await layer.send(idle, {'type': 'job', 'n': 1})
+        await layer.send(listening, {'type': 'job', 'n': 2})
+        self.assertEqual((await asyncio.wait_for(receiving, 2))['n'], 2)
+        self.assertNotIn(idle, layer._queues)
+        self.assertEqual(layer.stats()['dropped'], 1)
+        await layer.close()
+
+    # участники групп из процесса без отметки удаляются при очистке, живые остаются
+    async def test_dead_process_members_pruned(self):
+        dead, live = SQLiteChannelLayer(path=self.path), SQLiteChannelLayer(path=self.path)
+        dead_channel, live_channel = await dead.new_channel(), await live.new_channel()
+        await dead.group_add('products', dead_channel)
+        await live.group_add('products', live_channel)
+
+        db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.addCleanup(db.close)
+        db.execute('UPDATE channel_process SET seen = ? WHERE target = ?',
+                   (time.time() - 120, dead.non_local_name(dead_channel)))
+        await live._run(lambda: live._purge(live._connect(), time.time()))
+        members = [channel for (channel,) in db.execute('SELECT channel FROM channel_group')]
+        self.assertEqual(members, [live_channel])
+
+
+# тесты ленты изменений товаров
+class ProductFeedTests(APITestCase):
+
+    def setUp(self):
+        feed.reset()
+        self.addCleanup(feed.reset)
+        # отложенная отправка количества товаров не должна срабатывать в других тестах
+        self.addCleanup(broadcaster.reset)
+        # рассылку в группу проверяем отдельно - здесь только накопленные события
+        patcher = mock.patch.object(feed, 'flush')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pending(self):
+        events = feed.pending()
+        feed.reset()
+        return events
+
+    # создание - все поля, обновление - только изменённые, удаление - id и категория
+    def test_signal_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Phone', price='10.00', category='phones')
+        [created] = self.pending()
+        self.assertEqual(created['op'], 'created')
+        self.assertEqual(created['fields']['price'], '10.00')
+
+        product = Product.objects.get(pk=product.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = '12.50'
+            product.save()
+            product.save()
+        self.assertEqual(self.pending(), [
+            {'op': 'updated', 'id': product.pk, 'category': 'phones', 'fields': {'price': '12.50'}}
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.category = 'tablets'
+            product.save()
+            product.delete()
+        self.assertEqual(self.pending(), [{'op': 'deleted', 'id': created['id'], 'category': 'tablets'}])
+
+    # несколько изменений одного товара за такт склеиваются
+    def test_updates_merged_within_tick(self):
+        product = Product.objects.create(name='Phone', price='10.00', category='phones')
+        feed.reset()
+        product = Product.objects.get(pk=product.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = '11.00'
+            product.save()
+            product.category = 'tablets'
+            product.save()
+        [event] = self.pending()
+        self.assertEqual(event['fields'], {'price': '11.00', 'category': 'tablets'})
+        self.assertEqual(event['previous_category'], 'phones')
+
+    # массовое обновление через API тоже попадает в ленту
+    def test_bulk_update_events(self):
+        user = User.objects.create_user(username='bulk', password='pass123')
+        self.client.force_authenticate(user)
+        products = Product.objects.bulk_create([
+            Product(name=f'P{i}', price='1.00', category='c') for i in range(3)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('product-bulk'), [
+                {'id': products[0].pk, 'quantity': 5},
+                {'id': products[1].pk, 'price': '1.00'},
+            ], format='json')
+        self.assertEqual(self.pending(), [
+            {'op': 'updated', 'id': products[0].pk, 'category': 'c', 'fields': {'quantity': 5}}
+        ])
+
+
+# тесты WebSocket-подписчика ленты товаров
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PRODUCT_FEED_CLIENT_BUFFER=2,
+)
+class ProductFeedConsumerTests(TestCase):
+
+    def event(self, pk, category):
+        return {'op': 'updated', 'id': pk, 'category': category, 'fields': {'quantity': 1}}
+
+    # клиент получает только события своих категорий и id
+    async def test_filters_and_subscription(self):
+        communicator = WebsocketCommunicator(ProductFeedConsumer.as_asgi(), '/ws/products/feed/?categories=phones')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        layer = get_channel_layer()
+
+        await layer.group_send(FEED_GROUP, {'type': 'product.feed', 'events': [
+            self.event(1, 'phones'), self.event(2, 'laptops'),
+        ]})
+        frame = await communicator.receive_json_from()
+        self.assertEqual([event['id'] for event in frame['events']], [1])
+
+        await communicator.send_json_to({'action': 'subscribe', 'ids': [2]})
+        self.assertEqual((await communicator.receive_json_from())['subscribed']['ids'], [2])
+        await layer.group_send(FEED_GROUP, {'type': 'product.feed', 'events': [self.event(2, 'laptops')]})
+        self.assertEqual((await communicator.receive_json_from())['events'][0]['id'], 2)
+        await communicator.disconnect()
+
+    # медленный клиент: очередь ограничена, потерянные события считаются
+    async def test_bounded_buffer(self):
+        feed.reset()
+        communicator = WebsocketCommunicator(ProductFeedConsumer.as_asgi(), '/ws/products/feed/?all=1')
+        await communicator.connect()
+        await get_channel_layer().group_send(FEED_GROUP, {'type': 'product.feed', 'events': [
+            self.event(pk, 'phones') for pk in range(5)
+        ]})
+        frame = await communicator.receive_json_from()
+        self.assertEqual([event['id'] for event in frame['events']], [3, 4])
+        self.assertEqual(frame['dropped'], 3)
+        self.assertEqual(feed.stats()['dropped'], 3)
+        await communicator.disconnect()
+
+
+# тесты ограничения подключений и обратного давления WebSocket
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    WS_MAX_CONNECTIONS=2,
+)
+class WebsocketBackPressureTests(TestCase):
+
+    def setUp(self):
+        broadcaster.reset()
+        websocket_stats.reset()
+        self.addCleanup(broadcaster.reset)
+
+    def communicator(self):
+        return WebsocketCommunicator(ProductCountConsumer.as_asgi(), '/ws/products/count/')
+
+    # лимит соединений на процесс и один COUNT на волну подключений
+    async def test_admission_and_count_snapshot(self):
+        await sync_to_async(Product.objects.create)(name='A', price='1.00')
+        clients = [self.communicator() for _ in range(3)]
+        with mock.patch.object(broadcaster, '_load', wraps=broadcaster._load) as load:
+            first, second = [await client.connect() for client in clients[:2]]
+            self.assertTrue(first[0] and second[0])
+            self.assertEqual(await clients[0].receive_json_from(), {'Количество': 1})
+            self.assertEqual(await clients[1].receive_json_from(), {'Количество': 1})
+        self.assertEqual(load.call_count, 1)
+
+        connected, code = await clients[2].connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 1013)
+        self.assertEqual(websocket_stats.rejected, {'ProductCountConsumer': 1})
+        self.assertEqual(websocket_stats.active, {'ProductCountConsumer': 2})
+        for client in clients[:2]:
+            await client.disconnect()
+        self.assertEqual(websocket_stats.active, {'ProductCountConsumer': 0})
+
+    # heartbeat и закрытие молчащего клиента
+    @override_settings(WS_HEARTBEAT_INTERVAL=0.05, WS_IDLE_TIMEOUT=0.12)
+    async def test_heartbeat_and_idle_timeout(self):
+        broadcaster._count, broadcaster._loaded_at = 0, time.monotonic()
+        client = self.communicator()
+        await client.connect()
+        await client.receive_json_from()
+        self.assertEqual(await client.receive_json_from(), {'type': 'ping'})
+        output = await client.receive_output(1)
+        while output['type'] == 'websocket.send':
+            output = await client.receive_output(1)
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 4408})
+        self.assertEqual(websocket_stats.idle_timeouts, {'ProductCountConsumer': 1})
+
+    # очередь отправки ограничена, кадры с одним ключом заменяют друг друга
+    def test_bounded_send_queue(self):
+        consumer = ManagedWebsocketConsumer()
+        consumer.stats_name = 'Test'
+        consumer.send_queue, consumer.send_queue_size = deque(), 2
+        consumer.wakeup = asyncio.Event()
+        consumer.queue_frame('1', key='count')
+        consumer.queue_frame('2', key='count')
+        consumer.queue_frame('a')
+        consumer.queue_frame('b')
+        self.assertEqual(list(consumer.send_queue), [(None, 'a'), (None, 'b')])
+        self.assertEqual(websocket_stats.dropped_frames, {'Test': 1})
+
+
+# тесты профилей подключения к sqlite
+class SQLiteProfileTests(SimpleTestCase):
+
+    # соединение с профилем tuned: WAL и остальные прагмы, постоянные соединения
+    def test_tuned_pragmas(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        profile = settings.DB_PROFILES['tuned']
+        self.assertGreater(profile['CONN_MAX_AGE'], 0)
+        database = connections.configure_settings({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(tmp, 'db.sqlite3'), **profile},
+        })['default']
+        wrapper = sqlite_backend.DatabaseWrapper(database, alias='tuned')
+        self.addCleanup(wrapper.close)
+        pragmas = {}
+        with wrapper.cursor() as cursor:
+            for name in ['journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store']:
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        # synchronous NORMAL = 1, temp_store MEMORY = 2
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'mmap_size': settings.SQLITE_PRAGMAS['mmap_size'],
+            'cache_size': settings.SQLITE_PRAGMAS['cache_size'],
+            'temp_store': 2,
+        })
+
+
+# тесты маршрутизации чтения на реплики
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], REPLICA_MAX_LAG=5.0)
+class ReadReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.ReadReplicaRouter()
+        self.lags = {'replica1': 0.0, 'replica2': 0.0}
+        patcher = mock.patch.object(routers, 'replica_lag', side_effect=self.lags.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_alias(self, model=Product):
+        return contextvars_run(self.router.db_for_read, model)
+
+    # каталог читается с реплик, остальные модели и записи - с основной бд
+    def test_routes_catalog_reads(self):
+        self.assertIn(self.read_alias(), ['replica1', 'replica2'])
+        self.assertIn(self.read_alias(Item), ['replica1', 'replica2'])
+        self.assertIsNone(self.read_alias(User))
+        self.assertEqual(contextvars_run(self.router.db_for_write, Product), 'default')
+
+    # отставшая реплика пропускается, если отстали все - чтение с основной бд
+    def test_lagging_replica_skipped(self):
+        self.lags['replica1'] = 30.0
+        self.assertEqual({self.read_alias() for _ in range(20)}, {'replica2'})
+        self.lags['replica2'] = None
+        self.assertIsNone(self.read_alias())
+
+    # после записи запрос читает свою запись с основной бд, клиент получает cookie
+    def test_read_your_writes(self):
+        def view(request):
+            before = self.router.db_for_read(Product)
+            self.router.db_for_write(Product)
+            return HttpResponse(f'{before},{self.router.db_for_read(Product)}')
+
+        middleware = ReplicaPinningMiddleware(view)
+        response = contextvars_run(middleware, RequestFactory().get('/'))
+        before, after = response.content.decode().split(',')
+        self.assertIn(before, ['replica1', 'replica2'])
+        self.assertEqual(after, 'None')
+        self.assertIn('db_pin', response.cookies)
+
+        # по cookie чтение идёт с основной бд, но без записи закрепление не продлевается
+        request = RequestFactory().get('/')
+        request.COOKIES['db_pin'] = '1'
+        middleware = ReplicaPinningMiddleware(lambda request: HttpResponse(str(self.router.db_for_read(Product))))
+        response = contextvars_run(middleware, request)
+        self.assertEqual(response.content.decode(), 'None')
+        self.assertNotIn('db_pin', response.cookies)
+
+    # ответы, которые кладутся в кэш каталога, читаются с основной бд, остальные - с реплик
+    def test_cache_fill_reads_primary(self):
+        class View(CatalogCacheMixin):
+            action, kwargs, lookup_url_kwarg, lookup_field = 'list', {}, None, 'pk'
+
+        request = mock.Mock(method='GET', META={}, query_params=QueryDict(),
+                            accepted_media_type='application/json', accepted_renderer=JSONRenderer())
+        cache.clear()
+        self.addCleanup(cache.clear)
+        response = contextvars_run(
+            View().cached_response, lambda request: HttpResponse(str(self.router.db_for_read(Product))), request
+        )
+        self.assertEqual(response.content.decode(), 'None')
+        self.assertIn(self.read_alias(), ['replica1', 'replica2'])
+
+    # отставание файловой реплики: с момента копирования, если основная бд менялась после
+    def test_files_lag(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        primary, replica = os.path.join(tmp, 'db.sqlite3'), os.path.join(tmp, 'replica.sqlite3')
+        for path in (primary, replica):
+            open(path, 'wb').close()
+        now = time.time()
+        os.utime(primary, (now - 100, now - 100))
+        os.utime(replica, (now - 60, now - 60))
+        self.assertEqual(routers.files_lag(primary, replica), 0.0)
+        os.utime(primary, (now, now))
+        self.assertAlmostEqual(routers.files_lag(primary, replica), 60, delta=5)
+        self.assertIsNone(routers.files_lag(primary, os.path.join(tmp, 'missing.sqlite3')))
+
+
+# вызов в чистом контексте - закрепление за основной бд из других тестов не мешает
+def contextvars_run(func, *args):
+    return contextvars.Context().run(func, *args)
+
+
+# тесты агрегатов по категориям
+class ProductCategoryStatsTests(APITestCase):
+
+    def stats(self):
+        return {
+            row.category: (row.product_count, row.total_quantity, row.inventory_value_cents)
+            for row in CategoryStats.objects.exclude(product_count=0)
+        }
+
+    # создание, смена цены/количества/категории и удаление меняют агрегаты приращениями
+    def test_signal_deltas(self):
+        product = Product.objects.create(name='Phone', price='10.50', category='phones', quantity=2)
+        Product.objects.create(name='Case', price='1.00', category='phones', quantity=10)
+        self.assertEqual(self.stats(), {'phones': (2, 12, 3100)})
+
+        product = Product.objects.get(pk=product.pk)
+        product.quantity = 3
+        product.save()
+        self.assertEqual(self.stats(), {'phones': (2, 13, 4150)})
+
+        product.category = 'tablets'
+        product.price = '20.00'
+        product.save()
+        self.assertEqual(self.stats(), {'phones': (1, 10, 1000), 'tablets': (1, 3, 6000)})
+
+        # объект не из бд: прежние значения читаются перед сохранением
+        Product(pk=product.pk, name='Phone', price='20.00', category='phones', quantity=1).save()
+        self.assertEqual(self.stats(), {'phones': (2, 11, 3000)})
+
+        # update_fields: несохранённые поля на агрегаты не влияют
+        product = Product.objects.only('id', 'name').get(pk=product.pk)
+        product.quantity = 100
+        product.name = 'Phone X'
+        product.save(update_fields=['name'])
+        self.assertEqual(self.stats(), {'phones': (2, 11, 3000)})
+
+        product.delete()
+        self.assertEqual(self.stats(), {'phones': (1, 10, 1000)})
+
+    # параллельные изменения одного товара: приращение считается от строки в бд,
+    # а не от значений, прочитанных обоими запросами до записи
+    def test_concurrent_saves(self):
+        product = Product.objects.create(name='Phone', price='10.00', category='phones', quantity=5)
+        first, second = Product.objects.get(pk=product.pk), Product.objects.get(pk=product.pk)
+        first.quantity = 6
+        first.save()
+        second.quantity = 7
+        second.price = '20.00'
+        second.save()
+        self.assertEqual(self.stats(), {'phones': (1, 7, 14000)})
+        second.delete()
+        first.delete()
+        self.assertEqual(self.stats(), {})
+
+    # миграция заполняет агрегаты по существующим товарам без кода приложения
+    def test_migration_fill(self):
+        Product.objects.create(name='A', price='2.50', category='a', quantity=2)
+        Product.objects.create(name='B', price='1.00', category='a', quantity=1)
+        CategoryStats.objects.all().delete()
+        migration = importlib.import_module('core.migrations.0008_category_stats')
+        migration.fill_category_stats(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(self.stats(), {'a': (2, 3, 600)})
+
+    # массовые создание, обновление, удаление и импорт
+    def test_bulk_deltas(self):
+        user = User.objects.create_user(username='bulk', password='pass123')
+        self.client.force_authenticate(user)
+        response = self.client.post(reverse('product-bulk'), [
+            {'name': 'A', 'price': '2.00', 'category': 'a', 'quantity': 1},
+            {'name': 'B', 'price': '3.00', 'category': 'a', 'quantity': 2},
+        ], format='json')
+        ids = response.json()['created']
+        self.assertEqual(self.stats(), {'a': (2, 3, 800)})
+
+        self.client.patch(reverse('product-bulk'), [
+            {'id': ids[0], 'category': 'b'},
+            {'id': ids[1], 'quantity': 4},
+        ], format='json')
+        self.assertEqual(self.stats(), {'a': (1, 4, 1200), 'b': (1, 1, 200)})
+
+        self.client.delete(reverse('product-bulk'), {'ids': [ids[0]]}, format='json')
+        self.assertEqual(self.stats(), {'a': (1, 4, 1200)})
+
+        upload = SimpleUploadedFile(
+            'catalog.csv',
+            b'sku,name,price,category,quantity\nS1,One,5.00,a,1\nS1,One,5.00,c,2\n',
+        )
+        self.client.post(reverse('product-import'), {'file': upload}, format='multipart')
+        upload = SimpleUploadedFile('catalog.csv', b'sku,name,price,category,quantity\nS1,One,6.00,c,3\n')
+        self.client.post(reverse('product-import'), {'file': upload}, format='multipart')
+        self.assertEqual(self.stats(), {'a': (1, 4, 1200), 'c': (1, 3, 1800)})
+
+    # эндпоинт читает только таблицу агрегатов
+    def test_stats_endpoint(self):
+        Product.objects.create(name='A', price='2.50', category='a', quantity=2)
+        Product.objects.create(name='B', price='1.00', category='b', quantity=1)
+        Product.objects.create(name='C', price='1.00', category='b', quantity=0).delete()
+        Product.objects.create(name='D', price='9.99', category='c').delete()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'categories': [
+                {'category': 'a', 'product_count': 1, 'total_quantity': 2, 'inventory_value': '5.00'},
+                {'category': 'b', 'product_count': 1, 'total_quantity': 1, 'inventory_value': '1.00'},
+            ],
+            'totals': {'product_count': 2, 'total_quantity': 3, 'inventory_value': '6.00'},
+        })
+
+    # записи в обход сигналов дают расхождение, команда его находит и исправляет
+    def test_reconcile_command(self):
+        Product.objects.create(name='A', price='2.00', category='a', quantity=1)
+        Product.objects.create(name='B', price='1.00', category='b', quantity=1)
+        Product.objects.filter(category='a').update(quantity=5, category='z')
+        self.assertEqual(self.stats(), {'a': (1, 1, 200), 'b': (1, 1, 100)})
+
+        out = StringIO()
+        call_command('reconcile_category_stats', '--dry-run', stdout=out)
+        self.assertIn('a: count 1 -> 0', out.getvalue())
+        self.assertIn('z: count 0 -> 1, quantity 0 -> 5, value_cents 0 -> 1000', out.getvalue())
+        self.assertEqual(self.stats(), {'a': (1, 1, 200), 'b': (1, 1, 100)})
+
+        call_command('reconcile_category_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), {'b': (1, 1, 100), 'z': (1, 5, 1000)})
+        out = StringIO()
+        call_command('reconcile_category_stats', stdout=out)
+        self.assertIn('Расхождений нет', out.getvalue())
+
+
+# тесты резервирования остатков
+class StockReservationTests(APITestCase):
+
+    def setUp(self):
+        self.phone = Product.objects.create(name='Phone', price='10.00', category='phones', quantity=5)
+        self.case = Product.objects.create(name='Case', price='1.00', category='phones', quantity=2)
+        self.user = User.objects.create_user(username='buyer', password='pass123')
+        self.client.force_authenticate(self.user)
+
+    def reserve(self, data):
+        return self.client.post(reverse('reservation-list'), data, format='json')
+
+    def quantities(self):
+        return list(Product.objects.order_by('pk').values_list('quantity', flat=True))
+
+    # партия резервов: каждый - все позиции или ничего, без ухода остатка в минус
+    def test_reserve_batch(self):
+        response = self.reserve([
+            {'items': [{'product': self.phone.pk, 'quantity': 2}, {'product': self.case.pk, 'quantity': 1}]},
+            {'items': [{'product': self.phone.pk, 'quantity': 1}, {'product': self.case.pk, 'quantity': 2}]},
+            {'items': [{'product': self.phone.pk, 'quantity': 1}, {'product': self.phone.pk, 'quantity': 2}]},
+            {'items': []},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        body = response.json()
+        self.assertEqual([row['index'] for row in body['reserved']], [0, 2])
+        self.assertEqual(body['reserved'][1]['items'], [{'product': self.phone.pk, 'quantity': 3}])
+        self.assertEqual(body['errors'][0], {'index': 1, 'errors': {'items': [
+            {'product': self.case.pk, 'requested': 2, 'available': 1}
+        ]}})
+        self.assertEqual(body['errors'][1]['index'], 3)
+        self.assertEqual(self.quantities(), [0, 1])
+        self.assertEqual(CategoryStats.objects.get(category='phones').total_quantity, 1)
+
+        response = self.reserve({'items': [{'product': self.phone.pk, 'quantity': 1}]})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.reserve({'items': [{'product': 999999, 'quantity': 1}]})
+        self.assertEqual(response.json()['errors'][0]['errors']['items'][0]['available'], None)
+
+    # подтверждение оставляет остаток списанным, отмена возвращает; повтор ничего не меняет
+    def test_commit_and_release(self):
+        first, second = (
+            row['id'] for row in self.reserve([
+                {'items': [{'product': self.phone.pk, 'quantity': 2}]},
+                {'items': [{'product': self.phone.pk, 'quantity': 3}, {'product': self.case.pk, 'quantity': 2}]},
+            ]).json()['reserved']
+        )
+        self.assertEqual(self.quantities(), [0, 0])
+
+        response = self.client.post(reverse('reservation-commit'), {'ids': [first]}, format='json')
+        self.assertEqual(response.json(), {'done': [first], 'errors': []})
+        for _ in range(2):
+            response = self.client.post(reverse('reservation-release'), {'ids': [second]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.quantities(), [3, 2])
+        self.assertEqual(CategoryStats.objects.get(category='phones').total_quantity, 5)
+
+        response = self.client.post(reverse('reservation-release'), {'ids': [first]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()['errors'], [{'id': first, 'detail': 'Резерв уже подтверждён'}])
+        self.assertEqual(self.quantities(), [3, 2])
+
+        response = self.client.get(reverse('reservation-detail', args=[second]))
+        self.assertEqual(response.json()['status'], 'released')
+
+    # без аутентификации резервировать нельзя, чужие резервы не видны и не завершаются
+    def test_owner_only(self):
+        reservation_id = self.reserve({'items': [{'product': self.phone.pk, 'quantity': 1}]}).json()['reserved'][0]['id']
+        self.assertEqual(StockReservation.objects.get().owner, self.user)
+
+        self.client.force_authenticate(None)
+        response = self.reserve({'items': [{'product': self.phone.pk, 'quantity': 1}]})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(User.objects.create_user(username='other', password='pass123'))
+        self.assertEqual(self.client.get(reverse('reservation-detail', args=[reservation_id])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('reservation-release'), {'ids': [reservation_id]}, format='json')
+        self.assertEqual(response.json()['errors'], [{'id': reservation_id, 'detail': 'Резерв не найден'}])
+        self.assertEqual(self.quantities(), [4, 2])
+
+    # резерв, отменённый параллельно после чтения, не возвращает остаток второй раз
+    def test_release_race_returns_stock_once(self):
+        reservation_id = uuid.UUID(
+            self.reserve({'items': [{'product': self.case.pk, 'quantity': 2}]}).json()['reserved'][0]['id']
+        )
+        release([reservation_id])
+        self.assertEqual(self.quantities(), [5, 2])
+
+        # чтение видит резерв ещё не отменённым, как параллельный запрос до коммита первого
+        from_db = StockReservation.from_db.__func__
+
+        def stale(cls, db, field_names, values):
+            instance = from_db(cls, db, field_names, values)
+            instance.status = StockReservation.RESERVED
+            return instance
+
+        with mock.patch.object(StockReservation, 'from_db', classmethod(stale)):
+            done, errors = release([reservation_id])
+        self.assertEqual(done, [])
+        self.assertEqual(errors[0][1], 'Резерв изменён параллельным запросом')
+        self.assertEqual(self.quantities(), [5, 2])
+
+    # PATCH других полей не возвращает остаток, списанный резервом после чтения товара
+    def test_patch_keeps_reserved_stock(self):
+        stale = Product.objects.get(pk=self.phone.pk)
+        self.reserve({'items': [{'product': self.phone.pk, 'quantity': 2}]})
+        serializer = ProductSerializer(stale, data={'price': '12.00'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(self.quantities(), [3, 2])
+        stats = CategoryStats.objects.get(category='phones')
+        self.assertEqual((stats.total_quantity, stats.inventory_value_cents), (5, 3 * 1200 + 2 * 100))
+
+    # истёкший резерв нельзя подтвердить, команда возвращает его остаток
+    def test_release_expired(self):
+        reservation_id = self.reserve({'items': [{'product': self.case.pk, 'quantity': 2}]}).json()['reserved'][0]['id']
+        StockReservation.objects.update(expires_at=timezone.now())
+        response = self.client.post(reverse('reservation-commit'), {'ids': [reservation_id]}, format='json')
+        self.assertEqual(response.json()['errors'][0]['detail'], 'Срок резерва истёк')
+
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('Отменено резервов: 1', out.getvalue())
+        self.assertEqual(self.quantities(), [5, 2])
+
+
+# тесты быстрой отдачи списков через values()
+class LeanListResponseTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        Product.objects.bulk_create([
+            Product(name=f'Phone {i}', price=f'{i}.{i % 10}5', category=f'c{i % 3}', quantity=i,
+                    sku=f'S{i}' if i % 2 else None, description='x' * i)
+            for i in range(30)
+        ])
+        Item.objects.bulk_create([Item(title=f'Item {i}', description=f'd{i}') for i in range(30)])
+
+    def both(self, url):
+        responses = []
+        for lean in (True, False):
+            cache.clear()
+            with self.settings(LEAN_LIST_RESPONSES=lean):
+                responses.append(self.client.get(url))
+        return responses
+
+    # списки через .values() побайтно совпадают с выводом сериализаторов
+    def test_same_bytes_as_serializers(self):
+        for url in [
+            reverse('product-list'),
+            reverse('product-list') + '?category=c1&ordering=-price',
+            reverse('product-list') + '?search=phone&cursor=',
+            reverse('item-list-create'),
+            reverse('item-list-create') + '?cursor=',
+        ]:
+            lean, full = self.both(url)
+            self.assertEqual(lean.status_code, 200)
+            self.assertEqual(lean.content, full.content, url)
+
+    # keyset-курсор берётся из строк-словарей
+    def test_keyset_next_page(self):
+        with mock.patch.object(KeysetPagination, 'page_size', 10):
+            lean, full = self.both(reverse('product-list') + '?ordering=quantity&cursor=')
+            self.assertEqual(lean.json()['next'], full.json()['next'])
+            lean, full = self.both(lean.json()['next'])
+            self.assertEqual(lean.content, full.content)
+            self.assertEqual(lean.json()['results'][0]['quantity'], 10)
+
+
+# тесты выбора полей ответа через ?fields= и ?exclude=
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        Product.objects.bulk_create([
+            Product(name=f'Phone {i}', price=f'{i}.50', category=f'c{i % 3}', quantity=i, description='x' * 100)
+            for i in range(15)
+        ])
+        self.item = Item.objects.create(title='Item', description='long text')
+
+    def get(self, url, lean=True):
+        cache.clear()
+        with self.settings(LEAN_LIST_RESPONSES=lean), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, ' '.join(query['sql'] for query in queries.captured_queries)
+
+    # в ответе только выбранные поля, description из бд не читается - и через .values(), и через сериализатор
+    def test_fields_narrow_response_and_columns(self):
+        for lean in (True, False):
+            for url in [reverse('product-list') + '?fields=id,name,price',
+                        reverse('product-list') + '?fields=price,id,name&cursor=']:
+                response, sql = self.get(url, lean)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.json()['results'][0]), ['id', 'name', 'price'])
+                self.assertNotIn('description', sql)
+            response, sql = self.get(reverse('item-list-create') + '?exclude=description', lean)
+            self.assertNotIn('description', response.json()['results'][0])
+            self.assertIn('title', response.json()['results'][0])
+            self.assertNotIn('"description"', sql)
+
+    def test_detail_views(self):
+        product = Product.objects.first()
+        response, sql = self.get(reverse('product-detail', args=[product.pk]) + '?fields=name')
+        self.assertEqual(response.json(), {'name': product.name})
+        self.assertNotIn('description', sql)
+        response, sql = self.get(reverse('item-detail', args=[self.item.pk]) + '?fields=id,title')
+        self.assertEqual(response.json(), {'id': self.item.pk, 'title': 'Item'})
+        self.assertNotIn('"description"', sql)
+
+    # keyset-курсор работает, даже если поля сортировки нет в ответе; лишних запросов нет
+    def test_keyset_without_ordering_field(self):
+        url = reverse('product-list') + '?fields=name&ordering=quantity&cursor='
+        with mock.patch.object(KeysetPagination, 'page_size', 10):
+            for lean in (True, False):
+                response, _ = self.get(url, lean)
+                self.assertEqual(list(response.json()['results'][0]), ['name'])
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(response.json()['next'])
+                self.assertEqual(len(queries.captured_queries), 1)
+                self.assertEqual([row['name'] for row in response.json()['results']],
+                                 [f'Phone {i}' for i in range(10, 15)])
+
+    def test_unknown_or_empty_fields(self):
+        for url in [reverse('product-list') + '?fields=name,secret',
+                    reverse('product-list') + '?exclude=id,sku,name,description,price,category,quantity',
+                    reverse('item-list-create') + '?fields=password']:
+            response, _ = self.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('fields', response.json())
+
+    # запись не зависит от ?fields=
+    def test_write_ignores_fields(self):
+        product = Product.objects.first()
+        response = self.client.patch(reverse('product-detail', args=[product.pk]) + '?fields=name',
+                                     {'quantity': 99}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('description', response.json())
+        self.assertEqual(response.json()['quantity'], 99)
+
+
+# тесты JSON-рендерера и парсера на orjson
+class FastJSONCodecTests(SimpleTestCase):
+
+    def payload(self):
+        return {
+            'price': Decimal('12.50'),
+            'created': datetime.datetime(2024, 5, 1, 10, 20, 30, 123456, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2024, 5, 1),
+            'at': datetime.time(8, 30, 1, 500000),
+            'label': gettext_lazy('Name'),
+            'id': uuid.UUID(int=1),
+            'text': 'Товар \u2028 "кавычки"',
+            'rows': [{'n': i, 'ok': i % 2 == 0, 'none': None, 'f': i / 3} for i in range(3)],
+            1: 'int key',
+        }
+
+    # вывод совпадает с JSONRenderer DRF - и с orjson, и без него
+    def test_renderer_matches_drf(self):
+        expected = JSONRenderer().render(self.payload())
+        self.assertEqual(renderers.FastJSONRenderer().render(self.payload()), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.FastJSONRenderer().render(self.payload()), expected)
+        # с отступом - через DRF
+        self.assertEqual(
+            renderers.FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'), b'{\n  "a": 1\n}'
+        )
+
+    # целые больше 64 бит - через стандартный json, а не 500
+    def test_renderer_big_int(self):
+        data = {'n': 2 ** 70, 'text': '\u2029'}
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    # float с экспонентой orjson пишет короче, чем DRF
+    def test_renderer_float_exponent(self):
+        if renderers.orjson is None:
+            self.skipTest('orjson не установлен')
+        self.assertEqual(renderers.FastJSONRenderer().render([1e16, 1e-7, 0.5]), b'[1e16,1e-7,0.5]')
+        self.assertEqual(JSONRenderer().render([1e16, 1e-7, 0.5]), b'[1e+16,1e-07,0.5]')
+
+    def test_parser(self):
+        parser = FastJSONParser()
+        data = parser.parse(io.BytesIO('{"name": "Товар", "n": 9223372036854775807, "p": 1.5}'.encode()))
+        self.assertEqual(data, {'name': 'Товар', 'n': 9223372036854775807, 'p': 1.5})
+        # не UTF-8 - через стандартный json
+        data = parser.parse(io.BytesIO('{"name": "Товар"}'.encode('cp1251')), parser_context={'encoding': 'cp1251'})
+        self.assertEqual(data, {'name': 'Товар'})
+        for body in (b'{"a": ', b'{"a": NaN}'):
+            with self.assertRaises(ParseError):
+                parser.parse(io.BytesIO(body))
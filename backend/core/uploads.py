@@ -0,0 +1,123 @@
+import hashlib
+import mimetypes
+import os
+import threading
+
+from django.conf import settings
+
+# размер блока при чтении тела запроса и файлов с диска
+READ_BLOCK_SIZE = 64 * 1024
+
+# каталог хранилища по хэшу содержимого внутри MEDIA_ROOT
+CAS_DIR = 'cas'
+# каталог незавершённых загрузок внутри MEDIA_ROOT - наружу не отдаётся
+UPLOAD_TMP_DIR = 'uploads/tmp'
+
+
+def upload_tmp_dir():
+    return os.path.join(settings.MEDIA_ROOT, *UPLOAD_TMP_DIR.split('/'))
+
+
+def part_path(session):
+    return os.path.join(upload_tmp_dir(), f'{session.pk}.part')
+
+
+def part_size(session):
+    try:
+        return os.path.getsize(part_path(session))
+    except FileNotFoundError:
+        return 0
+
+
+# путь файла в хранилище по хэшу: cas/ab/cd/<sha256>; расширение в имя не входит,
+# чтобы одно содержимое под именами .jpg и .JPEG хранилось один раз
+def cas_name(sha256):
+    return '/'.join([CAS_DIR, sha256[:2], sha256[2:4], sha256])
+
+
+# тип содержимого по имени загруженного файла - хранится в метаданных сессии
+def guess_content_type(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+# текущие хэши незавершённых загрузок: id сессии -> (смещение, объект sha256)
+# если загрузку продолжили в другом процессе, хэш пересчитывается по файлу
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def create_part_file(session):
+    os.makedirs(upload_tmp_dir(), exist_ok=True)
+    open(part_path(session), 'wb').close()
+    with _hashers_lock:
+        _hashers[session.pk] = (0, hashlib.sha256())
+
+
+# запись части из потока прямо в файл по смещению; возвращает записанные байты и их sha256
+def write_chunk(session, offset, stream, length):
+    chunk_hash = hashlib.sha256()
+    with _hashers_lock:
+        running = _hashers.pop(session.pk, None)
+    if running is not None and running[0] != offset:
+        running = None
+
+    written = 0
+    with open(part_path(session), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            chunk_hash.update(block)
+            if running is not None:
+                running[1].update(block)
+            written += len(block)
+        f.truncate(offset + written)
+
+    if running is not None and written == length:
+        with _hashers_lock:
+            _hashers[session.pk] = (offset + written, running[1])
+    return written, chunk_hash.hexdigest()
+
+
+# итоговый sha256: из памяти, если загрузка шла в этом процессе, иначе чтением файла
+def file_sha256(session):
+    with _hashers_lock:
+        running = _hashers.pop(session.pk, None)
+    if running is not None and running[0] == session.offset:
+        return running[1].hexdigest()
+    digest = hashlib.sha256()
+    with open(part_path(session), 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# перенос файла в хранилище по хэшу; одинаковое содержимое хранится один раз
+def store_content_addressed(session, sha256):
+    name = cas_name(sha256)
+    target = os.path.join(settings.MEDIA_ROOT, *name.split('/'))
+    if os.path.exists(target):
+        os.remove(part_path(session))
+        return name, True
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(part_path(session), target)
+    return name, False
+
+
+# откат неудачной части: файл обрезается до прежнего смещения, хэш пересчитается позже
+def rollback_chunk(session, offset):
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+    with open(part_path(session), 'r+b') as f:
+        f.truncate(offset)
+
+
+def discard(session):
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
@@ -5,13 +5,20 @@ from .views import (
     ValidateQueryView,
     SanitizeView,
     FileUploadView,
-    ProductViewSet
+    ProductViewSet,
+    StockReservationViewSet,
+    PingView,
+    UploadSessionCreateView,
+    UploadSessionView,
+    UploadSessionCompleteView,
 )
+from . import async_views
 from rest_framework.routers import DefaultRouter
 
 # роутер для ViewSet (CRUD для Product)
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
+router.register(r'reservations', StockReservationViewSet, basename='reservation')
 
 urlpatterns = [
     path('items/', ItemListCreateAPIView.as_view(), name='item-list-create'),
@@ -23,6 +30,19 @@ urlpatterns = [
     path('clean/sanitize/',       SanitizeView.as_view(),      name='sanitize'),
     path('clean/upload-file/',    FileUploadView.as_view(),    name='upload-file'),
 
+    # загрузка больших файлов по частям
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('uploads/<uuid:pk>/', UploadSessionView.as_view(), name='upload-session'),
+    path('uploads/<uuid:pk>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),
+
+    # async-версии read-эндпоинтов
+    path('ping/', PingView.as_view(), name='ping'),
+    path('async/ping/', async_views.ping, name='async-ping'),
+    path('async/items/', async_views.item_list, name='async-item-list'),
+    path('async/items/<int:pk>/', async_views.item_detail, name='async-item-detail'),
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+
     #подключение маршрутов
     path('', include(router.urls))
 ]
@@ -1,19 +1,28 @@
 import os
+from datetime import timedelta
 
 # django
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.utils.html import strip_tags
 
 # rest
 from rest_framework import status, permissions, filters, viewsets
 from rest_framework.views import APIView
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.validators import UniqueValidator
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import AllowAny, IsAdminUser
-from rest_framework.authentication import SessionAuthentication, BasicAuthentication, TokenAuthentication
+from rest_framework.authentication import SessionAuthentication, BasicAuthentication
+from accounts.authentication import CachedTokenAuthentication
 
 # filters
 from django_filters.rest_framework import DjangoFilterBackend
@@ -23,17 +32,48 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 # models/serializers
-from .models import Item, Product
+from .models import CategoryStats, Item, Product, StockReservation, UploadSession
+from . import uploads
+from .metrics import render_metrics
 from .serializers import (
     ItemSerializer,
     ProductSerializer,
     QueryParamsSerializer,
     SanitizeSerializer,
     FileUploadSerializer,
+    ProductImportSerializer,
+    UploadSessionSerializer,
+    CategoryStatsSerializer,
+    ReservationRequestSerializer,
+    ReservationIdsSerializer,
+    StockReservationSerializer,
+    requested_fields,
 )
+from .cache import CatalogCacheMixin
+from .lean import LeanListMixin, RowEncoder, lean_lists_enabled
+from .pagination import PageOrKeysetPagination
+from .search import FullTextSearchFilter
+from .signals import bulk_product_changes, products_changed
+from .feed import created_event, deleted_event, updated_event
+from .aggregates import CategoryDeltas
+from .export import accepts_gzip, export_response
+from .importers import detect_format, import_products
+from . import reservations
+
+
+# быстрый вывод списков: те же поля, что у ItemSerializer и ProductSerializer
+item_rows = RowEncoder(ItemSerializer)
+product_rows = RowEncoder(ProductSerializer)
+
+
+# метрики процесса в текстовом формате Prometheus
+def metrics_view(request):
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 class PingView(APIView):
+    permission_classes = [AllowAny]
+
     def get(self, request):
         # просто отдаём фиксированный JSON
         return Response({"status": "ok", "message": "pong"})
@@ -45,7 +85,7 @@ class ItemListCreateAPIView(APIView):
     permission_classes = [AllowAny]
 
     filter_backends = [DjangoFilterBackend,
-                       filters.SearchFilter, filters.OrderingFilter]
+                       FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['created_at']  # фильтр по дате создания
     search_fields = ['title', 'description']  # поиск по названию и описанию
     ordering_fields = ['created_at', 'title']  # сортировка по дате и названию
@@ -71,18 +111,45 @@ class ItemListCreateAPIView(APIView):
                 description="Сортировка: передайте поле, например `created_at` или `-title`",
                 type=openapi.TYPE_STRING,
             ),
+            openapi.Parameter(
+                'cursor',
+                openapi.IN_QUERY,
+                description="Keyset-пагинация: пустое значение - первая страница, дальше значение из `next`",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                'fields',
+                openapi.IN_QUERY,
+                description="Только эти поля через запятую, например `id,title`",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                'exclude',
+                openapi.IN_QUERY,
+                description="Все поля, кроме перечисленных через запятую, например `description`",
+                type=openapi.TYPE_STRING,
+            ),
         ]
     )
     def get(self, request):
+        # ?fields= / ?exclude= - из бд читаются только колонки выбранных полей
+        fields = requested_fields(request.query_params, item_rows.names)
         qs = Item.objects.all().order_by('-created_at')
         for backend in self.filter_backends:
             qs = backend().filter_queryset(request, qs, view=self)
-        paginator = PageNumberPagination()
+        paginator = PageOrKeysetPagination()
+        # список только для чтения - строки через .values() без создания объектов
+        if lean_lists_enabled():
+            page = paginator.paginate_queryset(item_rows.values(qs, fields), request, view=self)
+            if page is not None:
+                return paginator.get_paginated_response(item_rows.encode(page, fields))
+            return Response(item_rows.encode(item_rows.values(qs, fields), fields), status=status.HTTP_200_OK)
+        qs = item_rows.only(qs, fields)
         page = paginator.paginate_queryset(qs, request, view=self)
         if page is not None:
-            serializer = ItemSerializer(page, many=True)
+            serializer = ItemSerializer(page, many=True, context={'request': request})
             return paginator.get_paginated_response(serializer.data)
-        serializer = ItemSerializer(qs, many=True)
+        serializer = ItemSerializer(qs, many=True, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -101,7 +168,7 @@ class ItemListCreateAPIView(APIView):
 # класс для работы с одним item
 class ItemRetrieveUpdateDeleteAPIView(APIView):
     # поддерживаем сессионную basic и token-аутентификацию
-    authentication_classes = [SessionAuthentication, BasicAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, BasicAuthentication, CachedTokenAuthentication]
     # по умолчанию доступно всем метод DELETE будет проверять IsAdminUser
     permission_classes = [AllowAny]
 
@@ -115,10 +182,17 @@ class ItemRetrieveUpdateDeleteAPIView(APIView):
 
     @swagger_auto_schema(
         operation_summary="Получение Item по id",
+        manual_parameters=[
+            openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Только эти поля через запятую"),
+            openapi.Parameter('exclude', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Все поля, кроме перечисленных через запятую"),
+        ]
     )
     def get(self, request, pk):
-        item = self.get_object(pk)
-        serializer = ItemSerializer(item)
+        fields = requested_fields(request.query_params, item_rows.names)
+        item = get_object_or_404(item_rows.only(Item.objects.all(), fields), pk=pk)
+        serializer = ItemSerializer(item, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -230,14 +304,462 @@ class FileUploadView(APIView):
         url = request.build_absolute_uri(settings.MEDIA_URL + 'uploads/' + f.name)
         return Response({"file_url": url}, status=status.HTTP_201_CREATED)
     
+# загрузка больших файлов по частям: начало загрузки;
+# нужна аутентификация (IsAuthenticated по умолчанию), незавершённых загрузок
+# на пользователя - не больше UPLOAD_MAX_OPEN_SESSIONS
+
+class UploadSessionCreateView(APIView):
+
+    @swagger_auto_schema(
+        operation_summary="Начало загрузки файла по частям",
+        request_body=UploadSessionSerializer,
+        responses={201: UploadSessionSerializer}
+    )
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            open_sessions = UploadSession.objects.filter(owner=request.user, completed_at__isnull=True).count()
+            if open_sessions >= settings.UPLOAD_MAX_OPEN_SESSIONS:
+                return Response({"detail": f"Не больше {settings.UPLOAD_MAX_OPEN_SESSIONS} незавершённых загрузок"},
+                                status=status.HTTP_429_TOO_MANY_REQUESTS)
+            session = serializer.save(owner=request.user)
+        uploads.create_part_file(session)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+# состояние загрузки, отправка части (PUT с заголовком Upload-Offset) и отмена;
+# пользователю доступны только его сессии
+
+class UploadSessionView(APIView):
+
+    def get_object(self, pk):
+        return get_object_or_404(UploadSession, pk=pk, owner=self.request.user)
+
+    @swagger_auto_schema(
+        operation_summary="Состояние загрузки (смещение для продолжения)",
+        responses={200: UploadSessionSerializer}
+    )
+    def get(self, request, pk):
+        return Response(UploadSessionSerializer(self.get_object(pk)).data)
+
+    @swagger_auto_schema(
+        operation_summary="Отправка части файла",
+        manual_parameters=[
+            openapi.Parameter('Upload-Offset', openapi.IN_HEADER, type=openapi.TYPE_INTEGER, required=True,
+                              description="Смещение части в файле, должно совпадать с текущим offset"),
+            openapi.Parameter('X-Chunk-SHA256', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+                              description="sha256 части (hex), необязательно"),
+        ]
+    )
+    def put(self, request, pk):
+        session = self.get_object(pk)
+        if session.completed_at:
+            return Response({"detail": "Загрузка уже завершена"}, status=status.HTTP_409_CONFLICT)
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({"detail": "Нужны заголовки Upload-Offset и Content-Length"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if length <= 0 or length > settings.UPLOAD_CHUNK_MAX_BYTES or offset + length > session.size:
+            return Response({"detail": f"Часть должна быть от 1 до {settings.UPLOAD_CHUNK_MAX_BYTES} байт "
+                                       f"и не выходить за размер файла"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # занимаем сессию на время записи условным update - параллельная запись получит 409;
+        # offset сдвигается только после записи, поэтому упавший процесс не оставит
+        # занятый диапазон без данных, а его захват истечёт через UPLOAD_CLAIM_TIMEOUT
+        claimed_at = timezone.now()
+        claimed = UploadSession.objects.filter(
+            Q(claimed_at__isnull=True) | Q(claimed_at__lt=claimed_at - timedelta(seconds=settings.UPLOAD_CLAIM_TIMEOUT)),
+            pk=session.pk, offset=offset, completed_at__isnull=True,
+        ).update(claimed_at=claimed_at)
+        if not claimed:
+            session.refresh_from_db()
+            return Response({"detail": "Неверное смещение", "offset": session.offset},
+                            status=status.HTTP_409_CONFLICT)
+        claim = UploadSession.objects.filter(pk=session.pk, claimed_at=claimed_at)
+
+        # файл части короче смещения (сбой до записи) - продолжать с его размера
+        stored = uploads.part_size(session)
+        if stored < offset:
+            claim.update(offset=stored, claimed_at=None)
+            return Response({"detail": "Неверное смещение", "offset": stored},
+                            status=status.HTTP_409_CONFLICT)
+
+        try:
+            written, chunk_sha256 = uploads.write_chunk(session, offset, request.stream, length)
+        except BaseException:
+            claim.update(claimed_at=None)
+            uploads.rollback_chunk(session, offset)
+            raise
+        expected = request.META.get('HTTP_X_CHUNK_SHA256', '').lower()
+        if written != length or (expected and expected != chunk_sha256):
+            uploads.rollback_chunk(session, offset)
+            claim.update(claimed_at=None)
+            detail = "Часть получена не полностью" if written != length else "Не совпадает sha256 части"
+            return Response({"detail": detail, "offset": offset}, status=status.HTTP_400_BAD_REQUEST)
+
+        # захват истёк и перешёл к другой записи - эта часть не засчитывается
+        if not claim.update(offset=offset + length, claimed_at=None):
+            session.refresh_from_db()
+            return Response({"detail": "Неверное смещение", "offset": session.offset},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({"offset": offset + length, "chunk_sha256": chunk_sha256})
+
+    @swagger_auto_schema(
+        operation_summary="Отмена загрузки",
+    )
+    def delete(self, request, pk):
+        session = self.get_object(pk)
+        if not session.completed_at:
+            uploads.discard(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# завершение загрузки: проверка sha256 и перенос в хранилище по хэшу содержимого
+
+class UploadSessionCompleteView(APIView):
+
+    @swagger_auto_schema(
+        operation_summary="Завершение загрузки файла по частям",
+        responses={201: openapi.Response(
+            description="URL файла и его sha256",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'file_url': openapi.Schema(type=openapi.TYPE_STRING),
+                    'sha256': openapi.Schema(type=openapi.TYPE_STRING),
+                    'content_type': openapi.Schema(type=openapi.TYPE_STRING),
+                    'deduplicated': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                }
+            )
+        )}
+    )
+    def post(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, owner=request.user, completed_at__isnull=True)
+        if session.offset != session.size:
+            return Response({"detail": "Файл загружен не полностью", "offset": session.offset},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        sha256 = uploads.file_sha256(session)
+        if session.checksum and session.checksum != sha256:
+            uploads.discard(session)
+            session.delete()
+            return Response({"detail": "sha256 файла не совпадает с ожидаемым"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        name, deduplicated = uploads.store_content_addressed(session, sha256)
+        session.sha256 = sha256
+        session.content_type = uploads.guess_content_type(session.filename)
+        session.completed_at = timezone.now()
+        session.save(update_fields=['sha256', 'content_type', 'completed_at'])
+
+        url = request.build_absolute_uri(settings.MEDIA_URL + name)
+        return Response({"file_url": url, "sha256": sha256, "content_type": session.content_type,
+                         "deduplicated": deduplicated},
+                        status=status.HTTP_201_CREATED)
+
 # CRUD по Product через ViewSet
+# список и детальный просмотр кэшируются до изменения каталога
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, LeanListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    lean_encoder = product_rows
     permission_classes = [AllowAny]
+    pagination_class = PageOrKeysetPagination
     filter_backends = [DjangoFilterBackend,
-                       filters.SearchFilter, filters.OrderingFilter]
+                       FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'price']
     search_fields = ['name', 'description', 'category']
     ordering_fields = ['price', 'quantity', 'name']
+
+    # максимальное количество строк в одном массовом запросе
+    bulk_max_rows = getattr(settings, 'PRODUCT_BULK_MAX_ROWS', 5000)
+
+    # проверка, что тело запроса - непустой список не длиннее лимита
+    def get_bulk_rows(self, request, key=None):
+        rows = request.data.get(key) if key and isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({"detail": "Ожидается непустой список"})
+        if len(rows) > self.bulk_max_rows:
+            raise ValidationError({"detail": f"Не больше {self.bulk_max_rows} строк за запрос"})
+        return rows
+
+    # валидация строк по одной через дочерний сериализатор, ошибки - с номером строки;
+    # уникальность sku проверяется одним запросом на все строки (ids - id товаров строк при обновлении:
+    # свой же артикул товару можно прислать повторно), повтор sku внутри запроса - ошибка строки
+    def validate_bulk_rows(self, rows, partial=False, ids=None):
+        child = ProductSerializer(many=True, partial=partial).child
+        sku_field = child.fields['sku']
+        sku_field.validators = [v for v in sku_field.validators if not isinstance(v, UniqueValidator)]
+        valid, errors = [], []
+        for index, row in enumerate(rows):
+            try:
+                valid.append((index, child.run_validation(row)))
+            except ValidationError as exc:
+                errors.append({"index": index, "errors": exc.detail})
+
+        skus = [data['sku'] for _, data in valid if data.get('sku')]
+        owners = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'pk')) if skus else {}
+        checked, seen = [], set()
+        for index, data in valid:
+            sku = data.get('sku')
+            if sku and sku in seen:
+                errors.append({"index": index, "errors": {"sku": ["Артикул повторяется в запросе"]}})
+            elif sku and sku in owners and (ids is None or owners[sku] != ids[index]):
+                errors.append({"index": index, "errors": {"sku": ["Товар с таким артикулом уже существует"]}})
+            else:
+                seen.add(sku)
+                checked.append((index, data))
+        errors.sort(key=lambda error: error["index"])
+        return checked, errors
+
+    @swagger_auto_schema(
+        operation_summary="Массовое создание Product",
+        request_body=ProductSerializer(many=True),
+    )
+    @action(detail=False, methods=['post'], url_path='bulk', url_name='bulk')
+    def bulk_create(self, request):
+        rows = self.get_bulk_rows(request)
+        valid, errors = self.validate_bulk_rows(rows)
+        if not valid:
+            return Response({"created": [], "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic(), bulk_product_changes():
+                products = Product.objects.bulk_create([Product(**data) for _, data in valid])
+                stats = CategoryDeltas()
+                for product in products:
+                    stats.add_product(product)
+                products_changed(len(products), [created_event(product) for product in products], stats)
+        except IntegrityError:
+            # артикул заняли параллельным запросом после проверки
+            return Response({"detail": "Артикул уже занят другим товаром", "errors": errors},
+                            status=status.HTTP_409_CONFLICT)
+
+        return Response(
+            {"created": [product.pk for product in products], "errors": errors},
+            status=status.HTTP_201_CREATED
+        )
+
+    @swagger_auto_schema(
+        operation_summary="Массовое частичное обновление Product (каждая строка с id)",
+        request_body=ProductSerializer(many=True),
+    )
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        rows = self.get_bulk_rows(request)
+        ids = [row.get('id') if isinstance(row, dict) else None for row in rows]
+        valid, errors = self.validate_bulk_rows(rows, partial=True, ids=ids)
+
+        try:
+            with transaction.atomic(), bulk_product_changes():
+                products = Product.objects.select_for_update().in_bulk(
+                    [pk for pk in ids if isinstance(pk, int)]
+                )
+                changed, fields, changed_ids = [], set(), set()
+                for index, data in valid:
+                    product = products.get(ids[index])
+                    if product is None:
+                        errors.append({"index": index, "errors": {"id": ["Товар не найден"]}})
+                        continue
+                    # повтор товара в одном запросе: приращения агрегатов посчитались бы дважды
+                    if product.pk in changed_ids:
+                        errors.append({"index": index, "errors": {"id": ["Товар повторяется в запросе"]}})
+                        continue
+                    changed_ids.add(product.pk)
+                    for field, value in data.items():
+                        setattr(product, field, value)
+                    fields.update(data)
+                    changed.append(product)
+                if changed and fields:
+                    stats = CategoryDeltas()
+                    for product in changed:
+                        stats.change(product.loaded_values(), product)
+                    events = [updated_event(product) for product in changed]
+                    Product.objects.bulk_update(changed, sorted(fields), batch_size=500)
+                    products_changed(events=events, stats=stats)
+        except IntegrityError:
+            # новый артикул заняли параллельным запросом после проверки
+            return Response({"detail": "Артикул уже занят другим товаром", "errors": errors},
+                            status=status.HTTP_409_CONFLICT)
+
+        errors.sort(key=lambda error: error["index"])
+        return Response(
+            {"updated": [product.pk for product in changed], "errors": errors},
+            status=status.HTTP_200_OK if changed else status.HTTP_400_BAD_REQUEST
+        )
+
+    @swagger_auto_schema(
+        operation_summary="Массовое удаление Product",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={'ids': openapi.Schema(
+                type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)
+            )}
+        ),
+    )
+    @bulk_create.mapping.delete
+    def bulk_delete(self, request):
+        ids = self.get_bulk_rows(request, key='ids')
+        if not all(isinstance(pk, int) for pk in ids):
+            raise ValidationError({"ids": ["Ожидается список целых чисел"]})
+
+        with transaction.atomic(), bulk_product_changes():
+            queryset = Product.objects.filter(pk__in=ids)
+            events, stats = [], CategoryDeltas()
+            for pk, category, quantity, price in queryset.values_list('pk', 'category', 'quantity', 'price'):
+                events.append(deleted_event(pk, category))
+                stats.add(category, quantity, price, sign=-1)
+            # в общем счётчике delete() - ещё и удалённые каскадом позиции резервов
+            _, deleted = queryset.delete()
+            deleted = deleted.get(Product._meta.label, 0)
+            if deleted:
+                products_changed(-deleted, events, stats)
+
+        return Response({"deleted": deleted}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_summary="Потоковая выгрузка каталога в NDJSON или CSV (с теми же фильтрами, что и список)",
+    )
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<export_format>ndjson|csv)', url_name='export')
+    def export(self, request, export_format):
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        use_gzip = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        return export_response(queryset, export_format, use_gzip=use_gzip,
+                               asynchronous=isinstance(request._request, ASGIRequest))
+
+    @swagger_auto_schema(
+        operation_summary="Количество товаров, остатки и стоимость запасов по категориям",
+        responses={200: openapi.Response(
+            description="Агрегаты по категориям и итог по каталогу",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'categories': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+                        type=openapi.TYPE_OBJECT
+                    )),
+                    'totals': openapi.Schema(type=openapi.TYPE_OBJECT),
+                }
+            )
+        )}
+    )
+    @action(detail=False, methods=['get'], url_path='stats', url_name='stats')
+    def stats(self, request):
+        # готовые агрегаты из CategoryStats - одна строка на категорию, без обхода товаров
+        rows = CategoryStats.objects.filter(product_count__gt=0).order_by('category')
+        totals = CategoryStats(category='')
+        for row in rows:
+            totals.product_count += row.product_count
+            totals.total_quantity += row.total_quantity
+            totals.inventory_value_cents += row.inventory_value_cents
+        totals = CategoryStatsSerializer(totals).data
+        del totals['category']
+        return Response({"categories": CategoryStatsSerializer(rows, many=True).data, "totals": totals})
+
+    @swagger_auto_schema(
+        operation_summary="Импорт каталога из CSV/NDJSON (upsert по sku)",
+        request_body=ProductImportSerializer,
+    )
+    @action(detail=False, methods=['post'], url_path='import', url_name='import',
+            parser_classes=[MultiPartParser, FormParser])
+    def import_catalog(self, request):
+        serializer = ProductImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        f = serializer.validated_data['file']
+
+        import_format = detect_format(f.name)
+        if import_format is None:
+            raise ValidationError({"file": ["Поддерживаются файлы .csv, .ndjson и .jsonl"]})
+
+        report = import_products(f, import_format)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+# резервирование остатков товаров: списание при резерве условным UPDATE
+# (остаток не уходит в минус при любой конкуренции), подтверждение или отмена резерва;
+# нужна аутентификация (IsAuthenticated по умолчанию), пользователю доступны только его резервы
+
+class StockReservationViewSet(viewsets.GenericViewSet):
+    queryset = StockReservation.objects.prefetch_related('items')
+    serializer_class = StockReservationSerializer
+
+    def get_queryset(self):
+        # генерация схемы swagger идёт без пользователя
+        if getattr(self, 'swagger_fake_view', False):
+            return super().get_queryset().none()
+        return super().get_queryset().filter(owner=self.request.user)
+
+    # максимальное количество резервов в одном запросе
+    bulk_max_rows = getattr(settings, 'RESERVATION_BULK_MAX_ROWS', 1000)
+
+    @swagger_auto_schema(
+        operation_summary="Резервирование товаров (один резерв или список; каждый - все позиции или ничего)",
+        request_body=ReservationRequestSerializer(many=True),
+    )
+    def create(self, request):
+        rows = request.data if isinstance(request.data, list) else [request.data]
+        if not rows:
+            raise ValidationError({"detail": "Ожидается непустой список"})
+        if len(rows) > self.bulk_max_rows:
+            raise ValidationError({"detail": f"Не больше {self.bulk_max_rows} резервов за запрос"})
+
+        child = ReservationRequestSerializer()
+        valid, errors = [], []
+        for index, row in enumerate(rows):
+            try:
+                valid.append((index, child.run_validation(row)['items']))
+            except ValidationError as exc:
+                errors.append({"index": index, "errors": exc.detail})
+        if not valid:
+            return Response({"reserved": [], "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        reserved, shortages = reservations.reserve(valid, owner=request.user)
+        errors += [{"index": index, "errors": {"items": items}} for index, items in shortages]
+        errors.sort(key=lambda error: error["index"])
+        created = self.get_queryset().filter(pk__in=[reservation.pk for _, reservation in reserved]).in_bulk()
+        data = [
+            {"index": index, **self.get_serializer(created[reservation.pk]).data}
+            for index, reservation in reserved
+        ]
+        if data:
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_409_CONFLICT if shortages else status.HTTP_400_BAD_REQUEST
+        return Response({"reserved": data, "errors": errors}, status=response_status)
+
+    @swagger_auto_schema(operation_summary="Резерв с позициями")
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    # подтверждение или отмена списка резервов
+    def finish(self, request, operation):
+        serializer = ReservationIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        if len(ids) > self.bulk_max_rows:
+            raise ValidationError({"detail": f"Не больше {self.bulk_max_rows} резервов за запрос"})
+        done, errors = operation(ids, owner=request.user)
+        return Response(
+            {"done": done, "errors": [{"id": pk, "detail": detail} for pk, detail in errors]},
+            status=status.HTTP_200_OK if done else status.HTTP_409_CONFLICT
+        )
+
+    @swagger_auto_schema(
+        operation_summary="Подтверждение резервов (остаток остаётся списанным)",
+        request_body=ReservationIdsSerializer,
+    )
+    @action(detail=False, methods=['post'], url_path='commit', url_name='commit')
+    def commit(self, request):
+        return self.finish(request, reservations.commit)
+
+    @swagger_auto_schema(
+        operation_summary="Отмена резервов (остаток возвращается)",
+        request_body=ReservationIdsSerializer,
+    )
+    @action(detail=False, methods=['post'], url_path='release', url_name='release')
+    def release(self, request):
+        return self.finish(request, reservations.release)
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+# кадры проверки связи: сервер шлёт ping, любой кадр клиента (обычно pong) продлевает соединение
+PING_FRAME = json.dumps({"type": "ping"})
+PONG_FRAMES = {'{"type":"pong"}', '{"type": "pong"}', 'pong'}
+
+# коды закрытия: сервер перегружен (повторить позже) и истёк таймаут простоя
+CLOSE_TRY_AGAIN_LATER = 1013
+CLOSE_IDLE_TIMEOUT = 4408
+
+
+# счётчики WebSocket-соединений процесса по классам consumer'ов
+class WebsocketStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.active = {}
+        self.accepted = {}
+        self.rejected = {}
+        self.idle_timeouts = {}
+        self.dropped_frames = {}
+
+    # допуск нового соединения: не больше WS_MAX_CONNECTIONS на процесс
+    def admit(self, name):
+        limit = getattr(settings, 'WS_MAX_CONNECTIONS', 1000)
+        with self._lock:
+            if sum(self.active.values()) >= limit:
+                self.rejected[name] = self.rejected.get(name, 0) + 1
+                return False
+            self.active[name] = self.active.get(name, 0) + 1
+            self.accepted[name] = self.accepted.get(name, 0) + 1
+            return True
+
+    def release(self, name):
+        with self._lock:
+            self.active[name] = max(self.active.get(name, 0) - 1, 0)
+
+    def add(self, counter, name, value=1):
+        with self._lock:
+            values = getattr(self, counter)
+            values[name] = values.get(name, 0) + value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric, kind, help_text, values in (
+                ('websocket_connections_active', 'gauge', 'Open WebSocket connections.', self.active),
+                ('websocket_connections_accepted_total', 'counter', 'Accepted WebSocket connections.',
+                 self.accepted),
+                ('websocket_connections_rejected_total', 'counter',
+                 'WebSocket connections rejected by the per-process limit.', self.rejected),
+                ('websocket_idle_timeouts_total', 'counter', 'WebSocket connections closed as idle.',
+                 self.idle_timeouts),
+                ('websocket_frames_dropped_total', 'counter',
+                 'Frames dropped because a client send queue was full.', self.dropped_frames),
+            ):
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+                for name, value in sorted(values.items()):
+                    lines.append(f'{metric}{{consumer="{name}"}} {value}')
+        return lines
+
+
+# общий реестр на процесс
+websocket_stats = WebsocketStats()
+
+
+# базовый consumer с контролем нагрузки:
+# - лимит соединений на процесс, лишние отклоняются до accept;
+# - отправка через ограниченную очередь: медленный клиент теряет старые кадры,
+#   а не копит их в памяти; кадры с одинаковым ключом заменяют друг друга;
+# - heartbeat и закрытие соединения, от которого долго ничего не приходило
+class ManagedWebsocketConsumer(AsyncWebsocketConsumer):
+
+    async def websocket_connect(self, message):
+        self.stats_name = type(self).__name__
+        self.admitted = websocket_stats.admit(self.stats_name)
+        if not self.admitted:
+            await self.close(code=CLOSE_TRY_AGAIN_LATER)
+            return
+        self.send_queue = deque()
+        self.send_queue_size = getattr(settings, 'WS_SEND_QUEUE_SIZE', 100)
+        self.wakeup = asyncio.Event()
+        self.last_seen = time.monotonic()
+        self.tasks = [asyncio.ensure_future(self.write_loop()), asyncio.ensure_future(self.heartbeat_loop())]
+        await super().websocket_connect(message)
+
+    async def websocket_receive(self, message):
+        self.last_seen = time.monotonic()
+        if message.get('text') in PONG_FRAMES:
+            return
+        await super().websocket_receive(message)
+
+    async def websocket_disconnect(self, message):
+        if getattr(self, 'admitted', False):
+            self.admitted = False
+            websocket_stats.release(self.stats_name)
+            for task in self.tasks:
+                task.cancel()
+        await super().websocket_disconnect(message)
+
+    # кадр в очередь отправки
+    def queue_frame(self, text_data, key=None):
+        if key is not None:
+            for index, (queued_key, _) in enumerate(self.send_queue):
+                if queued_key == key:
+                    self.send_queue[index] = (key, text_data)
+                    return
+        if len(self.send_queue) >= self.send_queue_size:
+            self.send_queue.popleft()
+            self.frame_dropped()
+        self.send_queue.append((key, text_data))
+        self.wakeup.set()
+
+    def frame_dropped(self, count=1):
+        websocket_stats.add('dropped_frames', self.stats_name, count)
+
+    # отправка накопленного; наследники могут добавить свои кадры
+    async def drain(self):
+        while self.send_queue:
+            _, text_data = self.send_queue.popleft()
+            await self.send(text_data=text_data)
+
+    async def write_loop(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            await self.drain()
+
+    async def heartbeat_loop(self):
+        interval = getattr(settings, 'WS_HEARTBEAT_INTERVAL', 30)
+        idle_timeout = getattr(settings, 'WS_IDLE_TIMEOUT', 75)
+        if not interval:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            if idle_timeout and time.monotonic() - self.last_seen > idle_timeout:
+                websocket_stats.add('idle_timeouts', self.stats_name)
+                await self.close(code=CLOSE_IDLE_TIMEOUT)
+                return
+            self.queue_frame(PING_FRAME, key='ping')
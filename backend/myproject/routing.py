@@ -1,8 +1,9 @@
 from django.urls import re_path
-from core.consumers import ProductCountConsumer
+from core.consumers import ProductCountConsumer, ProductFeedConsumer
 
 
 # список маршрутов WebSocket
 websocket_urlpatterns = [
     re_path(r'ws/products/count/$', ProductCountConsumer.as_asgi()),
+    re_path(r'ws/products/feed/$', ProductFeedConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -1,6 +1,7 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
+import sys
 
 # корневая директория проекта
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,6 +23,74 @@ DATABASES = {
     }
 }
 
+# прагмы sqlite для профиля tuned - выполняются на каждом новом соединении
+# (cache_size отрицательный - размер в КиБ)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'cache_size': -config('SQLITE_CACHE_SIZE_KB', default=64 * 1024, cast=int),
+    'temp_store': 'MEMORY',
+}
+
+# профили подключения к бд (DB_PROFILE):
+# default - как есть: журнал DELETE, новое соединение на каждый запрос;
+# tuned - WAL, прагмы, ожидание блокировки вместо "database is locked",
+# BEGIN IMMEDIATE для транзакций и переиспользование соединений (DB_CONN_MAX_AGE).
+# tuned включается явно: режим WAL записывается в заголовок файла бд (закоммиченная
+# db.sqlite3 меняется при первом же подключении), а постоянные соединения под ASGI
+# Django советует отключать - для ASGI-сервера DB_CONN_MAX_AGE=0
+DB_PROFILES = {
+    'default': {},
+    'tuned': {
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=float),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(f'PRAGMA {name} = {value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+    },
+}
+DB_PROFILE = config('DB_PROFILE', default='default')
+DATABASES['default'].update(DB_PROFILES[DB_PROFILE])
+
+# реплики для чтения каталога: файлы-копии основной бд через запятую
+# (обновляются командой sync_read_replicas); в тестах указывают на основную бд
+DATABASE_REPLICAS = []
+for index, replica_name in enumerate(config('DB_READ_REPLICAS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'NAME': os.path.join(BASE_DIR, replica_name),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['core.routers.ReadReplicaRouter']
+
+# модели, которые можно читать с реплик; допустимое отставание реплики (сек)
+# и сколько секунд после записи клиент читает с основной бд
+REPLICA_MODELS = ['core.product', 'core.item', 'core.categorystats']
+REPLICA_MAX_LAG = config('REPLICA_MAX_LAG', default=5.0, cast=float)
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+
+# кэши: default - память процесса (готовые ответы каталога и т.п.),
+# shared - общий для всех процессов (версия каталога, роли пользователей): по умолчанию
+# файловый, для процессов одной машины; на нескольких машинах - Redis или Memcached
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': config('SHARED_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('SHARED_CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache')),
+    },
+}
+# в тестах общий кэш - в памяти процесса, чтобы не трогать кэш запущенного сервера
+# (тесты обмена между процессами подменяют его файловым во временном каталоге)
+if sys.argv[1:2] == ['test']:
+    CACHES['shared'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'}
+
 ALLOWED_HOSTS = []
 
 # описание подключаемых приложений
@@ -45,6 +114,7 @@ INSTALLED_APPS = [
 # Middleware - промежуточные обработчики запросов
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -53,6 +123,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.middleware.LoggingMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
 ]
 
 # основной файл с роутингом
@@ -100,18 +171,28 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         # для точечной фильтрации по полям
         'django_filters.rest_framework.DjangoFilterBackend',
-        # для поиска по вхождению
-        'rest_framework.filters.SearchFilter',
+        # для полнотекстового поиска (FTS5 на SQLite, иначе поиск по вхождению)
+        'core.search.FullTextSearchFilter',
         # для сортировки
         'rest_framework.filters.OrderingFilter',
     ],
+    # JSON через orjson (без него - стандартный json), вывод тот же, что у JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     # подключаем пагинацию страниц
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 1000,
 
-    # аутентификация: только по токену
+    # аутентификация: только по токену (с кэшем токен -> пользователь)
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
         # 'rest_framework.authentication.BasicAuthentication',
     ],
@@ -176,9 +257,103 @@ CORS_ALLOW_ALL_ORIGINS = True
 # для channels
 ASGI_APPLICATION = 'myproject.asgi.application'
 
-# канальный слой для WebSocket
+# канальный слой для WebSocket: общий файл sqlite, чтобы рассылки доходили
+# до клиентов всех процессов на хосте (без Redis)
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'BACKEND': 'core.channel_layers.SQLiteChannelLayer',
+        'CONFIG': {
+            'path': config('CHANNEL_LAYER_PATH', default=os.path.join(BASE_DIR, 'channels.sqlite3')),
+            'poll_interval': config('CHANNEL_LAYER_POLL_INTERVAL', default=0.005, cast=float),
+            'max_poll_interval': config('CHANNEL_LAYER_MAX_POLL_INTERVAL', default=0.05, cast=float),
+        },
     },
 }
+
+# один процесс - можно обойтись слоем в памяти
+if config('CHANNEL_LAYER_IN_MEMORY', default=False, cast=bool):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# окно склейки рассылки количества товаров (сек)
+PRODUCT_COUNT_BROADCAST_WINDOW = config('PRODUCT_COUNT_BROADCAST_WINDOW', default=1.0, cast=float)
+
+# лента изменений товаров по WebSocket: такт склейки событий (сек)
+# и сколько событий держать в очереди медленного клиента
+PRODUCT_FEED_TICK = config('PRODUCT_FEED_TICK', default=0.25, cast=float)
+PRODUCT_FEED_CLIENT_BUFFER = config('PRODUCT_FEED_CLIENT_BUFFER', default=500, cast=int)
+
+# WebSocket: максимум соединений на процесс, размер очереди отправки на соединение,
+# интервал heartbeat и таймаут простоя (сек, 0 - выключено), время жизни
+# общего снимка количества товаров для новых подключений (сек)
+WS_MAX_CONNECTIONS = config('WS_MAX_CONNECTIONS', default=1000, cast=int)
+WS_SEND_QUEUE_SIZE = config('WS_SEND_QUEUE_SIZE', default=100, cast=int)
+WS_HEARTBEAT_INTERVAL = config('WS_HEARTBEAT_INTERVAL', default=30, cast=float)
+WS_IDLE_TIMEOUT = config('WS_IDLE_TIMEOUT', default=75, cast=float)
+WS_COUNT_SNAPSHOT_TTL = config('WS_COUNT_SNAPSHOT_TTL', default=5.0, cast=float)
+
+# списки товаров и item через .values() и RowEncoder вместо ModelSerializer на каждую строку
+LEAN_LIST_RESPONSES = config('LEAN_LIST_RESPONSES', default=True, cast=bool)
+
+# время жизни закэшированных ответов каталога (сек)
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# максимум строк в одном массовом запросе к /api/products/bulk/
+PRODUCT_BULK_MAX_ROWS = config('PRODUCT_BULK_MAX_ROWS', default=5000, cast=int)
+
+# резервы товаров: время жизни неподтверждённого резерва (сек) и максимум резервов в одном запросе
+RESERVATION_TTL = config('RESERVATION_TTL', default=900, cast=int)
+RESERVATION_BULK_MAX_ROWS = config('RESERVATION_BULK_MAX_ROWS', default=1000, cast=int)
+
+# сколько строк читать из бд за раз при потоковой выгрузке каталога
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# импорт каталога: размер партии и сколько ошибок по строкам возвращать
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=1000, cast=int)
+IMPORT_MAX_ERRORS = config('IMPORT_MAX_ERRORS', default=1000, cast=int)
+
+# загрузка файлов по частям: максимум на одну часть и на весь файл (байт),
+# незавершённых загрузок на пользователя и через сколько секунд захват сессии
+# упавшей записью считается брошенным
+UPLOAD_CHUNK_MAX_BYTES = config('UPLOAD_CHUNK_MAX_BYTES', default=16 * 1024 * 1024, cast=int)
+UPLOAD_MAX_BYTES = config('UPLOAD_MAX_BYTES', default=10 * 1024 * 1024 * 1024, cast=int)
+UPLOAD_MAX_OPEN_SESSIONS = config('UPLOAD_MAX_OPEN_SESSIONS', default=5, cast=int)
+UPLOAD_CLAIM_TIMEOUT = config('UPLOAD_CLAIM_TIMEOUT', default=10 * 60, cast=int)
+
+# отдача медиафайлов: '' - сам Django (FileResponse, Range),
+# 'x-accel-redirect' (nginx) или 'x-sendfile' (apache/lighttpd) - отправку делает веб-сервер
+MEDIA_OFFLOAD = config('MEDIA_OFFLOAD', default='')
+# внутренний location nginx для X-Accel-Redirect
+MEDIA_OFFLOAD_PREFIX = config('MEDIA_OFFLOAD_PREFIX', default='/protected-media/')
+# время кэширования обычных медиафайлов (файлы из cas/ кэшируются навсегда)
+MEDIA_CACHE_MAX_AGE = config('MEDIA_CACHE_MAX_AGE', default=3600, cast=int)
+
+# доля запросов, которые попадают в лог (метрики собираются по всем)
+REQUEST_LOG_SAMPLE_RATE = config('REQUEST_LOG_SAMPLE_RATE', default=1.0, cast=float)
+
+# бюджет запросов к бд на один HTTP-запрос: по умолчанию и по имени маршрута
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=50, cast=int)
+QUERY_BUDGETS = {
+    'item-list-create': 5,
+    'item-detail': 5,
+    'product-list': 5,
+    'product-detail': 5,
+    'user-list': 5,
+    'editor-only': 5,
+}
+# сколько одинаковых запросов за один HTTP-запрос считается N+1
+N_PLUS_ONE_THRESHOLD = config('N_PLUS_ONE_THRESHOLD', default=10, cast=int)
+# доля HTTP-запросов, для которых запросы к бд пишутся со стеками и нарушения попадают в лог
+QUERY_REPORT_SAMPLE_RATE = config('QUERY_REPORT_SAMPLE_RATE', default=0.0, cast=float)
+
+# время жизни кэша ролей пользователя (сек)
+ROLE_CACHE_TIMEOUT = config('ROLE_CACHE_TIMEOUT', default=300, cast=int)
+
+# кэш токенов аутентификации: время жизни (сек), алиас общего кэша из CACHES
+# и размер LRU в процессе, если алиас пустой (тогда сброс в других процессах - только через TTL)
+TOKEN_CACHE_TTL = config('TOKEN_CACHE_TTL', default=60, cast=int)
+TOKEN_CACHE_SIZE = config('TOKEN_CACHE_SIZE', default=10000, cast=int)
+TOKEN_CACHE_BACKEND = config('TOKEN_CACHE_BACKEND', default='shared') or None
@@ -1,11 +1,12 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from django.conf import settings
-from django.conf.urls.static import static
+from core.media import serve_media
+from core.views import metrics_view
 
 
 # настраиваем схему OpenAPI для документации
@@ -29,10 +30,15 @@ urlpatterns = [
     path('api/accounts/', include('accounts.urls')),
     path('api-token-auth/', ObtainAuthToken.as_view(), name='api_token_auth'),
 
+    # метрики в формате Prometheus
+    path('metrics', metrics_view, name='metrics'),
+
     # роуты для сваггера
     path('swagger(<format>\.json|\.yaml)', schema_view.without_ui(
         cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger',
          cache_timeout=0), name='schema-swagger-ui'),
-    # для отдачи медиафайлов
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+    # для отдачи медиафайлов (Range, ETag, X-Accel-Redirect/X-Sendfile)
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+]